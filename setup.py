@@ -15,6 +15,7 @@ setup(
         'console_scripts': [
             'bunnychat=src.main:main',
             'bunnychat-web=src.web.app:main',
+            'bunnychat-batch=src.chat.batch:main',
         ],
     },
 ) 
\ No newline at end of file
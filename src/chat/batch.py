@@ -0,0 +1,248 @@
+"""
+Offline batch inference over JSONL.
+
+Reads one conversation per input line, runs them through DeepSeekClient
+with bounded concurrency under the process-wide rate limiter, and appends
+one result per line to the output file as each finishes, with its usage
+and latency. The output doubles as the checkpoint: a rerun with the same
+output skips rows that already succeeded, so an interrupted job resumes
+where it stopped.
+
+Input rows look like:
+
+    {"id": "q1", "messages": [{"role": "user", "content": "..."}]}
+    {"id": "q2", "prompt": "...", "temperature": 0.2, "max_tokens": 512}
+
+`id` defaults to the line number. Rows may override temperature and
+max_tokens; everything else comes from the command line.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Set, TextIO
+
+from src.config.settings import chat_settings, api_settings, rate_limit_settings
+from src.chat.client import DeepSeekClient
+from src.chat.errors import DeepSeekError
+from src.utils.helpers import format_message
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Fairness key of batch requests in the rate limiter, so a job shares the budget
+RATE_KEY = "batch"
+
+
+@dataclass
+class BatchRow:
+    """One conversation to run."""
+    id: str
+    messages: List[Dict[str, str]]
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+def read_rows(path: str, system_message: Optional[str] = None) -> Iterator[BatchRow]:
+    """Parse the input JSONL lazily; malformed lines are logged and skipped."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+                if 'messages' in data:
+                    messages = [format_message(msg['role'], msg['content']) for msg in data['messages']]
+                else:
+                    messages = [format_message("user", data['prompt'])]
+                if not messages:
+                    raise ValueError("no messages")
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                logger.error(f"Skipping line {number} of {path}: {str(e)}")
+                continue
+            if system_message and messages[0]['role'] != 'system':
+                messages.insert(0, format_message("system", system_message))
+            params = {name: data[name] for name in ('temperature', 'max_tokens') if name in data}
+            yield BatchRow(str(data.get('id', number)), messages, params)
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Ids of rows already answered in an earlier run's output.
+
+    A line cut short by an interruption is truncated away so appending
+    starts on a clean line; failed rows are not counted and run again.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            logger.warning(f"Discarding a partial result line at the end of {path}")
+            f.truncate(end)
+    for line in data[:end].decode('utf-8').splitlines():
+        try:
+            result = json.loads(line)
+        except ValueError:
+            continue
+        if result.get('error') is None:
+            done.add(str(result['id']))
+    return done
+
+
+class BatchRunner:
+    """Run rows concurrently and stream their results to a JSONL file."""
+
+    def __init__(self, client: DeepSeekClient, concurrency: int = 8, temperature: float = 0.7, max_tokens: Optional[int] = None):
+        """Initialize the runner.
+
+        Args:
+            client: Client every row is sent with.
+            concurrency: Rows in flight at once.
+            temperature: Default sampling temperature.
+            max_tokens: Default completion limit.
+        """
+        self.client = client
+        self.concurrency = concurrency
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def run_row(self, row: BatchRow) -> Dict[str, Any]:
+        """Run one conversation; errors are reported in the result, not raised."""
+        params = {'temperature': self.temperature, 'max_tokens': self.max_tokens, **row.params}
+        thinking, response = [], []
+        stream = None
+        try:
+            stream = await self.client.achat(row.messages, stream=True, **params)
+            async for chunk in stream:
+                (thinking if chunk['type'] == 'thinking' else response).append(chunk['content'])
+            error = None
+        except DeepSeekError as e:
+            error = f"{type(e).__name__}: {str(e)}"
+        # A request refused before streaming (e.g. throttled) has no metrics of its own
+        metrics = stream.metrics if stream is not None else None
+        return {
+            'id': row.id,
+            'response': ''.join(response) if error is None else None,
+            'thinking': ''.join(thinking) or None,
+            'error': error,
+            'metrics': metrics.to_dict() if metrics is not None else None
+        }
+
+    def _write(self, out: TextIO, result: Dict[str, Any]):
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        out.flush()  # Every finished row is checkpointed
+        metrics = result['metrics'] or {}
+        self.prompt_tokens += metrics.get('prompt_tokens') or 0
+        self.completion_tokens += metrics.get('completion_tokens') or 0
+        if result['error'] is None:
+            self.completed += 1
+        else:
+            self.failed += 1
+            logger.warning(f"Row {result['id']} failed: {result['error']}")
+
+    async def run(self, rows: Iterator[BatchRow], out: TextIO, done: Set[str], progress_every: int = 100):
+        """Run every row not in `done`, appending results to `out` as they finish."""
+        started = time.monotonic()
+        pending = iter(rows)
+
+        def next_row() -> Optional[BatchRow]:
+            for row in pending:
+                if row.id in done:
+                    self.skipped += 1
+                    continue
+                return row
+            return None
+
+        async def worker():
+            while True:
+                row = next_row()
+                if row is None:
+                    return
+                self._write(out, await self.run_row(row))
+                finished = self.completed + self.failed
+                if progress_every and finished % progress_every == 0:
+                    elapsed = time.monotonic() - started
+                    logger.info(
+                        f"{finished} rows in {elapsed:.0f}s ({finished / elapsed:.1f}/s), "
+                        f"{self.failed} failed, {self.prompt_tokens + self.completion_tokens} tokens"
+                    )
+
+        # Workers pull rows lazily, so memory stays flat however long the input
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            'completed': self.completed,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens
+        }
+
+
+def main():
+    """Run a batch job from the command line."""
+    parser = argparse.ArgumentParser(description='Run JSONL conversations through DeepSeek')
+    parser.add_argument('input', help='JSONL file with one conversation per line')
+    parser.add_argument('output', help='JSONL file results are appended to; rerunning resumes from it')
+    parser.add_argument('--model', type=str, default=chat_settings.model,
+                      help=f'Model to use (default: {chat_settings.model})')
+    parser.add_argument('--system', type=str, default=None,
+                      help='System message added to conversations that have none')
+    parser.add_argument('--temperature', type=float, default=chat_settings.temperature,
+                      help=f'Sampling temperature (default: {chat_settings.temperature})')
+    parser.add_argument('--max-tokens', type=int, default=chat_settings.max_tokens,
+                      help='Completion token limit per row')
+    parser.add_argument('--concurrency', type=int, default=8,
+                      help='Rows in flight at once (default: 8)')
+    parser.add_argument('--rpm', type=int, default=rate_limit_settings.requests_per_minute,
+                      help=f'Upstream requests per minute (default: {rate_limit_settings.requests_per_minute})')
+    parser.add_argument('--tpm', type=int, default=rate_limit_settings.tokens_per_minute,
+                      help=f'Upstream tokens per minute (default: {rate_limit_settings.tokens_per_minute})')
+    parser.add_argument('--restart', action='store_true',
+                      help='Ignore the existing output and run every row again')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s', stream=sys.stderr)
+
+    # A batch always runs under the rate limiter, unlike interactive chats
+    rate_limit_settings.enabled = True
+    rate_limit_settings.requests_per_minute = args.rpm
+    rate_limit_settings.tokens_per_minute = args.tpm
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_checkpoint(args.output)
+    if done:
+        logger.info(f"Resuming: {len(done)} rows already answered in {args.output}")
+
+    client = DeepSeekClient(api_key=api_settings.api_key, model=args.model, rate_key=RATE_KEY)
+    runner = BatchRunner(client, args.concurrency, args.temperature, args.max_tokens)
+    rows = read_rows(args.input, args.system)
+    with open(args.output, 'a', encoding='utf-8') as out:
+        try:
+            asyncio.run(runner.run(rows, out, done))
+        except KeyboardInterrupt:
+            logger.warning("Interrupted; rerun the same command to resume")
+        finally:
+            out.flush()
+            os.fsync(out.fileno())
+    summary = runner.summary()
+    print(json.dumps(summary))
+    sys.exit(1 if summary['failed'] else 0)
+
+
+if __name__ == "__main__":
+    main()
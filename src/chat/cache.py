@@ -0,0 +1,237 @@
+"""
+Exact-match cache for DeepSeek chat responses.
+
+Batch and regression jobs often send the same messages with the same
+sampling parameters many times over. Responses are cached under a
+canonical hash of (model, messages, sampling params) in an in-memory LRU
+tier with a TTL, backed by an on-disk tier that survives restarts. A
+streamed response is recorded chunk by chunk with its timing, so a hit can
+be replayed as the same sequence of 'thinking' and 'response' chunks,
+optionally at the pace it was originally generated.
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from src.utils.store import TieredStore
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedResponse:
+    """A recorded response: its chunks and when each arrived."""
+    chunks: List[Dict[str, str]]
+    # Seconds from the request to each chunk, used to pace replays
+    offsets: List[float] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def text(self) -> str:
+        """The response text, as returned by a non-streamed request."""
+        return ''.join(chunk['content'] for chunk in self.chunks if chunk['type'] == 'response')
+
+
+def cache_key(model: str, messages: List[Dict[str, Any]], **params) -> str:
+    """Canonical hash of a chat request.
+
+    Keys are sorted and None-valued parameters dropped, so equivalent
+    requests hash the same however their arguments were spelled.
+    """
+    params = {name: value for name, value in params.items() if value is not None}
+    payload = json.dumps(
+        {'model': model, 'messages': messages, 'params': params},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(',', ':'),
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def record_stream(
+    stream: Iterator[Dict[str, str]],
+    store: Callable[[CachedResponse], None]
+) -> Iterator[Dict[str, str]]:
+    """Pass a live stream through and hand the recording to `store` once it completes.
+
+    A stream that fails or is closed early is not recorded.
+    """
+    start = time.monotonic()
+    chunks = []
+    offsets = []
+    try:
+        for chunk in stream:
+            chunks.append({'type': chunk['type'], 'content': chunk['content']})
+            offsets.append(round(time.monotonic() - start, 4))
+            yield chunk
+    finally:
+        # Propagate an early close so the upstream request is closed too
+        stream.close()
+    store(CachedResponse(chunks, offsets))
+
+
+async def arecord_stream(
+    stream: AsyncIterator[Dict[str, str]],
+    store: Callable[[CachedResponse], None]
+) -> AsyncIterator[Dict[str, str]]:
+    """Asyncio counterpart of record_stream()."""
+    start = time.monotonic()
+    chunks = []
+    offsets = []
+    try:
+        async for chunk in stream:
+            chunks.append({'type': chunk['type'], 'content': chunk['content']})
+            offsets.append(round(time.monotonic() - start, 4))
+            yield chunk
+    finally:
+        await stream.aclose()
+    store(CachedResponse(chunks, offsets))
+
+
+def _delays(entry: CachedResponse, pace: float) -> Iterator[float]:
+    previous = 0.0
+    for i in range(len(entry.chunks)):
+        offset = entry.offsets[i] if i < len(entry.offsets) else previous
+        yield max(0.0, offset - previous) * pace
+        previous = offset
+
+
+def replay_stream(entry: CachedResponse, pace: float = 0.0) -> Iterator[Dict[str, str]]:
+    """Replay a recorded response, sleeping `pace` times the recorded gaps."""
+    for chunk, delay in zip(entry.chunks, _delays(entry, pace)):
+        if delay:
+            time.sleep(delay)
+        yield dict(chunk)
+
+
+async def areplay_stream(entry: CachedResponse, pace: float = 0.0) -> AsyncIterator[Dict[str, str]]:
+    """Asyncio counterpart of replay_stream()."""
+    for chunk, delay in zip(entry.chunks, _delays(entry, pace)):
+        if delay:
+            await asyncio.sleep(delay)
+        yield dict(chunk)
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + disk) cache of chat responses."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_entries: int = 512,
+        ttl: float = 3600.0,
+        disk_ttl: float = 7 * 24 * 3600.0,
+        replay_pace: float = 0.0
+    ):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory for the on-disk tier, or None for memory only.
+            max_entries: Responses kept in memory.
+            ttl: Seconds a response stays valid in memory.
+            disk_ttl: Seconds a response stays valid on disk.
+            replay_pace: Multiplier on the recorded chunk timing when replaying
+                a stream; 0 replays instantly, 1.0 at the original speed.
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_ttl = disk_ttl
+        self.replay_pace = replay_pace
+        self._store = TieredStore(cache_dir, max_entries)
+        self._lock = threading.Lock()
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._stores = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Look a response up in memory, then on disk."""
+        now = time.time()
+        remembered = self._store.recall(key, self.ttl, now)
+        if remembered is not None:
+            with self._lock:
+                self._memory_hits += 1
+            return remembered[1]
+
+        record = self._store.read(key, self.disk_ttl, now)
+        with self._lock:
+            if record is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+        entry = CachedResponse(record['chunks'], record.get('offsets', []), record['created_at'])
+        # Promote to memory with a fresh memory TTL
+        self._store.remember(key, now, entry)
+        return entry
+
+    def put(self, key: str, entry: CachedResponse):
+        """Store a response in both tiers."""
+        self._store.remember(key, entry.created_at, entry)
+        with self._lock:
+            self._stores += 1
+        self._store.write(key, {
+            'created_at': entry.created_at,
+            'chunks': entry.chunks,
+            'offsets': entry.offsets
+        })
+
+    def purge(self) -> int:
+        """Delete expired on-disk entries. Returns the number removed."""
+        return self._store.purge(self.disk_ttl)
+
+    def clear(self):
+        """Drop every cached response from memory. The disk tier is kept."""
+        self._store.clear()
+
+    def record(self, key: str, stream: Iterator[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """Pass a live stream through, storing it once it completes."""
+        return record_stream(stream, lambda entry: self.put(key, entry))
+
+    def arecord(self, key: str, stream: AsyncIterator[Dict[str, str]]) -> AsyncIterator[Dict[str, str]]:
+        """Asyncio counterpart of record()."""
+        return arecord_stream(stream, lambda entry: self.put(key, entry))
+
+    def replay(self, entry: CachedResponse) -> Iterator[Dict[str, str]]:
+        """Replay a cached response as a stream of chunk dictionaries."""
+        return replay_stream(entry, self.replay_pace)
+
+    def areplay(self, entry: CachedResponse) -> AsyncIterator[Dict[str, str]]:
+        """Asyncio counterpart of replay()."""
+        return areplay_stream(entry, self.replay_pace)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters for both tiers."""
+        with self._lock:
+            hits = self._memory_hits + self._disk_hits
+            lookups = hits + self._misses
+            return {
+                'entries': len(self._store),
+                'max_entries': self.max_entries,
+                'memory_hits': self._memory_hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'stores': self._stores,
+                'hit_rate': hits / lookups if lookups else 0.0
+            }
+
+
+def create_response_cache(settings) -> Optional[ResponseCache]:
+    """Create a cache from ResponseCacheSettings, or None if caching is disabled."""
+    if not settings.enabled:
+        return None
+    return ResponseCache(
+        cache_dir=settings.cache_dir,
+        max_entries=settings.max_entries,
+        ttl=settings.ttl,
+        disk_ttl=settings.disk_ttl,
+        replay_pace=settings.replay_pace
+    )
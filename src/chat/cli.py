@@ -9,10 +9,11 @@ import logging
 from typing import List, Dict
 import readline  # For better input handling (command history)
 
-from src.config.settings import chat_settings, api_settings
-from src.utils.helpers import create_chat_messages
+from src.config.settings import chat_settings, api_settings, compaction_settings
+from src.utils.context import ContextBuilder
 from src.utils.search import search_and_scrape
 from src.chat.client import DeepSeekClient
+from src.chat.compaction import create_compactor
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -26,6 +27,8 @@ class ChatCLI:
         """
         self.history_file = history_file
         self.chat_history: List[Dict[str, str]] = self.load_history()
+        self.context = ContextBuilder(token_budget=chat_settings.context_token_budget)
+        self.compactor = create_compactor(compaction_settings)
         self.client = DeepSeekClient(
             api_key=api_settings.api_key,
             model=chat_settings.model
@@ -115,12 +118,16 @@ class ChatCLI:
                 elif not user_input:
                     continue
                 
-                # Create messages with history and system message
-                messages = create_chat_messages(
+                # Create messages with history and system message, trimmed to the token budget
+                history = self.compactor.apply('cli', self.chat_history) if self.compactor else self.chat_history
+                context = self.context.build(
                     user_message=user_input,
                     system_message=chat_settings.system_message,
-                    chat_history=self.chat_history
+                    chat_history=history
                 )
+                messages = context.messages
+                if context.truncated:
+                    logger.info(f"Context dropped {len(context.dropped)} older messages (~{context.dropped_tokens} tokens) to fit the budget")
                 
                 # Get streaming response
                 response_text = self.print_streaming_response(
@@ -132,6 +139,10 @@ class ChatCLI:
                 self.chat_history.append({"role": "assistant", "content": response_text})
                 self.save_history()
                 
+                # Summarise older turns in the background once the chat gets long
+                if self.compactor:
+                    self.compactor.maybe_schedule('cli', self.chat_history, count=self.context.count)
+                
             except KeyboardInterrupt:
                 print("\nInterrupted. Type '/quit' or '/exit' to end the chat.")
             except Exception as e:
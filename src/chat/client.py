@@ -5,11 +5,24 @@ Provides a simple interface to interact with DeepSeek's API.
 
 import os
 import logging
-from typing import List, Dict, Optional, Union, Iterator
-from openai import OpenAI
+from typing import Callable, List, Dict, Optional, Tuple, Union, Iterator, AsyncIterator
+from openai import OpenAI, AsyncOpenAI
+from openai.types import CompletionUsage
 from openai.types.chat import ChatCompletion, ChatCompletionChunk
 from dotenv import load_dotenv
-import requests.exceptions
+
+from src.config.settings import resilience_settings, rate_limit_settings
+from src.chat.transport import get_http_client, get_async_http_client
+from src.chat.resilience import Resilience, get_resilience
+from src.chat.ratelimit import RateLimiter, Ticket, get_rate_limiter
+from src.utils.context import estimate_tokens
+from src.chat.cache import ResponseCache, CachedResponse, cache_key, replay_stream, areplay_stream
+from src.chat.similarity import SimilarityCache, SimilarMatch, MODE_RETURN
+from src.chat.singleflight import SingleFlight
+from src.chat.metrics import (
+    CallMetrics, ChatStream, AsyncChatStream, MetricsRegistry, get_metrics_registry,
+    SOURCE_UPSTREAM, SOURCE_CACHE, SOURCE_SIMILAR
+)
 
 # Load environment variables
 load_dotenv()
@@ -20,24 +33,75 @@ logger = logging.getLogger(__name__)
 class DeepSeekClient:
     """Client for interacting with DeepSeek's chat API."""
     
-    def __init__(self, api_key: Optional[str] = None, model: str = "deepseek-reasoner"):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "deepseek-reasoner",
+        cache: Optional[ResponseCache] = None,
+        similar: Optional[SimilarityCache] = None,
+        singleflight: Optional[SingleFlight] = None,
+        resilience: Optional[Resilience] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        rate_key: str = "default",
+        metrics: Optional[MetricsRegistry] = None
+    ):
         """Initialize the DeepSeek client.
         
         Args:
             api_key: DeepSeek API key. If not provided, will look for DEEPSEEK_API_KEY in environment.
             model: Model to use for chat. Defaults to "deepseek-reasoner".
+            cache: Optional response cache; identical requests are answered from it.
+            similar: Optional near-duplicate prompt cache. In "return" mode rewordings
+                of earlier standalone prompts are answered from it.
+            singleflight: Optional coalescer shared between clients; identical
+                concurrent requests then share one upstream call.
+            resilience: Retry, hedging and circuit breaker policy. Defaults to the
+                endpoint's shared layer built from the resilience settings.
+            rate_limiter: Limiter every upstream request must pass. Defaults to the
+                process-wide limiter when rate limiting is enabled in the settings.
+            rate_key: Fairness key of this client's requests, e.g. its chat or user.
+            metrics: Registry finished calls are recorded into. Defaults to the
+                process-wide registry.
         """
         self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
         if not self.api_key:
             raise ValueError("DeepSeek API key not found. Please provide it or set DEEPSEEK_API_KEY environment variable.")
         
         self.model = model
+        self.cache = cache
+        self.similar = similar
+        self.singleflight = singleflight
+        self.rate_limiter = rate_limiter or get_rate_limiter(rate_limit_settings)
+        self.rate_key = rate_key
+        self.metrics = metrics or get_metrics_registry()
+        # Metrics of the most recent call; streamed calls also carry theirs on the stream
+        self.last_metrics: Optional[CallMetrics] = None
+        self.resilience = resilience or get_resilience(resilience_settings, "https://api.deepseek.com/chat/completions")
         self.client = OpenAI(
             api_key=self.api_key,
             base_url="https://api.deepseek.com",
-            timeout=60.0  # Set a longer timeout
+            timeout=60.0,  # Set a longer timeout
+            max_retries=0,  # Retries are handled by self.resilience
+            http_client=get_http_client()  # Shared, process-wide connection pool
         )
+        # Created lazily so sync-only callers never build an async pool
+        self._async_client: Optional[AsyncOpenAI] = None
         logger.debug(f"Initialized with model: {model}")
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Asynchronous OpenAI-compatible client for the running event loop."""
+        http_client = get_async_http_client()
+        # Rebuild if we moved to another event loop and got a different pool
+        if self._async_client is None or self._async_client._client is not http_client:
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url="https://api.deepseek.com",
+                timeout=60.0,
+                max_retries=0,
+                http_client=http_client
+            )
+        return self._async_client
         
     def chat(
         self,
@@ -46,7 +110,7 @@ class DeepSeekClient:
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         **kwargs
-    ) -> Union[str, Iterator[str]]:
+    ) -> Union[str, ChatStream]:
         """Send a chat request to DeepSeek API.
         
         Args:
@@ -58,37 +122,389 @@ class DeepSeekClient:
             
         Returns:
             If stream=False, returns the complete response as a string.
-            If stream=True, returns an iterator of response chunks.
+            If stream=True, returns a ChatStream of response chunks; its
+            `metrics` record is complete once the stream has been consumed.
             
         Raises:
-            ConnectionError: If there are network connectivity issues
-            TimeoutError: If the request times out
-            Exception: For other API errors
+            DeepSeekConnectionError: If there are network connectivity issues (a ConnectionError)
+            DeepSeekTimeoutError: If the request times out (a TimeoutError)
+            CircuitOpenError: If the API has been failing and calls are failing fast
+            StreamInterruptedError: If a stream fails after producing output; it is not retried
+            DeepSeekError: For other API errors, see src.chat.errors
         """
+        call = self.last_metrics = CallMetrics(self.model, stream)
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                stream=stream,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                **kwargs
-            )
+            result = self._dispatch(call, messages, stream, temperature, max_tokens, kwargs)
+        except Exception as e:
+            self._record(call, error=e)
+            raise
+        if stream:
+            return ChatStream(result, call, self.metrics)
+        self._record(call, text=result)
+        return result
+    
+    def _dispatch(
+        self,
+        call: CallMetrics,
+        messages: List[Dict[str, str]],
+        stream: bool,
+        temperature: float,
+        max_tokens: Optional[int],
+        kwargs: Dict
+    ) -> Union[str, Iterator[Dict[str, str]]]:
+        """Answer from a cache, an identical in-flight request or a new upstream call."""
+        key = self._cache_key(messages, temperature, max_tokens, kwargs)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.debug("Serving response from cache")
+                call.source = SOURCE_CACHE
+                return self.cache.replay(cached) if stream else cached.text
+        
+        if self.similar is not None and self.similar.mode == MODE_RETURN:
+            match = self.find_similar(messages, temperature, max_tokens, **kwargs)
+            if match is not None:
+                logger.debug(f"Serving response to a similar prompt (similarity {match.similarity:.2f})")
+                call.source = SOURCE_SIMILAR
+                return replay_stream(match.response) if stream else match.response.text
+        
+        if self.singleflight is None:
+            return self._request(call, messages, stream, temperature, max_tokens, key, kwargs)
+        
+        # Identical requests already in flight share one upstream call
+        flight_key = self._flight_key(messages, stream, temperature, max_tokens, kwargs)
+        request = lambda: self._request(call, messages, stream, temperature, max_tokens, key, kwargs)
+        if stream:
+            return self.singleflight.stream(flight_key, request)
+        return self.singleflight.call(flight_key, request)
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        stream: bool = False,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> Union[str, AsyncChatStream]:
+        """Send a chat request to DeepSeek API without blocking the event loop.
+        
+        Asyncio counterpart of chat(); accepts the same arguments and maps
+        errors the same way.
+        
+        Returns:
+            If stream=False, returns the complete response as a string.
+            If stream=True, returns an AsyncChatStream of chunk dictionaries
+            with the same schema as the synchronous stream.
             
-            if stream:
-                return self._handle_stream_response(response)
-            else:
-                return self._handle_complete_response(response)
-                
-        except requests.exceptions.ConnectionError as e:
-            logger.error("Network connection error")
-            raise ConnectionError("Failed to connect to the DeepSeek API. Please check your internet connection.")
-        except requests.exceptions.Timeout as e:
-            logger.error("Request timeout")
-            raise TimeoutError("Request to DeepSeek API timed out. Please try again.")
+        Raises:
+            DeepSeekConnectionError: If there are network connectivity issues (a ConnectionError)
+            DeepSeekTimeoutError: If the request times out (a TimeoutError)
+            CircuitOpenError: If the API has been failing and calls are failing fast
+            StreamInterruptedError: If a stream fails after producing output; it is not retried
+            DeepSeekError: For other API errors, see src.chat.errors
+        """
+        call = self.last_metrics = CallMetrics(self.model, stream)
+        try:
+            result = await self._adispatch(call, messages, stream, temperature, max_tokens, kwargs)
         except Exception as e:
-            logger.error(f"API error: {str(e)}")
-            raise Exception(f"Error calling DeepSeek API: {str(e)}")
+            self._record(call, error=e)
+            raise
+        if stream:
+            return AsyncChatStream(result, call, self.metrics)
+        self._record(call, text=result)
+        return result
+    
+    async def _adispatch(
+        self,
+        call: CallMetrics,
+        messages: List[Dict[str, str]],
+        stream: bool,
+        temperature: float,
+        max_tokens: Optional[int],
+        kwargs: Dict
+    ) -> Union[str, AsyncIterator[Dict[str, str]]]:
+        """Asyncio counterpart of _dispatch()."""
+        key = self._cache_key(messages, temperature, max_tokens, kwargs)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.debug("Serving response from cache")
+                call.source = SOURCE_CACHE
+                return self.cache.areplay(cached) if stream else cached.text
+        
+        if self.similar is not None and self.similar.mode == MODE_RETURN:
+            match = self.find_similar(messages, temperature, max_tokens, **kwargs)
+            if match is not None:
+                logger.debug(f"Serving response to a similar prompt (similarity {match.similarity:.2f})")
+                call.source = SOURCE_SIMILAR
+                return areplay_stream(match.response) if stream else match.response.text
+        
+        if self.singleflight is None:
+            return await self._arequest(call, messages, stream, temperature, max_tokens, key, kwargs)
+        
+        flight_key = self._flight_key(messages, stream, temperature, max_tokens, kwargs)
+        request = lambda: self._arequest(call, messages, stream, temperature, max_tokens, key, kwargs)
+        if stream:
+            return self.singleflight.astream(flight_key, request)
+        return await self.singleflight.acall(flight_key, request)
+    
+    def _record(self, call: CallMetrics, text: Optional[str] = None, error: Optional[BaseException] = None):
+        """Close a call's metrics record and add it to the registry."""
+        if text:
+            call.mark({'type': 'response', 'content': text})
+        call.finish(error)
+        self.metrics.record(call)
+    
+    def _request(
+        self,
+        call: CallMetrics,
+        messages: List[Dict[str, str]],
+        stream: bool,
+        temperature: float,
+        max_tokens: Optional[int],
+        key: Optional[str],
+        kwargs: Dict
+    ) -> Union[str, Iterator[Dict[str, str]]]:
+        """Make the upstream call, recording the response in any configured caches.
+        
+        The rate limit ticket is taken once, before the resilience layer, so
+        retries and hedges share it and queueing does not count as latency.
+        """
+        call.source = SOURCE_UPSTREAM
+        ticket, prompt_tokens = None, 0
+        if self.rate_limiter is not None:
+            prompt_tokens, cost = self._estimate_cost(messages, max_tokens)
+            ticket = self.rate_limiter.acquire(self.rate_key, cost)
+            call.admitted(ticket.waited)
+        reported = []
+        
+        def on_usage(usage):
+            reported.append(usage)
+            call.record_usage(usage)
+        
+        if not stream:
+            try:
+                text = self.resilience.call(lambda: self._complete(on_usage, messages, temperature, max_tokens, kwargs))
+            except Exception:
+                self._settle(ticket, 0, [])
+                raise
+            self._settle(ticket, ticket.tokens if ticket is not None else 0, reported)
+            return self._store_complete(key, messages, temperature, max_tokens, kwargs, text)
+        
+        try:
+            chunks = self.resilience.stream(lambda: self._open_stream(on_usage, messages, temperature, max_tokens, kwargs))
+        except Exception:
+            self._settle(ticket, 0, [])
+            raise
+        if ticket is not None:
+            chunks = self._metered(chunks, ticket, prompt_tokens, reported)
+        if key is not None:
+            chunks = self.cache.record(key, chunks)
+        if self.similar is not None:
+            chunks = self.similar.record(
+                self.model, messages, chunks, temperature=temperature, max_tokens=max_tokens, **kwargs
+            )
+        return chunks
+    
+    async def _arequest(
+        self,
+        call: CallMetrics,
+        messages: List[Dict[str, str]],
+        stream: bool,
+        temperature: float,
+        max_tokens: Optional[int],
+        key: Optional[str],
+        kwargs: Dict
+    ) -> Union[str, AsyncIterator[Dict[str, str]]]:
+        """Asyncio counterpart of _request()."""
+        call.source = SOURCE_UPSTREAM
+        ticket, prompt_tokens = None, 0
+        if self.rate_limiter is not None:
+            prompt_tokens, cost = self._estimate_cost(messages, max_tokens)
+            ticket = await self.rate_limiter.acquire_async(self.rate_key, cost)
+            call.admitted(ticket.waited)
+        reported = []
+        
+        def on_usage(usage):
+            reported.append(usage)
+            call.record_usage(usage)
+        
+        if not stream:
+            try:
+                text = await self.resilience.acall(lambda: self._acomplete(on_usage, messages, temperature, max_tokens, kwargs))
+            except Exception:
+                self._settle(ticket, 0, [])
+                raise
+            self._settle(ticket, ticket.tokens if ticket is not None else 0, reported)
+            return self._store_complete(key, messages, temperature, max_tokens, kwargs, text)
+        
+        try:
+            chunks = await self.resilience.astream(lambda: self._aopen_stream(on_usage, messages, temperature, max_tokens, kwargs))
+        except Exception:
+            self._settle(ticket, 0, [])
+            raise
+        if ticket is not None:
+            chunks = self._ametered(chunks, ticket, prompt_tokens, reported)
+        if key is not None:
+            chunks = self.cache.arecord(key, chunks)
+        if self.similar is not None:
+            chunks = self.similar.arecord(
+                self.model, messages, chunks, temperature=temperature, max_tokens=max_tokens, **kwargs
+            )
+        return chunks
+    
+    def _estimate_cost(self, messages: List[Dict[str, str]], max_tokens: Optional[int]) -> Tuple[int, int]:
+        """Estimated (prompt, prompt + completion) tokens of a request, for the rate limiter."""
+        prompt_tokens = sum(estimate_tokens(msg.get('content') or '') for msg in messages)
+        return prompt_tokens, prompt_tokens + (max_tokens or rate_limit_settings.expected_completion_tokens)
+    
+    @staticmethod
+    def _settle(ticket: Optional[Ticket], fallback_tokens: int, reported: List):
+        """Settle a ticket with the last reported usage, or `fallback_tokens` without one."""
+        if ticket is not None:
+            ticket.settle(reported[-1].total_tokens if reported else fallback_tokens)
+    
+    def _complete(self, on_usage: Callable[[CompletionUsage], None], messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int], kwargs: Dict) -> str:
+        """Send one non-streamed request upstream."""
+        response = self._create(messages, False, temperature, max_tokens, kwargs)
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            on_usage(usage)
+        return self._handle_complete_response(response)
+    
+    async def _acomplete(self, on_usage: Callable[[CompletionUsage], None], messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int], kwargs: Dict) -> str:
+        """Asyncio counterpart of _complete()."""
+        response = await self._acreate(messages, False, temperature, max_tokens, kwargs)
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            on_usage(usage)
+        return self._handle_complete_response(response)
+    
+    def _open_stream(self, on_usage: Callable[[CompletionUsage], None], messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int], kwargs: Dict) -> Iterator[Dict[str, str]]:
+        """Open one streamed request upstream."""
+        return self._handle_stream_response(self._create(messages, True, temperature, max_tokens, kwargs), on_usage)
+    
+    async def _aopen_stream(self, on_usage: Callable[[CompletionUsage], None], messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int], kwargs: Dict) -> AsyncIterator[Dict[str, str]]:
+        """Asyncio counterpart of _open_stream()."""
+        return self._ahandle_stream_response(await self._acreate(messages, True, temperature, max_tokens, kwargs), on_usage)
+    
+    @staticmethod
+    def _metered(chunks: Iterator[Dict[str, str]], ticket: Ticket, prompt_tokens: int, reported: List) -> Iterator[Dict[str, str]]:
+        """Pass a stream through, settling its rate limit ticket with the tokens it used.
+        
+        The usage block reported at the end of the stream is used when it
+        arrived; otherwise the tokens produced are estimated from the text.
+        """
+        produced = []
+        try:
+            for chunk in chunks:
+                produced.append(chunk['content'])
+                yield chunk
+        finally:
+            chunks.close()
+            if reported:
+                ticket.settle(reported[-1].total_tokens)
+            else:
+                ticket.settle(prompt_tokens + estimate_tokens(''.join(produced)))
+    
+    @staticmethod
+    async def _ametered(chunks: AsyncIterator[Dict[str, str]], ticket: Ticket, prompt_tokens: int, reported: List) -> AsyncIterator[Dict[str, str]]:
+        """Asyncio counterpart of _metered()."""
+        produced = []
+        try:
+            async for chunk in chunks:
+                produced.append(chunk['content'])
+                yield chunk
+        finally:
+            await chunks.aclose()
+            if reported:
+                ticket.settle(reported[-1].total_tokens)
+            else:
+                ticket.settle(prompt_tokens + estimate_tokens(''.join(produced)))
+    
+    def _create(self, messages: List[Dict[str, str]], stream: bool, temperature: float, max_tokens: Optional[int], kwargs: Dict):
+        """Send one request upstream; errors are classified by the resilience layer."""
+        if stream:
+            # Ask for the usage block as a final chunk
+            kwargs = {'stream_options': {'include_usage': True}, **kwargs}
+        return self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=stream,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+    
+    async def _acreate(self, messages: List[Dict[str, str]], stream: bool, temperature: float, max_tokens: Optional[int], kwargs: Dict):
+        """Asyncio counterpart of _create()."""
+        if stream:
+            kwargs = {'stream_options': {'include_usage': True}, **kwargs}
+        return await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=stream,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+    
+    def _flight_key(
+        self,
+        messages: List[Dict[str, str]],
+        stream: bool,
+        temperature: float,
+        max_tokens: Optional[int],
+        kwargs: Dict
+    ) -> str:
+        """Identity of a request for single-flight coalescing."""
+        return cache_key(self.model, messages, stream=stream, temperature=temperature, max_tokens=max_tokens, **kwargs)
+    
+    def _cache_key(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int],
+        kwargs: Dict
+    ) -> Optional[str]:
+        """Cache key of a request, or None if caching is off."""
+        if self.cache is None:
+            return None
+        return cache_key(self.model, messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+    
+    def _store_complete(
+        self,
+        key: Optional[str],
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int],
+        kwargs: Dict,
+        text: str
+    ) -> str:
+        """Cache a non-streamed response and return it."""
+        if text:
+            entry = CachedResponse([{'type': 'response', 'content': text}])
+            if key is not None:
+                self.cache.put(key, entry)
+            if self.similar is not None:
+                self.similar.add(self.model, messages, entry, temperature=temperature, max_tokens=max_tokens, **kwargs)
+        return text
+    
+    def find_similar(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> Optional[SimilarMatch]:
+        """Find a cached answer to a reworded earlier prompt, if a similarity cache is set.
+        
+        Takes the same arguments as chat(); only requests with a single user
+        message can match.
+        """
+        if self.similar is None:
+            return None
+        return self.similar.lookup(self.model, messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
     
     def chat_stream(
         self,
@@ -123,14 +539,26 @@ class DeepSeekClient:
         """Handle a complete (non-streamed) response."""
         return response.choices[0].message.content
     
-    def _handle_stream_response(self, response: Iterator[ChatCompletionChunk]) -> Iterator[Dict[str, str]]:
+    def _handle_stream_response(
+        self,
+        response: Iterator[ChatCompletionChunk],
+        on_usage: Optional[Callable[[CompletionUsage], None]] = None
+    ) -> Iterator[Dict[str, str]]:
         """Handle a streamed response.
         
+        Args:
+            response: The upstream chunk stream.
+            on_usage: Called with the usage block, sent in a final chunk without choices.
+        
         Returns:
             Iterator of dictionaries containing 'type' ('thinking' or 'response') and 'content'.
         """
         try:
             for chunk in response:
+                if chunk.usage is not None and on_usage is not None:
+                    on_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
                 delta = chunk.choices[0].delta
                 
                 # Check for reasoning content (thinking process)
@@ -150,3 +578,45 @@ class DeepSeekClient:
         except Exception as e:
             logger.error(f"Stream error: {str(e)}")
             raise
+        finally:
+            # Closing the iterator early (e.g. the caller cancelled) must also
+            # close the upstream HTTP stream so generation stops being billed
+            response.close()
+    
+    async def _ahandle_stream_response(
+        self,
+        response: AsyncIterator[ChatCompletionChunk],
+        on_usage: Optional[Callable[[CompletionUsage], None]] = None
+    ) -> AsyncIterator[Dict[str, str]]:
+        """Handle a streamed response from the asynchronous client.
+        
+        Returns:
+            Async iterator of dictionaries containing 'type' ('thinking' or 'response') and 'content'.
+        """
+        try:
+            async for chunk in response:
+                if chunk.usage is not None and on_usage is not None:
+                    on_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                
+                if hasattr(delta, 'reasoning_content') and delta.reasoning_content:
+                    yield {
+                        'type': 'thinking',
+                        'content': delta.reasoning_content
+                    }
+                
+                if hasattr(delta, 'content') and delta.content:
+                    yield {
+                        'type': 'response',
+                        'content': delta.content
+                    }
+                
+        except Exception as e:
+            logger.error(f"Stream error: {str(e)}")
+            raise
+        finally:
+            # Closing the iterator early (e.g. the caller cancelled) must also
+            # close the upstream HTTP stream so generation stops being billed
+            await response.close()
@@ -0,0 +1,231 @@
+"""
+Coalescing of streamed chunks before they reach consumers.
+
+DeepSeek streams one delta per token, and every delta costs the consumer a
+JSON encode, a socket write and a markdown re-render in the browser. The
+coalescer merges consecutive chunks of the same type and flushes them when
+the oldest buffered chunk is `window` seconds old, when the buffer reaches
+`max_bytes`, or when a chunk ends a line. The first chunk of each type can
+be passed straight through so the time to first token is unchanged.
+"""
+
+import time
+import queue
+import asyncio
+import contextlib
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Pump thread sentinel marking the end of the source stream
+_END = object()
+
+
+class _Buffer:
+    """Chunks of one type waiting to be flushed as one."""
+
+    def __init__(self):
+        self.type: Optional[str] = None
+        self.parts: List[str] = []
+        self.size = 0
+        self.started = 0.0
+
+    def add(self, chunk: Dict[str, str]):
+        if not self.parts:
+            self.type = chunk['type']
+            self.started = time.monotonic()
+        self.parts.append(chunk['content'])
+        self.size += len(chunk['content'].encode('utf-8'))
+
+    def take(self) -> Dict[str, str]:
+        chunk = {'type': self.type, 'content': ''.join(self.parts)}
+        self.parts = []
+        self.size = 0
+        return chunk
+
+
+class ChunkCoalescer:
+    """Merge streamed chunks by time window, size and line boundary."""
+
+    def __init__(
+        self,
+        window: float = 0.05,
+        max_bytes: int = 1024,
+        flush_on_newline: bool = True,
+        flush_first: bool = True
+    ):
+        """Initialize the coalescer.
+
+        Args:
+            window: Seconds a chunk may wait for others to merge with; 0 disables merging.
+            max_bytes: Flush once this many bytes are buffered.
+            flush_on_newline: Flush when a chunk ends a line, so whole lines render at once.
+            flush_first: Pass the first chunk of each type through immediately.
+        """
+        self.window = window
+        self.max_bytes = max_bytes
+        self.flush_on_newline = flush_on_newline
+        self.flush_first = flush_first
+        self._lock = threading.Lock()
+        self._streams = 0
+        self._chunks_in = 0
+        self._chunks_out = 0
+
+    def _ready(self, buffer: _Buffer, chunk: Dict[str, str], first: bool) -> bool:
+        """Whether the buffer must be flushed right after `chunk` was added."""
+        return (
+            first
+            or buffer.size >= self.max_bytes
+            or (self.flush_on_newline and '\n' in chunk['content'])
+            or time.monotonic() - buffer.started >= self.window
+        )
+
+    def _record(self, chunks_in: int, chunks_out: int):
+        with self._lock:
+            self._streams += 1
+            self._chunks_in += chunks_in
+            self._chunks_out += chunks_out
+        logger.debug(f"Coalesced {chunks_in} stream chunks into {chunks_out}")
+
+    def coalesce(self, chunks: Iterator[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """Merge a stream of {'type', 'content'} chunks.
+
+        The source is read on a pump thread so a buffered chunk is flushed
+        when its window expires even if the upstream goes quiet. Closing the
+        returned iterator closes the source once its pending read returns.
+        """
+        if self.window <= 0:
+            return chunks
+        return self._coalesce(chunks)
+
+    def _coalesce(self, chunks: Iterator[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        pending: "queue.Queue[Any]" = queue.Queue()
+        stop = threading.Event()
+
+        def pump():
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        break
+                    pending.put(chunk)
+            except BaseException as e:
+                pending.put(e)
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+                pending.put(_END)
+
+        threading.Thread(target=pump, daemon=True, name="chunk-coalescer").start()
+        buffer = _Buffer()
+        seen = set()
+        chunks_in = chunks_out = 0
+        try:
+            while True:
+                timeout = None
+                if buffer.parts:
+                    timeout = max(0.0, buffer.started + self.window - time.monotonic())
+                try:
+                    item = pending.get(timeout=timeout)
+                except queue.Empty:
+                    chunks_out += 1
+                    yield buffer.take()
+                    continue
+                if item is _END or isinstance(item, BaseException):
+                    if buffer.parts:
+                        chunks_out += 1
+                        yield buffer.take()
+                    if item is not _END:
+                        raise item
+                    return
+                chunks_in += 1
+                if buffer.parts and buffer.type != item['type']:
+                    chunks_out += 1
+                    yield buffer.take()
+                first = self.flush_first and item['type'] not in seen
+                seen.add(item['type'])
+                buffer.add(item)
+                if self._ready(buffer, item, first):
+                    chunks_out += 1
+                    yield buffer.take()
+        finally:
+            stop.set()
+            self._record(chunks_in, chunks_out)
+
+    def acoalesce(self, chunks: AsyncIterator[Dict[str, str]]) -> AsyncIterator[Dict[str, str]]:
+        """Asyncio counterpart of coalesce()."""
+        if self.window <= 0:
+            return chunks
+        return self._acoalesce(chunks)
+
+    async def _acoalesce(self, chunks: AsyncIterator[Dict[str, str]]) -> AsyncIterator[Dict[str, str]]:
+        buffer = _Buffer()
+        seen = set()
+        chunks_in = chunks_out = 0
+        source = chunks.__aiter__()
+        # The pending read survives window timeouts; cancelling it would end the source
+        read: Optional[asyncio.Task] = None
+        try:
+            while True:
+                if read is None:
+                    read = asyncio.ensure_future(source.__anext__())
+                timeout = None
+                if buffer.parts:
+                    timeout = max(0.0, buffer.started + self.window - time.monotonic())
+                done, _ = await asyncio.wait({read}, timeout=timeout)
+                if not done:
+                    chunks_out += 1
+                    yield buffer.take()
+                    continue
+                task, read = read, None
+                try:
+                    item = task.result()
+                except StopAsyncIteration:
+                    if buffer.parts:
+                        chunks_out += 1
+                        yield buffer.take()
+                    return
+                chunks_in += 1
+                if buffer.parts and buffer.type != item['type']:
+                    chunks_out += 1
+                    yield buffer.take()
+                first = self.flush_first and item['type'] not in seen
+                seen.add(item['type'])
+                buffer.add(item)
+                if self._ready(buffer, item, first):
+                    chunks_out += 1
+                    yield buffer.take()
+        finally:
+            if read is not None:
+                # The source is still running until the cancelled read unwinds
+                read.cancel()
+                with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                    await read
+            if hasattr(chunks, 'aclose'):
+                await chunks.aclose()
+            self._record(chunks_in, chunks_out)
+
+    def stats(self) -> Dict[str, Any]:
+        """Chunks received and emitted across all coalesced streams."""
+        with self._lock:
+            return {
+                'streams': self._streams,
+                'chunks_in': self._chunks_in,
+                'chunks_out': self._chunks_out,
+                'merged': self._chunks_in - self._chunks_out,
+                'ratio': self._chunks_in / self._chunks_out if self._chunks_out else None
+            }
+
+
+def create_coalescer(settings) -> Optional[ChunkCoalescer]:
+    """Build a ChunkCoalescer from CoalesceSettings, or None if disabled."""
+    if not settings.enabled or settings.window <= 0:
+        return None
+    return ChunkCoalescer(
+        window=settings.window,
+        max_bytes=settings.max_bytes,
+        flush_on_newline=settings.flush_on_newline,
+        flush_first=settings.flush_first
+    )
@@ -0,0 +1,216 @@
+"""
+Background conversation compaction via rolling summaries.
+
+Once the part of a conversation that is not yet summarised grows past a
+token threshold, its older turns are summarised by a cheaper model on a
+worker thread. The summary is cached with the range of messages it
+replaces, and later turns send one synthetic message in place of that
+range. Each new summary folds in the previous one, so the prompt stays
+bounded however long the chat runs.
+"""
+
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from src.chat.client import DeepSeekClient
+from src.utils.context import estimate_tokens
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "Summarise the conversation below so it can replace the original messages "
+    "as context for continuing the chat. Keep facts, decisions, open questions, "
+    "names, numbers and code identifiers; drop pleasantries. Write in the "
+    "language of the conversation."
+)
+
+
+@dataclass
+class Summary:
+    """A summary replacing history messages [0, end)."""
+    content: str
+    end: int
+    fingerprint: str  # Of message end - 1, to detect a cleared or edited history
+    tokens: int
+    created_at: float
+
+    def as_message(self) -> Dict[str, Any]:
+        """The synthetic message sent in place of the summarised range."""
+        return {
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{self.content}",
+            "pinned": True
+        }
+
+
+def _fingerprint(message: Dict[str, Any]) -> str:
+    data = f"{message.get('role', '')}\x00{message.get('content', '')}"
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class ConversationCompactor:
+    """Summarise older turns of conversations off the request path."""
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        threshold_tokens: int = 24000,
+        keep_recent: int = 6,
+        summary_max_tokens: int = 1024,
+        max_chats: int = 1024,
+        max_workers: int = 1
+    ):
+        """Initialize the compactor.
+        
+        Args:
+            client_factory: Returns the DeepSeekClient used for summaries.
+            threshold_tokens: Compact once unsummarised history exceeds this many tokens.
+            keep_recent: Number of newest messages never summarised.
+            summary_max_tokens: Maximum length of a summary.
+            max_chats: Number of chat summaries kept in memory.
+            max_workers: Concurrent summarisation jobs.
+        """
+        self.client_factory = client_factory
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent = keep_recent
+        self.summary_max_tokens = summary_max_tokens
+        self.max_chats = max_chats
+        self._client = None
+        self._summaries: "OrderedDict[str, Summary]" = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="compaction")
+
+    def summary_for(self, key: str, history: List[Dict[str, Any]]) -> Optional[Summary]:
+        """Return the cached summary for a chat if it still matches its history."""
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                return None
+            if summary.end > len(history) or _fingerprint(history[summary.end - 1]) != summary.fingerprint:
+                # History was cleared or rewritten since the summary was made
+                del self._summaries[key]
+                return None
+            self._summaries.move_to_end(key)
+            return summary
+
+    def apply(self, key: str, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return the history with its summarised prefix replaced by the summary."""
+        summary = self.summary_for(key, history)
+        if summary is None:
+            return history
+        return [summary.as_message()] + history[summary.end:]
+
+    def maybe_schedule(
+        self,
+        key: str,
+        history: List[Dict[str, Any]],
+        count: Optional[Callable[[Dict[str, Any]], int]] = None
+    ) -> bool:
+        """Queue a compaction job if the unsummarised part is over the threshold.
+        
+        Args:
+            key: Chat identifier.
+            history: The chat's full history.
+            count: Token counter for one message; pass ContextBuilder.count
+                to reuse its cached counts.
+            
+        Returns:
+            True if a job was queued.
+        """
+        summary = self.summary_for(key, history)
+        start = summary.end if summary else 0
+        end = len(history) - self.keep_recent
+        if end <= start:
+            return False
+        # Don't leave an orphaned assistant reply at the start of the kept window
+        while end < len(history) and history[end].get('role') == 'assistant':
+            end += 1
+        
+        if count is None:
+            count = lambda msg: estimate_tokens(msg.get('content', ''))
+        tokens = sum(count(msg) for msg in history[start:])
+        if tokens < self.threshold_tokens:
+            return False
+        
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        
+        # Snapshot the range now; the live history keeps growing
+        messages = [dict(msg) for msg in history[start:end]]
+        fingerprint = _fingerprint(history[end - 1])
+        self._executor.submit(self._compact, key, summary, messages, end, fingerprint)
+        logger.info(f"Scheduled compaction of messages {start}-{end} for {key} (~{tokens} tokens unsummarised)")
+        return True
+
+    def _summarise(self, previous: Optional[Summary], messages: List[Dict[str, Any]]) -> str:
+        transcript = []
+        if previous is not None:
+            transcript.append(f"[Summary of everything before]\n{previous.content}")
+        for msg in messages:
+            transcript.append(f"[{msg['role']}]\n{msg['content']}")
+        
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client.chat(
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": "\n\n".join(transcript)}
+            ],
+            stream=False,
+            temperature=0.3,
+            max_tokens=self.summary_max_tokens
+        )
+
+    def _compact(self, key: str, previous: Optional[Summary], messages: List[Dict[str, Any]], end: int, fingerprint: str):
+        started = time.time()
+        try:
+            content = self._summarise(previous, messages)
+            summary = Summary(
+                content=content,
+                end=end,
+                fingerprint=fingerprint,
+                tokens=estimate_tokens(content),
+                created_at=time.time()
+            )
+            with self._lock:
+                self._summaries[key] = summary
+                self._summaries.move_to_end(key)
+                while len(self._summaries) > self.max_chats:
+                    self._summaries.popitem(last=False)
+            logger.info(f"Compacted {len(messages)} messages for {key} into ~{summary.tokens} tokens in {time.time() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"Compaction failed for {key}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def forget(self, key: str):
+        """Drop a chat's cached summary."""
+        with self._lock:
+            self._summaries.pop(key, None)
+
+    def shutdown(self):
+        """Stop accepting jobs; running ones finish in the background."""
+        self._executor.shutdown(wait=False)
+
+
+def create_compactor(settings) -> Optional[ConversationCompactor]:
+    """Create a compactor from CompactionSettings, or None if compaction is disabled."""
+    if not settings.enabled:
+        return None
+    return ConversationCompactor(
+        client_factory=lambda: DeepSeekClient(model=settings.model),
+        threshold_tokens=settings.threshold_tokens,
+        keep_recent=settings.keep_recent,
+        summary_max_tokens=settings.summary_max_tokens
+    )
@@ -0,0 +1,137 @@
+"""
+Error taxonomy for DeepSeek API calls.
+
+Every failure of an upstream call is classified into one of the exceptions
+below so callers and the retry layer can tell a transient fault (retry it)
+from a permanent one (report it). Connection and timeout errors keep
+subclassing the builtin ConnectionError and TimeoutError that callers
+already catch.
+"""
+
+import time
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+import openai
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class DeepSeekError(Exception):
+    """Base class of every error raised by DeepSeekClient."""
+    retryable = False
+    # Whether the failure says the service is unhealthy (counts towards the circuit breaker)
+    degrades_service = False
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after  # Seconds the server asked us to wait, if it said
+
+
+class DeepSeekConnectionError(DeepSeekError, ConnectionError):
+    """The API could not be reached or the connection dropped."""
+    retryable = True
+    degrades_service = True
+
+
+class DeepSeekTimeoutError(DeepSeekError, TimeoutError):
+    """The API did not answer in time."""
+    retryable = True
+    degrades_service = True
+
+
+class RateLimitError(DeepSeekError):
+    """The API rejected the request with 429 Too Many Requests."""
+    retryable = True
+
+
+class ServerError(DeepSeekError):
+    """The API failed with a 5xx status or is overloaded."""
+    retryable = True
+    degrades_service = True
+
+
+class AuthenticationError(DeepSeekError):
+    """The API key is missing, invalid or not allowed to use the model."""
+
+
+class InsufficientBalanceError(DeepSeekError):
+    """The account has run out of balance (402)."""
+
+
+class InvalidRequestError(DeepSeekError):
+    """The API rejected the request itself, e.g. the context is too long."""
+
+
+class ThrottledError(DeepSeekError):
+    """The local rate limiter could not admit the request in time."""
+
+
+class CircuitOpenError(DeepSeekError):
+    """Calls are failing fast because the API has been failing."""
+
+
+class StreamInterruptedError(DeepSeekError):
+    """A stream failed after it had already produced output.
+
+    The partial response has been delivered, so the request is not retried:
+    replaying it would duplicate or contradict what the caller already saw.
+    """
+
+
+def _retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    """Seconds to wait from Retry-After (or DeepSeek's retry-after-ms), if present."""
+    if response is None:
+        return None
+    headers = response.headers
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(e: BaseException) -> DeepSeekError:
+    """Map a transport or API exception to the DeepSeekError raised to callers."""
+    if isinstance(e, DeepSeekError):
+        return e
+    if isinstance(e, (openai.APITimeoutError, httpx.TimeoutException)):
+        logger.error("Request timeout")
+        return DeepSeekTimeoutError("Request to DeepSeek API timed out. Please try again.")
+    if isinstance(e, (openai.APIConnectionError, httpx.TransportError)):
+        logger.error("Network connection error")
+        return DeepSeekConnectionError("Failed to connect to the DeepSeek API. Please check your internet connection.")
+    if isinstance(e, openai.APIStatusError):
+        status = e.status_code
+        retry_after = _retry_after(e.response)
+        message = f"DeepSeek API returned {status}: {e.message}"
+        logger.error(message)
+        if status == 429:
+            return RateLimitError(message, status, retry_after)
+        if status == 402:
+            return InsufficientBalanceError(message, status)
+        if status in (401, 403):
+            return AuthenticationError(message, status)
+        if status == 408:
+            return DeepSeekTimeoutError(message, status, retry_after)
+        if status == 409 or status >= 500:
+            return ServerError(message, status, retry_after)
+        return InvalidRequestError(message, status)
+    logger.error(f"API error: {str(e)}")
+    return DeepSeekError(f"Error calling DeepSeek API: {str(e)}")
@@ -0,0 +1,438 @@
+"""
+Latency and token accounting of DeepSeek calls.
+
+Every DeepSeekClient call fills a CallMetrics record: time to the first
+chunk, time spent thinking, time to the first response token, throughput
+and the `usage` block, including DeepSeek's prompt cache hit and miss
+token counts. Streamed calls expose the record on the returned ChatStream
+once it has been consumed. Finished records are aggregated per model into
+rolling histograms by a MetricsRegistry, and a PromptCacheTracker follows
+each chat's prompt cache hit ratio over time.
+"""
+
+import time
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+from src.utils.context import estimate_tokens
+
+# Where a call's answer came from
+SOURCE_UPSTREAM = "upstream"
+SOURCE_CACHE = "cache"
+SOURCE_SIMILAR = "similar"
+SOURCE_COALESCED = "coalesced"  # Shared another request's in-flight upstream call
+
+
+@dataclass
+class CallMetrics:
+    """Timings and token usage of one chat call."""
+    model: str
+    stream: bool
+    source: str = SOURCE_COALESCED
+    started_at: float = field(default_factory=time.monotonic)
+    first_chunk_at: Optional[float] = None
+    first_thinking_at: Optional[float] = None
+    first_response_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Seconds spent waiting for the rate limiter, excluded from the timings above
+    queue_time: float = 0.0
+    # From the API's usage block; None when it was not reported
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    reasoning_tokens: Optional[int] = None
+    prompt_cache_hit_tokens: Optional[int] = None
+    prompt_cache_miss_tokens: Optional[int] = None
+    # Text received, for estimating throughput without a usage block
+    output: List[str] = field(default_factory=list, repr=False)
+    error: Optional[str] = None
+    cancelled: bool = False
+
+    def mark(self, chunk: Dict[str, str]):
+        """Record the arrival of a streamed chunk."""
+        now = time.monotonic()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+        if chunk['type'] == 'thinking':
+            if self.first_thinking_at is None:
+                self.first_thinking_at = now
+        elif self.first_response_at is None:
+            self.first_response_at = now
+        self.output.append(chunk['content'])
+
+    def admitted(self, waited: float):
+        """Record a rate limiter wait; timings then count from admission."""
+        self.queue_time = waited
+        self.started_at = time.monotonic()
+
+    def record_usage(self, usage: Any):
+        """Copy the token counts of an API usage block."""
+        if usage is None:
+            return
+        self.prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        self.completion_tokens = getattr(usage, 'completion_tokens', None)
+        # DeepSeek extensions to the OpenAI schema
+        self.prompt_cache_hit_tokens = getattr(usage, 'prompt_cache_hit_tokens', None)
+        self.prompt_cache_miss_tokens = getattr(usage, 'prompt_cache_miss_tokens', None)
+        details = getattr(usage, 'completion_tokens_details', None)
+        if details is not None:
+            self.reasoning_tokens = getattr(details, 'reasoning_tokens', None)
+
+    def finish(self, error: Optional[BaseException] = None, cancelled: bool = False):
+        """Mark the call as over; later calls are ignored."""
+        if self.finished_at is not None:
+            return
+        self.finished_at = time.monotonic()
+        if error is not None:
+            self.error = type(error).__name__
+        self.cancelled = cancelled
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def _since_start(self, at: Optional[float]) -> Optional[float]:
+        return at - self.started_at if at is not None else None
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        return self._since_start(self.first_chunk_at)
+
+    @property
+    def time_to_first_response(self) -> Optional[float]:
+        """Seconds until the first answer token, after any thinking."""
+        return self._since_start(self.first_response_at)
+
+    @property
+    def thinking_time(self) -> Optional[float]:
+        if self.first_thinking_at is None:
+            return None
+        end = self.first_response_at or self.finished_at
+        return end - self.first_thinking_at if end is not None else None
+
+    @property
+    def duration(self) -> Optional[float]:
+        return self._since_start(self.finished_at)
+
+    @property
+    def output_tokens(self) -> int:
+        """Completion tokens, as reported or estimated from the text received."""
+        if self.completion_tokens is not None:
+            return self.completion_tokens
+        return estimate_tokens(''.join(self.output))
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Generation speed from the first chunk to the end of the stream."""
+        if self.first_chunk_at is None or self.finished_at is None:
+            return None
+        elapsed = self.finished_at - self.first_chunk_at
+        return self.output_tokens / elapsed if elapsed > 0 else None
+
+    @property
+    def cache_hit_ratio(self) -> Optional[float]:
+        """Share of prompt tokens served from DeepSeek's prompt cache."""
+        hit, miss = self.prompt_cache_hit_tokens, self.prompt_cache_miss_tokens
+        if hit is None or miss is None or hit + miss == 0:
+            return None
+        return hit / (hit + miss)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly summary, durations in seconds."""
+        def seconds(value: Optional[float]) -> Optional[float]:
+            return round(value, 3) if value is not None else None
+
+        return {
+            'model': self.model,
+            'source': self.source,
+            'stream': self.stream,
+            'queue_time': seconds(self.queue_time),
+            'ttft': seconds(self.time_to_first_token),
+            'thinking_time': seconds(self.thinking_time),
+            'time_to_first_response': seconds(self.time_to_first_response),
+            'duration': seconds(self.duration),
+            'tokens_per_second': seconds(self.tokens_per_second),
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'reasoning_tokens': self.reasoning_tokens,
+            'prompt_cache_hit_tokens': self.prompt_cache_hit_tokens,
+            'prompt_cache_miss_tokens': self.prompt_cache_miss_tokens,
+            'cache_hit_ratio': seconds(self.cache_hit_ratio),
+            'error': self.error,
+            'cancelled': self.cancelled
+        }
+
+
+class RollingHistogram:
+    """Samples from the last `window` seconds, summarised as percentiles."""
+
+    def __init__(self, window: float = 3600.0, max_samples: int = 4096):
+        self.window = window
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)
+
+    def add(self, value: float):
+        self._samples.append((time.monotonic(), value))
+
+    def summary(self) -> Dict[str, Any]:
+        cutoff = time.monotonic() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        values = sorted(value for _, value in self._samples)
+        if not values:
+            return {'count': 0}
+
+        def percentile(p: float) -> float:
+            return round(values[min(len(values) - 1, int(len(values) * p))], 3)
+
+        return {
+            'count': len(values),
+            'mean': round(sum(values) / len(values), 3),
+            'p50': percentile(0.5),
+            'p90': percentile(0.9),
+            'p99': percentile(0.99),
+            'max': round(values[-1], 3)
+        }
+
+
+# CallMetrics attributes kept as histograms
+_HISTOGRAMS = (
+    'time_to_first_token',
+    'thinking_time',
+    'time_to_first_response',
+    'duration',
+    'tokens_per_second',
+    'prompt_tokens',
+    'completion_tokens',
+    'cache_hit_ratio'
+)
+
+# Token counters summed over all calls
+_TOTALS = (
+    'prompt_tokens',
+    'completion_tokens',
+    'reasoning_tokens',
+    'prompt_cache_hit_tokens',
+    'prompt_cache_miss_tokens'
+)
+
+
+class _ModelStats:
+    def __init__(self, window: float, max_samples: int):
+        self.calls = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.sources: Dict[str, int] = {}
+        self.totals = {name: 0 for name in _TOTALS}
+        self.histograms = {name: RollingHistogram(window, max_samples) for name in _HISTOGRAMS}
+
+
+class MetricsRegistry:
+    """Per-model rolling aggregates of finished calls."""
+
+    def __init__(self, window: float = 3600.0, max_samples: int = 4096):
+        """Initialize the registry.
+
+        Args:
+            window: Seconds of history kept in each histogram.
+            max_samples: Cap on the samples kept per histogram.
+        """
+        self.window = window
+        self.max_samples = max_samples
+        self._models: Dict[str, _ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, metrics: CallMetrics):
+        """Add a finished call to its model's aggregates."""
+        with self._lock:
+            stats = self._models.get(metrics.model)
+            if stats is None:
+                stats = self._models[metrics.model] = _ModelStats(self.window, self.max_samples)
+            stats.calls += 1
+            stats.sources[metrics.source] = stats.sources.get(metrics.source, 0) + 1
+            if metrics.error is not None:
+                stats.errors += 1
+                return
+            if metrics.cancelled:
+                stats.cancelled += 1
+            for name in _TOTALS:
+                stats.totals[name] += getattr(metrics, name) or 0
+            # Cached answers would drag the latency percentiles towards zero
+            if metrics.source != SOURCE_UPSTREAM:
+                return
+            for name, histogram in stats.histograms.items():
+                if metrics.cancelled and name in ('duration', 'tokens_per_second', 'completion_tokens'):
+                    continue
+                value = getattr(metrics, name)
+                if value is not None:
+                    histogram.add(value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, token totals and histogram summaries per model."""
+        with self._lock:
+            result = {}
+            for model, stats in self._models.items():
+                hit = stats.totals['prompt_cache_hit_tokens']
+                miss = stats.totals['prompt_cache_miss_tokens']
+                result[model] = {
+                    'calls': stats.calls,
+                    'errors': stats.errors,
+                    'cancelled': stats.cancelled,
+                    'sources': dict(stats.sources),
+                    'tokens': dict(stats.totals),
+                    'prompt_cache_hit_ratio': round(hit / (hit + miss), 3) if hit + miss else None,
+                    'histograms': {name: histogram.summary() for name, histogram in stats.histograms.items()}
+                }
+            return result
+
+
+class PromptCacheTracker:
+    """Per-chat history of how much of each prompt DeepSeek's prompt cache served."""
+
+    def __init__(self, max_keys: int = 1024, max_turns: int = 100):
+        """Initialize the tracker.
+
+        Args:
+            max_keys: Chats tracked; the least recently updated are forgotten.
+            max_turns: Calls remembered per chat.
+        """
+        self.max_keys = max_keys
+        self.max_turns = max_turns
+        self._turns: "OrderedDict[str, Deque[Tuple[float, int, int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, key: str, metrics: CallMetrics):
+        """Add a call's prompt cache hit and miss tokens, if it reported them."""
+        hit, miss = metrics.prompt_cache_hit_tokens, metrics.prompt_cache_miss_tokens
+        if hit is None or miss is None:
+            return
+        with self._lock:
+            turns = self._turns.get(key)
+            if turns is None:
+                turns = self._turns[key] = deque(maxlen=self.max_turns)
+                if len(self._turns) > self.max_keys:
+                    self._turns.popitem(last=False)
+            else:
+                self._turns.move_to_end(key)
+            turns.append((time.time(), hit, miss))
+
+    @staticmethod
+    def _summary(turns) -> Dict[str, Any]:
+        hit = sum(turn[1] for turn in turns)
+        miss = sum(turn[2] for turn in turns)
+        last_hit, last_miss = turns[-1][1], turns[-1][2]
+        return {
+            'turns': len(turns),
+            'hit_tokens': hit,
+            'miss_tokens': miss,
+            'hit_ratio': round(hit / (hit + miss), 3) if hit + miss else None,
+            'last_hit_ratio': round(last_hit / (last_hit + last_miss), 3) if last_hit + last_miss else None
+        }
+
+    def history(self, key: str) -> Optional[Dict[str, Any]]:
+        """A chat's summary and per-call hit ratios, oldest first; None if unknown."""
+        with self._lock:
+            turns = self._turns.get(key)
+            if not turns:
+                return None
+            return {
+                **self._summary(turns),
+                'calls': [
+                    {
+                        'at': at,
+                        'hit_tokens': hit,
+                        'miss_tokens': miss,
+                        'hit_ratio': round(hit / (hit + miss), 3) if hit + miss else None
+                    }
+                    for at, hit, miss in turns
+                ]
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        """Summary per tracked chat, most recently updated first."""
+        with self._lock:
+            return {key: self._summary(turns) for key, turns in reversed(self._turns.items())}
+
+
+class ChatStream:
+    """A streamed chat response that fills its CallMetrics as it is read.
+
+    The record is complete, and added to the registry, once the stream is
+    exhausted, fails or is closed.
+    """
+
+    def __init__(self, chunks: Iterator[Dict[str, str]], metrics: CallMetrics, registry: Optional[MetricsRegistry] = None):
+        self._chunks = chunks
+        self.metrics = metrics
+        self._registry = registry
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Dict[str, str]:
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._finish()
+            raise
+        except Exception as e:
+            self._finish(error=e)
+            raise
+        self.metrics.mark(chunk)
+        return chunk
+
+    def close(self):
+        """Stop reading; closes the underlying stream and the metrics record."""
+        if hasattr(self._chunks, 'close'):
+            self._chunks.close()
+        self._finish(cancelled=True)
+
+    def _finish(self, error: Optional[BaseException] = None, cancelled: bool = False):
+        if not self.metrics.finished:
+            self.metrics.finish(error, cancelled)
+            if self._registry is not None:
+                self._registry.record(self.metrics)
+
+
+class AsyncChatStream:
+    """Asyncio counterpart of ChatStream."""
+
+    def __init__(self, chunks: AsyncIterator[Dict[str, str]], metrics: CallMetrics, registry: Optional[MetricsRegistry] = None):
+        self._chunks = chunks
+        self.metrics = metrics
+        self._registry = registry
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, str]:
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._finish()
+            raise
+        except Exception as e:
+            self._finish(error=e)
+            raise
+        self.metrics.mark(chunk)
+        return chunk
+
+    async def aclose(self):
+        """Stop reading; closes the underlying stream and the metrics record."""
+        if hasattr(self._chunks, 'aclose'):
+            await self._chunks.aclose()
+        self._finish(cancelled=True)
+
+    def _finish(self, error: Optional[BaseException] = None, cancelled: bool = False):
+        if not self.metrics.finished:
+            self.metrics.finish(error, cancelled)
+            if self._registry is not None:
+                self._registry.record(self.metrics)
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Return the process-wide registry DeepSeekClient records calls into."""
+    return _registry
@@ -0,0 +1,316 @@
+"""
+Process-wide rate limiting of upstream calls with fair queuing.
+
+Two token buckets cap requests per minute and tokens per minute across every
+DeepSeekClient in the process. A request that cannot be admitted at once
+waits in a queue of its own key (a chat, a user, a batch job), and keys are
+served round-robin, so one busy key cannot starve the others however many
+requests it has queued.
+
+Token costs are not known until a response has finished, so a request
+reserves an estimate (prompt plus expected completion) and the ticket is
+settled with the actual count afterwards, refunding or charging the
+difference.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+from src.chat.errors import ThrottledError
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Continuously refilled bucket; the level may go negative to record debt."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0 if it can be now)."""
+        self._refill(now)
+        # A cost above the capacity is admitted once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def give(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class Ticket:
+    """Admission of one upstream request; settle() corrects its token estimate."""
+
+    def __init__(self, limiter: "RateLimiter", key: str, tokens: int, waited: float):
+        self.limiter = limiter
+        self.key = key
+        self.tokens = tokens
+        self.waited = waited
+        self._settled = False
+
+    def settle(self, actual_tokens: int):
+        """Replace the reserved token estimate with the actual usage."""
+        if not self._settled:
+            self._settled = True
+            self.limiter._settle(self.tokens - actual_tokens)
+
+
+class _Waiter:
+    __slots__ = ('key', 'tokens', 'enqueued_at', 'event', 'loop', 'future', 'ticket')
+
+    def __init__(self, key: str, tokens: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.key = key
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.ticket: Optional[Ticket] = None
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limiter with a fair per-key queue."""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_wait: float = 120.0
+    ):
+        """Initialize the limiter.
+
+        Args:
+            requests_per_minute: Request budget, or None for no limit.
+            tokens_per_minute: Token budget (prompt + completion), or None for no limit.
+            max_wait: Default seconds a request may queue before ThrottledError.
+        """
+        self.max_wait = max_wait
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        # Per-key FIFO queues; the first key is served next, then moves to the back
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._waits: Deque[float] = deque(maxlen=500)
+        self._granted = 0
+        self._timeouts = 0
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        wait = 0.0
+        if self._requests is not None:
+            wait = self._requests.wait_time(1, now)
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(tokens, now))
+        return wait
+
+    def _take(self, key: str, tokens: int, waited: float) -> Ticket:
+        if self._requests is not None:
+            self._requests.take(1)
+        if self._tokens is not None:
+            self._tokens.take(tokens)
+        self._granted += 1
+        self._waits.append(waited)
+        return Ticket(self, key, tokens, waited)
+
+    def _settle(self, refund: int):
+        if self._tokens is None or not refund:
+            return
+        with self._cond:
+            if refund > 0:
+                self._tokens.give(refund)
+            else:
+                self._tokens.take(-refund)
+            self._cond.notify_all()
+
+    def _try_fast_path(self, key: str, tokens: int) -> Optional[Ticket]:
+        # Only when nobody is queued, so new arrivals cannot jump the queue
+        if not self._queues and self._wait_time(tokens, time.monotonic()) == 0:
+            return self._take(key, tokens, 0.0)
+        return None
+
+    def _enqueue(self, waiter: _Waiter):
+        self._queues.setdefault(waiter.key, deque()).append(waiter)
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch, daemon=True, name="rate-limiter")
+            self._dispatcher.start()
+        self._cond.notify_all()
+
+    def _remove(self, waiter: _Waiter) -> bool:
+        """Drop a waiter that gave up. Returns False if it was granted meanwhile."""
+        if waiter.ticket is not None:
+            return False
+        queue = self._queues.get(waiter.key)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.key]
+        self._timeouts += 1
+        self._cond.notify_all()
+        return True
+
+    def acquire(self, key: str = "default", tokens: int = 0, timeout: Optional[float] = None) -> Ticket:
+        """Block until a request costing `tokens` may be sent.
+
+        Args:
+            key: Fairness key; keys are served round-robin.
+            tokens: Estimated tokens of the request (prompt plus completion).
+            timeout: Seconds to wait; defaults to max_wait.
+
+        Raises:
+            ThrottledError: If the request could not be admitted in time.
+        """
+        timeout = self.max_wait if timeout is None else timeout
+        with self._cond:
+            ticket = self._try_fast_path(key, tokens)
+            if ticket is not None:
+                return ticket
+            waiter = _Waiter(key, tokens)
+            self._enqueue(waiter)
+        if not waiter.event.wait(timeout):
+            with self._cond:
+                if self._remove(waiter):
+                    raise self._throttled(waiter, timeout)
+        return waiter.ticket
+
+    async def acquire_async(self, key: str = "default", tokens: int = 0, timeout: Optional[float] = None) -> Ticket:
+        """Asyncio counterpart of acquire(); waits without blocking the event loop."""
+        timeout = self.max_wait if timeout is None else timeout
+        with self._cond:
+            ticket = self._try_fast_path(key, tokens)
+            if ticket is not None:
+                return ticket
+            waiter = _Waiter(key, tokens, asyncio.get_running_loop())
+            self._enqueue(waiter)
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._cond:
+                removed = self._remove(waiter)
+            if not removed:
+                # Granted as we gave up: return the request budget
+                waiter.ticket.settle(0)
+                if self._requests is not None:
+                    with self._cond:
+                        self._requests.give(1)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._throttled(waiter, timeout)
+
+    def _throttled(self, waiter: _Waiter, timeout: float) -> ThrottledError:
+        retry_after = self.estimated_wait(waiter.tokens)
+        logger.warning(
+            f"Rate limiter could not admit a request for {waiter.key} within {timeout:.1f}s "
+            f"({self.queue_depth()} queued)"
+        )
+        return ThrottledError(
+            f"Too many requests in flight, gave up after waiting {timeout:.1f}s",
+            retry_after=retry_after
+        )
+
+    def _grant(self, waiter: _Waiter, ticket: Ticket):
+        waiter.ticket = ticket
+        if waiter.loop is None:
+            waiter.event.set()
+        else:
+            waiter.loop.call_soon_threadsafe(
+                lambda: waiter.future.done() or waiter.future.set_result(ticket)
+            )
+
+    def _dispatch(self):
+        with self._cond:
+            while True:
+                if not self._queues:
+                    self._cond.wait()
+                    continue
+                key, queue = next(iter(self._queues.items()))
+                waiter = queue[0]
+                now = time.monotonic()
+                wait = self._wait_time(waiter.tokens, now)
+                if wait > 0:
+                    # Woken early by new arrivals, settlements or give-ups
+                    self._cond.wait(wait)
+                    continue
+                queue.popleft()
+                if queue:
+                    self._queues.move_to_end(key)
+                else:
+                    del self._queues[key]
+                self._grant(waiter, self._take(key, waiter.tokens, now - waiter.enqueued_at))
+
+    def queue_depth(self) -> int:
+        """Number of requests waiting for admission."""
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def estimated_wait(self, tokens: int = 0) -> float:
+        """Rough seconds until a new request costing `tokens` would be admitted."""
+        with self._cond:
+            queued = [waiter for queue in self._queues.values() for waiter in queue]
+            now = time.monotonic()
+            wait = 0.0
+            if self._requests is not None:
+                self._requests._refill(now)
+                wait = max(0.0, len(queued) + 1 - self._requests.level) / self._requests.rate
+            if self._tokens is not None:
+                self._tokens._refill(now)
+                pending = sum(waiter.tokens for waiter in queued) + min(tokens, self._tokens.capacity)
+                wait = max(wait, max(0.0, pending - self._tokens.level) / self._tokens.rate)
+            return wait
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth per key, wait times and remaining budgets."""
+        with self._cond:
+            waits = sorted(self._waits)
+            now = time.monotonic()
+            queues = {key: len(queue) for key, queue in self._queues.items()}
+            oldest = min(
+                (queue[0].enqueued_at for queue in self._queues.values() if queue),
+                default=None
+            )
+            if self._requests is not None:
+                self._requests._refill(now)
+            if self._tokens is not None:
+                self._tokens._refill(now)
+            return {
+                'queue_depth': sum(queues.values()),
+                'queues': queues,
+                'oldest_wait': now - oldest if oldest is not None else 0.0,
+                'granted': self._granted,
+                'timeouts': self._timeouts,
+                'wait_p50': waits[len(waits) // 2] if waits else 0.0,
+                'wait_p95': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                'requests_available': self._requests.level if self._requests else None,
+                'tokens_available': self._tokens.level if self._tokens else None
+            }
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(settings) -> Optional[RateLimiter]:
+    """Return the process-wide limiter from RateLimitSettings, or None if disabled."""
+    global _limiter
+    if not settings.enabled:
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(settings.requests_per_minute, settings.tokens_per_minute, settings.max_wait)
+        return _limiter
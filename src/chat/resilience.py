@@ -0,0 +1,509 @@
+"""
+Retries, hedged requests and circuit breaking for DeepSeek API calls.
+
+An upstream call is retried with jittered exponential backoff when it fails
+with a retryable error, waiting at least as long as the server's
+Retry-After asks. For streams, an attempt only counts as successful once
+the first chunk has arrived; after that the stream is handed to the caller
+and a later failure surfaces as StreamInterruptedError instead of a silent
+retry.
+
+Optionally, an attempt whose first chunk is slower than a percentile of
+recent time-to-first-token samples is hedged: a second identical request is
+started and whichever answers first wins, the other is closed.
+
+A circuit breaker per endpoint, shared by every client in the process,
+fails calls fast while the service keeps failing and lets a single probe
+through once the recovery timeout has passed.
+"""
+
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+from src.chat.errors import DeepSeekError, CircuitOpenError, StreamInterruptedError, classify
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Attempts racing a hedge run here; the caller waits for whichever finishes first
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="deepseek-hedge")
+
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff."""
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    multiplier: float = 2.0
+    max_retry_after: float = 60.0  # Longer Retry-After values fail instead of waiting
+
+    def delay(self, attempt: int, error: DeepSeekError) -> Optional[float]:
+        """Seconds to wait before retrying after failed attempt `attempt`, or None to give up."""
+        if not error.retryable or attempt >= self.max_attempts:
+            return None
+        # Full jitter keeps clients that failed together from retrying together
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1)))
+        if error.retry_after is not None:
+            if error.retry_after > self.max_retry_after:
+                return None
+            return max(backoff, error.retry_after)
+        return backoff
+
+
+class CircuitBreaker:
+    """Fail fast while an endpoint keeps failing.
+
+    Closed: calls go through and consecutive failures are counted. Open:
+    calls fail immediately until `recovery_timeout` has passed. Half open:
+    one probe call goes through; its success closes the circuit, its
+    failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through (0 if it is not open)."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self.recovery_timeout - (time.monotonic() - self._opened_at)
+            if self._state == self.OPEN and remaining <= 0:
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                logger.info(f"Circuit {self.name} half open, sending a probe request")
+                return
+            self._rejected += 1
+        raise CircuitOpenError(
+            f"DeepSeek API is failing, not calling {self.name} for now",
+            retry_after=max(0.0, remaining)
+        )
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, error: DeepSeekError):
+        """Count a failed call; only errors that indicate an unhealthy service count."""
+        with self._lock:
+            if not error.degrades_service:
+                # The service answered; a probe that got a 4xx still proves it is up
+                if self._state == self.HALF_OPEN:
+                    self._state = self.CLOSED
+                    self._failures = 0
+                self._probing = False
+                return
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit {self.name} opened after {self._failures} consecutive failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'rejected': self._rejected
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint: str, failure_threshold: int = 5, recovery_timeout: float = 30.0) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for an endpoint."""
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(endpoint, failure_threshold, recovery_timeout)
+            _breakers[endpoint] = breaker
+        return breaker
+
+
+class LatencyTracker:
+    """Rolling window of latency samples with percentile queries."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The q-quantile (0..1) of the window, or None without samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+@dataclass
+class HedgePolicy:
+    """When to start a second, racing attempt."""
+    percentile: float = 0.95  # Hedge attempts slower than this quantile of recent first-chunk latencies
+    min_samples: int = 20  # Do not hedge until this many latencies have been seen
+    min_delay: float = 1.0  # Never hedge sooner than this
+
+    def threshold(self, tracker: LatencyTracker) -> Optional[float]:
+        """Seconds to wait before hedging, or None if there is not enough data yet."""
+        if len(tracker) < self.min_samples:
+            return None
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+
+class _Opened:
+    """A stream whose first chunk has arrived."""
+
+    def __init__(self, first: Any, iterator: Any, empty: bool = False):
+        self.first = first
+        self.iterator = iterator
+        self.empty = empty
+
+
+class Resilience:
+    """Run upstream calls with retries, hedging and a circuit breaker."""
+
+    def __init__(
+        self,
+        retry: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge: Optional[HedgePolicy] = None
+    ):
+        """Initialize the layer.
+
+        Args:
+            retry: Backoff policy; defaults to three attempts.
+            breaker: Circuit breaker of the endpoint, or None to never fail fast.
+            hedge: Hedging policy, or None to never hedge.
+        """
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker
+        self.hedge = hedge
+        # First-chunk latency of streams and full latency of plain calls differ wildly
+        self.stream_latency = LatencyTracker()
+        self.call_latency = LatencyTracker()
+        self._retries = 0
+        self._hedges = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Retry and hedge counters and latency percentiles."""
+        return {
+            'retries': self._retries,
+            'hedges': self._hedges,
+            'ttft_p50': self.stream_latency.percentile(0.5),
+            'ttft_p95': self.stream_latency.percentile(0.95),
+            'circuit': self.breaker.stats() if self.breaker else None
+        }
+
+    # Synchronous API
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        """Run a non-streamed call `fn()` with retries and return its result."""
+        return self._run(lambda: self._timed(fn, self.call_latency), self.call_latency, None)
+
+    def stream(self, open_stream: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """Open a stream with retries; returns an iterator that starts with its first chunk."""
+        opened = self._run(lambda: self._open(open_stream), self.stream_latency, self._close_opened)
+        return self._follow(opened)
+
+    def _timed(self, fn: Callable[[], Any], tracker: LatencyTracker) -> Any:
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            raise classify(e)
+        tracker.add(time.monotonic() - start)
+        return result
+
+    def _open(self, open_stream: Callable[[], Iterator[Any]]) -> _Opened:
+        start = time.monotonic()
+        iterator = None
+        try:
+            iterator = open_stream()
+            first = next(iterator)
+        except StopIteration:
+            return _Opened(None, iterator, empty=True)
+        except Exception as e:
+            if iterator is not None:
+                iterator.close()
+            raise classify(e)
+        self.stream_latency.add(time.monotonic() - start)
+        return _Opened(first, iterator)
+
+    @staticmethod
+    def _close_opened(opened: _Opened):
+        opened.iterator.close()
+
+    def _follow(self, opened: _Opened) -> Iterator[Any]:
+        if opened.empty:
+            return
+        emitted = 0
+        try:
+            yield opened.first
+            emitted += 1
+            for chunk in opened.iterator:
+                yield chunk
+                emitted += 1
+        except Exception as e:
+            error = classify(e)
+            if self.breaker is not None:
+                self.breaker.record_failure(error)
+            raise StreamInterruptedError(
+                f"Stream from DeepSeek API failed after {emitted} chunks: {error}",
+                status_code=error.status_code
+            ) from e
+        finally:
+            opened.iterator.close()
+
+    def _run(self, attempt: Callable[[], Any], tracker: LatencyTracker, discard: Optional[Callable[[Any], None]]) -> Any:
+        attempt_number = 0
+        while True:
+            attempt_number += 1
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = self._hedged(attempt, tracker, discard)
+            except DeepSeekError as error:
+                if self.breaker is not None:
+                    self.breaker.record_failure(error)
+                delay = self.retry.delay(attempt_number, error)
+                if delay is None:
+                    raise
+                self._retries += 1
+                logger.warning(f"Attempt {attempt_number} failed ({error}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    def _hedged(self, attempt: Callable[[], Any], tracker: LatencyTracker, discard: Optional[Callable[[Any], None]]) -> Any:
+        threshold = self.hedge.threshold(tracker) if self.hedge else None
+        if threshold is None:
+            return attempt()
+        primary = _hedge_pool.submit(attempt)
+        try:
+            return primary.result(timeout=threshold)
+        except FutureTimeoutError:
+            pass
+        self._hedges += 1
+        logger.debug(f"No response after {threshold:.2f}s, hedging with a second request")
+        pending = {primary, _hedge_pool.submit(attempt)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is None:
+                error = next(iter(done)).exception()
+                continue
+            # Close the losing attempt as soon as it has produced something
+            for future in (done | pending) - {winner}:
+                if discard is not None:
+                    future.add_done_callback(
+                        lambda f: discard(f.result()) if f.exception() is None else None
+                    )
+            return winner.result()
+        raise error
+
+    # Asyncio API
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Asyncio counterpart of call(); `fn` is a coroutine function."""
+        return await self._arun(lambda: self._atimed(fn, self.call_latency), self.call_latency, None)
+
+    async def astream(self, open_stream: Callable[[], Awaitable[AsyncIterator[Any]]]) -> AsyncIterator[Any]:
+        """Asyncio counterpart of stream(); `open_stream` is a coroutine function."""
+        opened = await self._arun(lambda: self._aopen(open_stream), self.stream_latency, self._aclose_opened)
+        return self._afollow(opened)
+
+    async def _atimed(self, fn: Callable[[], Awaitable[Any]], tracker: LatencyTracker) -> Any:
+        start = time.monotonic()
+        try:
+            result = await fn()
+        except Exception as e:
+            raise classify(e)
+        tracker.add(time.monotonic() - start)
+        return result
+
+    async def _aopen(self, open_stream: Callable[[], Awaitable[AsyncIterator[Any]]]) -> _Opened:
+        start = time.monotonic()
+        iterator = None
+        try:
+            iterator = await open_stream()
+            first = await iterator.__anext__()
+        except StopAsyncIteration:
+            return _Opened(None, iterator, empty=True)
+        except asyncio.CancelledError:
+            # Lost a hedge race
+            if iterator is not None:
+                await iterator.aclose()
+            raise
+        except Exception as e:
+            if iterator is not None:
+                await iterator.aclose()
+            raise classify(e)
+        self.stream_latency.add(time.monotonic() - start)
+        return _Opened(first, iterator)
+
+    @staticmethod
+    async def _aclose_opened(opened: _Opened):
+        await opened.iterator.aclose()
+
+    async def _afollow(self, opened: _Opened) -> AsyncIterator[Any]:
+        if opened.empty:
+            return
+        emitted = 0
+        try:
+            yield opened.first
+            emitted += 1
+            async for chunk in opened.iterator:
+                yield chunk
+                emitted += 1
+        except Exception as e:
+            error = classify(e)
+            if self.breaker is not None:
+                self.breaker.record_failure(error)
+            raise StreamInterruptedError(
+                f"Stream from DeepSeek API failed after {emitted} chunks: {error}",
+                status_code=error.status_code
+            ) from e
+        finally:
+            await opened.iterator.aclose()
+
+    async def _arun(self, attempt: Callable[[], Awaitable[Any]], tracker: LatencyTracker, discard) -> Any:
+        attempt_number = 0
+        while True:
+            attempt_number += 1
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = await self._ahedged(attempt, tracker, discard)
+            except DeepSeekError as error:
+                if self.breaker is not None:
+                    self.breaker.record_failure(error)
+                delay = self.retry.delay(attempt_number, error)
+                if delay is None:
+                    raise
+                self._retries += 1
+                logger.warning(f"Attempt {attempt_number} failed ({error}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    async def _ahedged(self, attempt: Callable[[], Awaitable[Any]], tracker: LatencyTracker, discard) -> Any:
+        threshold = self.hedge.threshold(tracker) if self.hedge else None
+        if threshold is None:
+            return await attempt()
+        primary = asyncio.ensure_future(attempt())
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done:
+            return primary.result()
+        self._hedges += 1
+        logger.debug(f"No response after {threshold:.2f}s, hedging with a second request")
+        pending = {primary, asyncio.ensure_future(attempt())}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if task.exception() is None), None)
+            if winner is None:
+                error = next(iter(done)).exception()
+                continue
+            for task in done - {winner}:
+                if discard is not None and task.exception() is None:
+                    await discard(task.result())
+            for task in pending:
+                # The slower request is no longer needed
+                task.cancel()
+            return winner.result()
+        raise error
+
+
+_layers: Dict[str, Resilience] = {}
+
+
+def get_resilience(settings, endpoint: str) -> Resilience:
+    """Return the process-wide resilience layer for an endpoint, built from ResilienceSettings.
+
+    Sharing it between clients pools their latency samples for hedging.
+    """
+    with _breakers_lock:
+        layer = _layers.get(endpoint)
+    if layer is None:
+        layer = create_resilience(settings, endpoint)
+        with _breakers_lock:
+            layer = _layers.setdefault(endpoint, layer)
+    return layer
+
+
+def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    """Retry, hedge and circuit breaker statistics of every endpoint."""
+    with _breakers_lock:
+        layers = dict(_layers)
+    return {endpoint: layer.stats() for endpoint, layer in layers.items()}
+
+
+def create_resilience(settings, endpoint: str) -> Resilience:
+    """Create a resilience layer for an endpoint from ResilienceSettings."""
+    breaker = None
+    if settings.breaker_failure_threshold:
+        breaker = get_circuit_breaker(endpoint, settings.breaker_failure_threshold, settings.breaker_recovery_timeout)
+    hedge = None
+    if settings.hedge:
+        hedge = HedgePolicy(settings.hedge_percentile, settings.hedge_min_samples, settings.hedge_min_delay)
+    return Resilience(
+        retry=RetryPolicy(settings.max_attempts, settings.base_delay, settings.max_delay),
+        breaker=breaker,
+        hedge=hedge
+    )
@@ -0,0 +1,301 @@
+"""
+Near-duplicate prompt cache built on MinHash signatures and LSH.
+
+Many questions are rewordings of earlier ones, which an exact-hash cache
+misses. Each cached prompt is reduced to a MinHash signature of its
+character shingles and indexed in locality-sensitive hash bands, so finding
+candidates costs a few dictionary lookups instead of a scan. A candidate is
+accepted when the estimated Jaccard similarity of the two prompts reaches
+the threshold.
+
+Only standalone prompts are cached: a single user message, optionally
+preceded by system messages. Answers that depend on earlier turns do not
+transfer to another conversation. Prompts also only match within the same
+model, system prompt, sampling parameters and set of numbers, so "what is
+2 + 2" never answers "what is 2 + 3".
+"""
+
+import re
+import time
+import json
+import zlib
+import random
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+from src.chat.cache import CachedResponse, record_stream, arecord_stream
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+MODE_RETURN = "return"  # Answer from the cache as if the model had replied
+MODE_SUGGEST = "suggest"  # Still ask the model; offer the cached answer alongside
+SUPPORTED_MODES = (MODE_RETURN, MODE_SUGGEST)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Case-fold and strip punctuation and extra whitespace."""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = _PUNCTUATION_RE.sub(' ', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def shingles(text: str, size: int = 4) -> Set[int]:
+    """Hashes of the overlapping character n-grams of normalised text."""
+    text = normalize(text)
+    if len(text) <= size:
+        return {zlib.crc32(text.encode('utf-8'))}
+    return {zlib.crc32(text[i:i + size].encode('utf-8')) for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """Compute fixed-length MinHash signatures of shingle sets."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, values: Set[int]) -> Tuple[int, ...]:
+        """MinHash signature; the fraction of equal slots estimates Jaccard similarity."""
+        return tuple(
+            min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH for value in values)
+            for a, b in self._perms
+        )
+
+
+@dataclass
+class SimilarMatch:
+    """A cached answer to a prompt similar to the one asked."""
+    prompt: str
+    response: CachedResponse
+    similarity: float
+
+
+@dataclass
+class _Entry:
+    scope: str
+    prompt: str
+    signature: Tuple[int, ...]
+    bands: List[int]
+    response: CachedResponse
+    created_at: float
+
+
+def standalone_prompt(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """The user prompt of a request without earlier turns, or None."""
+    turns = [msg for msg in messages if msg.get('role') != 'system']
+    if len(turns) != 1 or turns[0].get('role') != 'user':
+        return None
+    content = turns[0].get('content')
+    return content if isinstance(content, str) and content.strip() else None
+
+
+class SimilarityCache:
+    """Bounded LSH index of recent standalone prompts and their answers."""
+
+    def __init__(
+        self,
+        threshold: float = 0.75,
+        num_perm: int = 64,
+        bands: int = 16,
+        max_entries: int = 2048,
+        ttl: float = 24 * 3600.0,
+        mode: str = MODE_SUGGEST,
+        max_prompt_chars: int = 4096
+    ):
+        """Initialize the cache.
+
+        Args:
+            threshold: Minimum estimated Jaccard similarity of two prompts' shingles.
+            num_perm: MinHash signature length; must be divisible by `bands`.
+            bands: LSH bands. More bands find less similar candidates.
+            max_entries: Prompts kept; the least recently used are evicted.
+            ttl: Seconds an answer stays usable.
+            mode: "return" to answer from the cache, "suggest" to only offer it.
+            max_prompt_chars: Longer prompts (e.g. with whole files inlined) are
+                neither looked up nor indexed, since hashing them would stall the request.
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        if mode not in SUPPORTED_MODES:
+            raise ValueError(f"Unsupported similarity cache mode: {mode}")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.mode = mode
+        self.max_prompt_chars = max_prompt_chars
+        self.hasher = MinHasher(num_perm)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[int, Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hits = 0
+        self._evictions = 0
+        self._skipped = 0
+
+    def _prompt(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """The standalone prompt of a request, if it is short enough to hash."""
+        prompt = standalone_prompt(messages)
+        if prompt is not None and len(prompt) > self.max_prompt_chars:
+            with self._lock:
+                self._skipped += 1
+            return None
+        return prompt
+
+    @staticmethod
+    def _scope(model: str, messages: List[Dict[str, Any]], prompt: str, params: Dict[str, Any]) -> str:
+        """Everything besides the prompt's wording that must match exactly."""
+        system = [msg.get('content') for msg in messages if msg.get('role') == 'system']
+        params = {name: value for name, value in params.items() if value is not None}
+        payload = json.dumps(
+            [model, system, params, sorted(_NUMBER_RE.findall(prompt))],
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _bands(self, scope: str, signature: Tuple[int, ...]) -> List[int]:
+        return [
+            hash((scope, band, signature[band * self.rows:(band + 1) * self.rows]))
+            for band in range(self.bands)
+        ]
+
+    def _similarity(self, a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+        return sum(x == y for x, y in zip(a, b)) / len(a)
+
+    def lookup(self, model: str, messages: List[Dict[str, Any]], **params) -> Optional[SimilarMatch]:
+        """Find the cached answer to the most similar earlier prompt, if close enough."""
+        prompt = self._prompt(messages)
+        if prompt is None:
+            return None
+        scope = self._scope(model, messages, prompt, params)
+        signature = self.hasher.signature(shingles(prompt))
+        now = time.time()
+        with self._lock:
+            self._lookups += 1
+            candidates = set()
+            for band in self._bands(scope, signature):
+                candidates.update(self._buckets.get(band, ()))
+            best_id, best = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if now - entry.created_at > self.ttl:
+                    continue
+                similarity = self._similarity(signature, entry.signature)
+                if similarity >= self.threshold and similarity > best:
+                    best_id, best = entry_id, similarity
+            if best_id is None:
+                return None
+            self._entries.move_to_end(best_id)
+            self._hits += 1
+            entry = self._entries[best_id]
+            return SimilarMatch(entry.prompt, entry.response, best)
+
+    def add(self, model: str, messages: List[Dict[str, Any]], response: CachedResponse, **params):
+        """Index the answer to a standalone prompt; other requests are ignored."""
+        prompt = self._prompt(messages)
+        if prompt is None or not response.text:
+            return
+        scope = self._scope(model, messages, prompt, params)
+        signature = self.hasher.signature(shingles(prompt))
+        bands = self._bands(scope, signature)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(scope, prompt, signature, bands, response, time.time())
+            for band in bands:
+                self._buckets.setdefault(band, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def record(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        stream: Iterator[Dict[str, str]],
+        **params
+    ) -> Iterator[Dict[str, str]]:
+        """Pass a live stream through, indexing it once it completes."""
+        return record_stream(stream, lambda response: self.add(model, messages, response, **params))
+
+    def arecord(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        stream: AsyncIterator[Dict[str, str]],
+        **params
+    ) -> AsyncIterator[Dict[str, str]]:
+        """Asyncio counterpart of record()."""
+        return arecord_stream(stream, lambda response: self.add(model, messages, response, **params))
+
+    def _evict(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band]
+        self._evictions += 1
+
+    def expire(self) -> int:
+        """Evict answers older than the TTL. Returns the number removed."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [entry_id for entry_id, entry in self._entries.items() if entry.created_at < cutoff]
+            for entry_id in expired:
+                self._evict(entry_id)
+        return len(expired)
+
+    def clear(self):
+        """Drop every cached prompt."""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Occupancy and hit counters."""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'buckets': len(self._buckets),
+                'lookups': self._lookups,
+                'hits': self._hits,
+                'evictions': self._evictions,
+                'skipped': self._skipped,
+                'hit_rate': self._hits / self._lookups if self._lookups else 0.0
+            }
+
+
+def create_similarity_cache(settings) -> Optional[SimilarityCache]:
+    """Create a cache from SimilarityCacheSettings, or None if it is disabled."""
+    if not settings.enabled:
+        return None
+    return SimilarityCache(
+        threshold=settings.threshold,
+        num_perm=settings.num_perm,
+        bands=settings.bands,
+        max_entries=settings.max_entries,
+        ttl=settings.ttl,
+        mode=settings.mode,
+        max_prompt_chars=settings.max_prompt_chars
+    )
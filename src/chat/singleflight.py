@@ -0,0 +1,281 @@
+"""
+Single-flight coalescing of identical in-flight chat requests.
+
+When several chats or workers send the same request at the same time, only
+the first opens an upstream call. Its chunks are buffered and fanned out to
+every subscriber; a subscriber that joins late first receives the buffered
+prefix, then follows the live tail. The upstream call is cancelled only
+when the last subscriber detaches before it finishes.
+"""
+
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One upstream call shared by its subscribers (thread-based)."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cancelled = threading.Event()
+        self.cond = threading.Condition()
+
+
+class _Subscription:
+    """Iterator over a flight's chunks from the start; close() detaches."""
+
+    def __init__(self, group: "SingleFlight", flight: _Flight):
+        self._group = group
+        self._flight = flight
+        self._index = 0
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        flight = self._flight
+        with flight.cond:
+            flight.cond.wait_for(lambda: self._index < len(flight.chunks) or flight.done)
+            if self._index < len(flight.chunks):
+                chunk = flight.chunks[self._index]
+                self._index += 1
+                return chunk
+            error = flight.error
+        self.close()
+        if error is not None:
+            raise error
+        raise StopIteration
+
+    def close(self):
+        """Detach; the upstream is cancelled if this was the last subscriber."""
+        if not self._closed:
+            self._closed = True
+            self._group._detach(self._flight)
+
+    def __del__(self):
+        self.close()
+
+
+class SingleFlight:
+    """Coalesce identical concurrent requests onto one upstream call."""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        # asyncio flights are bound to the event loop that started them
+        self._async_flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, _AsyncFlight]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+        self._started = 0
+        self._joined = 0
+        self._cancelled = 0
+
+    def stream(self, key: str, start: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """Subscribe to the flight for `key`, starting it with `start()` if none is running.
+
+        Args:
+            key: Identity of the request; equal keys share one upstream call.
+            start: Opens the upstream stream. Called on a producer thread.
+
+        Returns:
+            An iterator over every chunk of the response. Closing it detaches.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight(key)
+                self._flights[key] = flight
+                self._started += 1
+                threading.Thread(target=self._produce, args=(flight, start), daemon=True).start()
+            else:
+                self._joined += 1
+                logger.debug(f"Joining in-flight request {key[:12]} with {flight.subscribers} subscriber(s)")
+            flight.subscribers += 1
+        return _Subscription(self, flight)
+
+    def call(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run `fn()` once for all concurrent callers with the same key and share its result."""
+        subscription = self.stream(key, lambda: iter([fn()]))
+        try:
+            return next(subscription)
+        finally:
+            subscription.close()
+
+    def _produce(self, flight: _Flight, start: Callable[[], Iterator[Any]]):
+        stream = None
+        try:
+            stream = start()
+            for chunk in stream:
+                if flight.cancelled.is_set():
+                    break
+                with flight.cond:
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            if stream is not None and hasattr(stream, 'close'):
+                # Stops the upstream HTTP stream if we broke out early
+                stream.close()
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _detach(self, flight: _Flight):
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers or flight.done:
+                return
+            # Nobody is reading any more: stop paying for the generation, and
+            # let the next identical request start a fresh call
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            self._cancelled += 1
+        logger.debug(f"Cancelling in-flight request {flight.key[:12]}: no subscribers left")
+        flight.cancelled.set()
+
+    def astream(self, key: str, start: Callable[[], Any]) -> AsyncIterator[Any]:
+        """Asyncio counterpart of stream().
+
+        Args:
+            key: Identity of the request.
+            start: Coroutine function returning the upstream async iterator.
+                Runs as a task on the current event loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flights = self._async_flights.setdefault(loop, {})
+            flight = flights.get(key)
+            if flight is None:
+                flight = _AsyncFlight(key, flights)
+                flights[key] = flight
+                self._started += 1
+                flight.task = loop.create_task(self._aproduce(flight, start))
+            else:
+                self._joined += 1
+            flight.subscribers += 1
+        return _AsyncSubscription(self, flight)
+
+    async def acall(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Asyncio counterpart of call(); `fn` is a coroutine function."""
+        async def start():
+            result = await fn()
+
+            async def single():
+                yield result
+            return single()
+
+        subscription = self.astream(key, start)
+        try:
+            return await subscription.__anext__()
+        finally:
+            await subscription.aclose()
+
+    async def _aproduce(self, flight: "_AsyncFlight", start: Callable[[], Any]):
+        stream = None
+        try:
+            stream = await start()
+            async for chunk in stream:
+                flight.chunks.append(chunk)
+                flight.changed.set()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            flight.error = e
+        finally:
+            if stream is not None and hasattr(stream, 'aclose'):
+                await stream.aclose()
+            self._aremove(flight)
+            flight.done = True
+            flight.changed.set()
+
+    def _aremove(self, flight: "_AsyncFlight"):
+        with self._lock:
+            if flight.flights.get(flight.key) is flight:
+                del flight.flights[flight.key]
+
+    def _adetach(self, flight: "_AsyncFlight"):
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers or flight.done:
+                return
+            self._cancelled += 1
+        logger.debug(f"Cancelling in-flight request {flight.key[:12]}: no subscribers left")
+        self._aremove(flight)
+        flight.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        """Flight counters: upstream calls started, requests coalesced and calls cancelled."""
+        with self._lock:
+            return {
+                'in_flight': len(self._flights) + sum(len(flights) for flights in self._async_flights.values()),
+                'started': self._started,
+                'coalesced': self._joined,
+                'cancelled': self._cancelled
+            }
+
+
+class _AsyncFlight:
+    """One upstream call shared by its subscribers (asyncio)."""
+
+    def __init__(self, key: str, flights: Dict[str, "_AsyncFlight"]):
+        self.key = key
+        self.flights = flights  # The owning event loop's flight map
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        # Set whenever chunks are appended or the flight ends
+        self.changed = asyncio.Event()
+
+
+class _AsyncSubscription:
+    """Async iterator over a flight's chunks from the start; aclose() detaches."""
+
+    def __init__(self, group: SingleFlight, flight: _AsyncFlight):
+        self._group = group
+        self._flight = flight
+        self._index = 0
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        flight = self._flight
+        while not self._closed:
+            if self._index < len(flight.chunks):
+                chunk = flight.chunks[self._index]
+                self._index += 1
+                return chunk
+            if flight.done:
+                await self.aclose()
+                if flight.error is not None:
+                    raise flight.error
+                break
+            flight.changed.clear()
+            await flight.changed.wait()
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        """Detach; the upstream is cancelled if this was the last subscriber."""
+        if not self._closed:
+            self._closed = True
+            self._group._adetach(self._flight)
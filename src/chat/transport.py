@@ -0,0 +1,135 @@
+"""
+Process-wide HTTP transport shared by every DeepSeek client.
+
+Building an OpenAI client per chat also builds a fresh connection pool, so
+every new chat pays TCP and TLS setup again. The pools here are created once
+and handed to every client in the process, keeping connections warm and the
+number of open sockets bounded.
+"""
+
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Dict, Optional
+
+import httpx
+from openai import DefaultHttpxClient, DefaultAsyncHttpxClient
+
+from src.config.settings import transport_settings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+# httpx async clients are bound to the event loop they were first used on
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_request_count = 0
+
+
+def _count_request(request: httpx.Request):
+    global _request_count
+    _request_count += 1
+
+
+async def _acount_request(request: httpx.Request):
+    _count_request(request)
+
+
+def _client_options() -> Dict:
+    """Build httpx keyword arguments from the transport settings."""
+    http2 = transport_settings.http2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed, falling back to HTTP/1.1")
+            http2 = False
+    return {
+        'limits': httpx.Limits(
+            max_connections=transport_settings.max_connections,
+            max_keepalive_connections=transport_settings.max_keepalive_connections,
+            keepalive_expiry=transport_settings.keepalive_expiry
+        ),
+        'timeout': httpx.Timeout(transport_settings.timeout, connect=10.0),
+        'http2': http2,
+    }
+
+
+def get_http_client() -> httpx.Client:
+    """Return the shared synchronous HTTP client, creating it on first use."""
+    global _http_client
+    with _lock:
+        if _http_client is None or _http_client.is_closed:
+            options = _client_options()
+            _http_client = DefaultHttpxClient(
+                event_hooks={'request': [_count_request]},
+                **options
+            )
+            logger.debug(f"Created shared HTTP pool (max_connections={transport_settings.max_connections}, http2={options['http2']})")
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the shared asynchronous HTTP client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_http_clients.get(loop)
+        if client is None or client.is_closed:
+            client = DefaultAsyncHttpxClient(
+                event_hooks={'request': [_acount_request]},
+                **_client_options()
+            )
+            _async_http_clients[loop] = client
+            logger.debug("Created shared async HTTP pool for event loop")
+        return client
+
+
+def _connection_stats(client) -> Dict[str, int]:
+    """Count open and idle connections in a client's pool."""
+    stats = {'connections': 0, 'idle': 0}
+    pool = getattr(getattr(client, '_transport', None), '_pool', None)
+    for connection in getattr(pool, 'connections', []):
+        stats['connections'] += 1
+        try:
+            if connection.is_idle():
+                stats['idle'] += 1
+        except Exception:
+            pass
+    return stats
+
+
+def pool_stats() -> Dict:
+    """Return statistics about the shared connection pools."""
+    sync_stats = _connection_stats(_http_client) if _http_client is not None else {'connections': 0, 'idle': 0}
+    async_connections = 0
+    async_idle = 0
+    for client in list(_async_http_clients.values()):
+        stats = _connection_stats(client)
+        async_connections += stats['connections']
+        async_idle += stats['idle']
+    return {
+        'requests': _request_count,
+        'sync': sync_stats,
+        'async': {
+            'pools': len(_async_http_clients),
+            'connections': async_connections,
+            'idle': async_idle
+        },
+        'limits': {
+            'max_connections': transport_settings.max_connections,
+            'max_keepalive_connections': transport_settings.max_keepalive_connections,
+            'keepalive_expiry': transport_settings.keepalive_expiry,
+            'http2': transport_settings.http2
+        }
+    }
+
+
+def close_http_clients():
+    """Close the shared synchronous pool. Async pools close with their loop."""
+    global _http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
@@ -18,6 +18,76 @@ class ChatSettings:
     max_tokens: Optional[int] = None
     stream: bool = True
     system_message: str = "You are a helpful AI assistant with reasoning capabilities. When appropriate, you can search the internet to provide up-to-date information."
+    # Prompt token budget: the 64K context minus room for the reply; None sends everything
+    context_token_budget: Optional[int] = 56000
+    # Share one upstream call between identical requests that are in flight at the same time
+    coalesce_requests: bool = False
+    # "inline" splices new uploads into the user message; "stable" sends the system
+    # message, then pinned files, then the history, so the prompt prefix is byte-stable
+    # between turns and served from DeepSeek's prompt cache
+    prompt_layout: str = "inline"
+
+@dataclass
+class CompactionSettings:
+    """Settings for summarising older turns of long conversations."""
+    enabled: bool = False
+    model: str = "deepseek-chat"  # Cheaper model used for summaries
+    threshold_tokens: int = 24000  # Compact once unsummarised history exceeds this
+    keep_recent: int = 6  # Newest messages that are never summarised
+    summary_max_tokens: int = 1024
+
+@dataclass
+class ResponseCacheSettings:
+    """Settings for the exact-match response cache."""
+    enabled: bool = False
+    cache_dir: Optional[str] = "chat_history/response_cache"  # None keeps the cache in memory only
+    max_entries: int = 512  # Responses kept in memory
+    ttl: float = 3600.0  # Seconds a response stays valid in memory
+    disk_ttl: float = 7 * 24 * 3600.0  # Seconds a response stays valid on disk
+    replay_pace: float = 0.0  # 0 replays cached streams instantly, 1.0 at the recorded speed
+
+@dataclass
+class SimilarityCacheSettings:
+    """Settings for the near-duplicate prompt cache."""
+    enabled: bool = False
+    mode: str = "suggest"  # "return" answers from the cache, "suggest" only offers the earlier answer
+    threshold: float = 0.75  # Minimum estimated Jaccard similarity of the prompts' character shingles
+    num_perm: int = 64  # MinHash signature length
+    bands: int = 16  # LSH bands; num_perm must be divisible by this
+    max_entries: int = 2048
+    ttl: float = 24 * 3600.0
+    max_prompt_chars: int = 4096  # Longer prompts skip the cache; MinHash runs on the request thread
+
+@dataclass
+class ResilienceSettings:
+    """Settings for retrying, hedging and circuit breaking DeepSeek API calls."""
+    max_attempts: int = 3
+    base_delay: float = 0.5  # First backoff ceiling in seconds; doubles per attempt, fully jittered
+    max_delay: float = 20.0
+    breaker_failure_threshold: int = 5  # Consecutive failures that open the circuit; 0 disables it
+    breaker_recovery_timeout: float = 30.0  # Seconds before a probe request is let through
+    hedge: bool = False  # Race a second request when the first chunk is unusually slow
+    hedge_percentile: float = 0.95
+    hedge_min_samples: int = 20
+    hedge_min_delay: float = 1.0
+
+@dataclass
+class RateLimitSettings:
+    """Settings for the process-wide upstream rate limiter."""
+    enabled: bool = False
+    requests_per_minute: Optional[int] = 300  # None for no request limit
+    tokens_per_minute: Optional[int] = 1_000_000  # Prompt plus completion; None for no token limit
+    expected_completion_tokens: int = 2048  # Reserved per request when max_tokens is not set
+    max_wait: float = 120.0  # Seconds a request may queue before it fails
+
+@dataclass
+class CoalesceSettings:
+    """Settings for merging streamed token chunks before they are sent to the browser."""
+    enabled: bool = True
+    window: float = 0.05  # Seconds a chunk may wait to be merged; 0 sends every chunk as it arrives
+    max_bytes: int = 1024  # Flush once this much text is buffered
+    flush_on_newline: bool = True  # Flush at line ends so markdown renders whole lines
+    flush_first: bool = True  # Send the first chunk at once, keeping the time to first token
 
 @dataclass
 class APISettings:
@@ -31,12 +101,53 @@ class APISettings:
             if not self.api_key:
                 raise ValueError("DeepSeek API key not found. Please set DEEPSEEK_API_KEY environment variable.")
 
+@dataclass
+class TransportSettings:
+    """Settings for the process-wide HTTP connection pool."""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0
+    http2: bool = False
+    timeout: float = 60.0
+
+@dataclass
+class StorageSettings:
+    """Settings for chat history persistence."""
+    backend: str = "sqlite"  # "sqlite" or "journal"
+    history_dir: str = "chat_history"
+    sqlite_file: str = "chats.db"
+    journal_file: str = "journal.jsonl"
+    fsync_interval: float = 1.0  # Max seconds between fsyncs of the journal
+    fsync_batch: int = 64  # Fsync immediately after this many unsynced records
+    compact_ratio: float = 2.0  # Compact when records exceed this multiple of live messages
+    compact_min_bytes: int = 1024 * 1024
+    clear_on_startup: bool = True  # Start the web UI with an empty chat-1, as before
+
+@dataclass
+class SessionSettings:
+    """Settings for in-memory web chat sessions."""
+    max_bytes: int = 256 * 1024 * 1024  # Memory budget for all sessions
+    idle_timeout: float = 3600.0  # Evict sessions unused for this many seconds
+    sweep_interval: float = 60.0
+    spill_dir: str = "chat_history/sessions"
+
 @dataclass
 class SearchSettings:
     """Settings for web search functionality."""
     max_results: int = 3
     max_concurrent: int = 3
     search_timeout: int = 10
+    max_retries: int = 3
+    max_sessions: int = 4  # Warm DDGS sessions kept for concurrent searches
+    cache_enabled: bool = True
+    cache_dir: Optional[str] = "chat_history/search_cache"  # None keeps the cache in memory only
+    cache_max_entries: int = 1024  # Queries kept in memory
+    cache_ttl: float = 3600.0  # Seconds results are fresh
+    cache_stale_ttl: float = 7 * 24 * 3600.0  # Seconds stale results are served while refreshing
+    cache_ignore_word_order: bool = False  # "python async" and "async python" share an entry
+    scraper_host: str = "127.0.0.1"  # Scraper daemon (tools/web_scraper.py --serve)
+    scraper_port: int = 8765
+    scraper_timeout: float = 120.0  # Seconds to wait for the daemon to answer a batch
 
 @dataclass
 class WebSettings:
@@ -44,9 +155,25 @@ class WebSettings:
     port: int = 5000
     debug: bool = False
     host: str = "localhost"
+    stream_protocol: int = 2  # 1 = legacy full-text payloads, 2 = deltas
+    checkpoint_interval: int = 64  # Delta events between checksummed checkpoints
+    replay_buffer_size: int = 4096  # Stream events kept per chat for resuming
+    disconnect_grace: float = 5.0  # Seconds a stream may run with no reader before it is cancelled
+    max_active_streams: int = 32  # Generations calling the upstream at once
+    max_queued_streams: int = 64  # Requests waiting for a slot; more get 429
+    queue_timeout: float = 30.0  # Seconds a request may wait for a slot before it fails
 
 # Default settings instances
 chat_settings = ChatSettings()
+compaction_settings = CompactionSettings()
+response_cache_settings = ResponseCacheSettings()
+similarity_cache_settings = SimilarityCacheSettings()
+resilience_settings = ResilienceSettings()
+rate_limit_settings = RateLimitSettings()
+coalesce_settings = CoalesceSettings()
 api_settings = APISettings()
+transport_settings = TransportSettings()
+storage_settings = StorageSettings()
+session_settings = SessionSettings()
 search_settings = SearchSettings()
 web_settings = WebSettings()
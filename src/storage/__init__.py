@@ -0,0 +1,34 @@
+"""
+Persistent storage engines for chat histories.
+
+Both engines expose the same interface: load(), load_chat(), append(),
+clear(), list_chats(), page(), flush() and close().
+"""
+
+import os
+
+from src.config.settings import storage_settings
+from src.storage.journal import JournalStore
+from src.storage.sqlite import SQLiteStore
+
+
+def open_store(settings=storage_settings):
+    """Open the chat history store selected by `settings.backend`.
+    
+    Args:
+        settings: Storage settings; defaults to the process-wide instance.
+        
+    Returns:
+        A SQLiteStore ("sqlite") or JournalStore ("journal").
+    """
+    if settings.backend == "sqlite":
+        return SQLiteStore(os.path.join(settings.history_dir, settings.sqlite_file))
+    if settings.backend == "journal":
+        return JournalStore(
+            os.path.join(settings.history_dir, settings.journal_file),
+            fsync_interval=settings.fsync_interval,
+            fsync_batch=settings.fsync_batch,
+            compact_ratio=settings.compact_ratio,
+            compact_min_bytes=settings.compact_min_bytes
+        )
+    raise ValueError(f"Unknown storage backend: {settings.backend}")
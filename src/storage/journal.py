@@ -0,0 +1,288 @@
+"""
+Append-only journal storage engine for chat histories.
+
+Every change is one JSON line appended to the journal, so saving a turn costs
+a constant-size write instead of re-serialising the whole conversation.
+Lines are flushed to the OS immediately and fsynced in batches by a
+background thread. On load, a torn final line left by a crash is discarded
+and truncated away. Once the journal holds mostly superseded records it is
+compacted in the background into one record per chat.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class JournalStore:
+    """Chat history store backed by an append-only JSONL journal.
+    
+    Record types:
+        {"op": "append", "chat": id, "msg": {...}}       one new message
+        {"op": "clear", "chat": id}                     history emptied
+        {"op": "replace", "chat": id, "messages": [...]} full history (written by compaction)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fsync_interval: float = 1.0,
+        fsync_batch: int = 64,
+        compact_ratio: float = 2.0,
+        compact_min_bytes: int = 1024 * 1024
+    ):
+        """Open (and recover) the journal.
+        
+        Args:
+            path: Journal file path.
+            fsync_interval: Maximum seconds between fsyncs while there are unsynced writes.
+            fsync_batch: Fsync immediately once this many records are unsynced.
+            compact_ratio: Compact when records exceed this multiple of live messages.
+            compact_min_bytes: Never compact journals smaller than this.
+        """
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        
+        self._lock = threading.RLock()
+        self._unsynced = 0
+        self._records = 0
+        self._live_counts: Dict[str, int] = {}
+        self._compacting = False
+        self._closed = False
+        self._wakeup = threading.Event()
+        
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._recover()
+        self._file = open(self.path, 'ab')
+        self._syncer = threading.Thread(target=self._sync_loop, name="journal-sync", daemon=True)
+        self._syncer.start()
+
+    # Reading
+
+    def _replay(self, path: str, end: Optional[int] = None, chat_id: Optional[str] = None):
+        """Replay journal records into histories.
+        
+        Args:
+            path: Journal file to read.
+            end: Stop at this byte offset.
+            chat_id: Only rebuild this chat.
+            
+        Returns:
+            Tuple of (histories, number of records, offset after the last good record).
+        """
+        histories: Dict[str, List[Dict]] = {}
+        records = 0
+        good_offset = 0
+        if not os.path.exists(path):
+            return histories, records, good_offset
+        
+        with open(path, 'rb') as f:
+            for raw in f:
+                if end is not None and good_offset + len(raw) > end:
+                    break
+                if not raw.endswith(b'\n'):
+                    # Torn write: the process died mid-append
+                    logger.warning(f"Ignoring incomplete trailing record in {path}")
+                    break
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    logger.error(f"Skipping corrupt journal record at offset {good_offset} in {path}")
+                    good_offset += len(raw)
+                    continue
+                good_offset += len(raw)
+                records += 1
+                
+                chat = record.get('chat')
+                if chat_id is not None and chat != chat_id:
+                    continue
+                op = record.get('op')
+                if op == 'append':
+                    histories.setdefault(chat, []).append(record['msg'])
+                elif op == 'clear':
+                    histories[chat] = []
+                elif op == 'replace':
+                    histories[chat] = list(record['messages'])
+        return histories, records, good_offset
+
+    def _recover(self):
+        """Rebuild counters from the journal and cut off a torn trailing record."""
+        histories, records, good_offset = self._replay(self.path)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > good_offset:
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_offset)
+                f.flush()
+                os.fsync(f.fileno())
+            logger.info(f"Recovered journal {self.path}, truncated to {good_offset} bytes")
+        self._records = records
+        self._live_counts = {chat: len(messages) for chat, messages in histories.items()}
+
+    def load(self) -> Dict[str, List[Dict]]:
+        """Return the histories of every chat in the journal."""
+        with self._lock:
+            self._file.flush()
+            histories, _, _ = self._replay(self.path)
+        return histories
+
+    def load_chat(self, chat_id: str) -> List[Dict]:
+        """Return the history of one chat."""
+        with self._lock:
+            self._file.flush()
+            histories, _, _ = self._replay(self.path, chat_id=chat_id)
+        return histories.get(chat_id, [])
+
+    def list_chats(self) -> List[Dict]:
+        """Return every chat in the journal with its message count."""
+        return [
+            {'chatId': chat_id, 'messageCount': len(messages)}
+            for chat_id, messages in self.load().items()
+        ]
+
+    def page(self, chat_id: str, limit: int = 50, before: Optional[int] = None) -> Dict:
+        """Return the latest `limit` messages older than the `before` cursor.
+        
+        Sequence numbers are positions in the current history. The journal
+        has no index, so this replays the chat; use the SQLite store for
+        large archives.
+        """
+        history = self.load_chat(chat_id)
+        end = len(history) if before is None else max(0, min(before, len(history)))
+        start = max(0, end - limit)
+        messages = [dict(msg, seq=start + i) for i, msg in enumerate(history[start:end])]
+        return {
+            'messages': messages,
+            'next_cursor': start if start > 0 else None,
+            'has_more': start > 0
+        }
+
+    # Writing
+
+    def _write(self, records: List[Dict]):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Journal is closed")
+            data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+            self._file.write(data.encode('utf-8'))
+            self._file.flush()
+            self._records += len(records)
+            self._unsynced += len(records)
+            if self._unsynced >= self.fsync_batch:
+                self._fsync()
+            else:
+                self._wakeup.set()
+
+    def append(self, chat_id: str, messages: List[Dict]):
+        """Append messages to a chat's history."""
+        if not messages:
+            return
+        self._write([{'op': 'append', 'chat': chat_id, 'msg': msg} for msg in messages])
+        with self._lock:
+            self._live_counts[chat_id] = self._live_counts.get(chat_id, 0) + len(messages)
+        self._maybe_compact()
+
+    def clear(self, chat_id: str):
+        """Empty a chat's history."""
+        self._write([{'op': 'clear', 'chat': chat_id}])
+        with self._lock:
+            self._live_counts[chat_id] = 0
+        self._maybe_compact()
+
+    def _fsync(self):
+        with self._lock:
+            if self._unsynced:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def flush(self):
+        """Force unsynced records to disk."""
+        self._fsync()
+
+    def _sync_loop(self):
+        while not self._closed:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            time.sleep(self.fsync_interval)
+            try:
+                self._fsync()
+            except (OSError, ValueError) as e:
+                if not self._closed:
+                    logger.error(f"Journal fsync failed: {str(e)}")
+
+    # Compaction
+
+    def _maybe_compact(self):
+        with self._lock:
+            if self._compacting:
+                return
+            live = sum(self._live_counts.values()) + len(self._live_counts)
+            if self._records <= self.compact_ratio * max(live, 1):
+                return
+            if self._file.tell() < self.compact_min_bytes:
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact_in_background, name="journal-compact", daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"Journal compaction failed: {str(e)}", exc_info=True)
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact(self):
+        """Rewrite the journal as one record per chat.
+        
+        The bulk of the work happens without the write lock: the prefix up to
+        the current end is compacted first, then records appended meanwhile
+        are copied over under the lock and the files swapped atomically.
+        """
+        with self._lock:
+            self._file.flush()
+            end = self._file.tell()
+        
+        histories, _, _ = self._replay(self.path, end=end)
+        tmp_path = self.path + '.compact'
+        records = 0
+        with open(tmp_path, 'wb') as out:
+            for chat, messages in histories.items():
+                record = {'op': 'replace', 'chat': chat, 'messages': messages}
+                out.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+                records += 1
+            
+            with self._lock:
+                self._file.flush()
+                with open(self.path, 'rb') as src:
+                    src.seek(end)
+                    for line in src:
+                        out.write(line)
+                        records += 1
+                out.flush()
+                os.fsync(out.fileno())
+                self._file.close()
+                os.replace(tmp_path, self.path)
+                self._file = open(self.path, 'ab')
+                old_records = self._records
+                self._records = records
+                self._unsynced = 0
+        logger.info(f"Compacted journal {self.path} from {old_records} to {records} records")
+
+    def close(self):
+        """Sync and close the journal."""
+        with self._lock:
+            if self._closed:
+                return
+            self._fsync()
+            self._closed = True
+            self._file.close()
+        self._wakeup.set()
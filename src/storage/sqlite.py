@@ -0,0 +1,186 @@
+"""
+SQLite storage engine for chat histories.
+
+Messages are indexed by (chat id, sequence number), so reading the latest
+page of a long chat is an index range scan rather than a parse of the whole
+archive. Sequence numbers only ever grow within a chat, so cursors stay
+valid across clears and appends.
+"""
+
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    next_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    extra TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (chat_id, seq)
+) WITHOUT ROWID;
+"""
+
+# Keys stored in their own columns; anything else goes into `extra`
+_COLUMNS = ('role', 'content')
+
+
+def _row_to_message(row, with_seq: bool = False) -> Dict:
+    seq, role, content, extra = row
+    message = {'role': role, 'content': content}
+    if extra:
+        message.update(json.loads(extra))
+    if with_seq:
+        message['seq'] = seq
+    return message
+
+
+class SQLiteStore:
+    """Chat history store backed by an indexed SQLite database."""
+
+    def __init__(self, path: str):
+        """Open (and create if needed) the database.
+        
+        Args:
+            path: Database file path.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        logger.debug(f"Opened chat store {path}")
+
+    def load(self) -> Dict[str, List[Dict]]:
+        """Return the histories of every chat."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chat_id, seq, role, content, extra FROM messages ORDER BY chat_id, seq"
+            ).fetchall()
+            chats = self._conn.execute("SELECT chat_id FROM chats").fetchall()
+        histories: Dict[str, List[Dict]] = {chat_id: [] for (chat_id,) in chats}
+        for chat_id, *rest in rows:
+            histories[chat_id].append(_row_to_message(rest))
+        return histories
+
+    def load_chat(self, chat_id: str) -> List[Dict]:
+        """Return the history of one chat."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content, extra FROM messages WHERE chat_id = ? ORDER BY seq",
+                (chat_id,)
+            ).fetchall()
+        return [_row_to_message(row) for row in rows]
+
+    def append(self, chat_id: str, messages: List[Dict]):
+        """Append messages to a chat's history."""
+        if not messages:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO chats (chat_id, created_at, updated_at) VALUES (?, ?, ?)",
+                (chat_id, now, now)
+            )
+            (next_seq,) = self._conn.execute(
+                "SELECT next_seq FROM chats WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            rows = []
+            for offset, message in enumerate(messages):
+                extra = {k: v for k, v in message.items() if k not in _COLUMNS}
+                rows.append((
+                    chat_id,
+                    next_seq + offset,
+                    message['role'],
+                    message['content'],
+                    json.dumps(extra, ensure_ascii=False) if extra else None,
+                    now
+                ))
+            self._conn.executemany(
+                "INSERT INTO messages (chat_id, seq, role, content, extra, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.execute(
+                "UPDATE chats SET next_seq = ?, message_count = message_count + ?, updated_at = ? WHERE chat_id = ?",
+                (next_seq + len(messages), len(messages), now, chat_id)
+            )
+
+    def clear(self, chat_id: str):
+        """Empty a chat's history, keeping its sequence counter."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self._conn.execute(
+                "UPDATE chats SET message_count = 0, updated_at = ? WHERE chat_id = ?",
+                (time.time(), chat_id)
+            )
+
+    def list_chats(self) -> List[Dict]:
+        """Return every chat, most recently updated first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chat_id, message_count, created_at, updated_at FROM chats ORDER BY updated_at DESC"
+            ).fetchall()
+        return [
+            {'chatId': chat_id, 'messageCount': count, 'createdAt': created, 'updatedAt': updated}
+            for chat_id, count, created, updated in rows
+        ]
+
+    def page(self, chat_id: str, limit: int = 50, before: Optional[int] = None) -> Dict:
+        """Return the latest `limit` messages older than the `before` cursor.
+        
+        Args:
+            chat_id: Chat to read.
+            limit: Maximum number of messages.
+            before: Only return messages with a smaller sequence number.
+            
+        Returns:
+            Dictionary with 'messages' (oldest first, each with its 'seq'),
+            'next_cursor' to pass as `before` for the previous page, and 'has_more'.
+        """
+        query = "SELECT seq, role, content, extra FROM messages WHERE chat_id = ?"
+        params: list = [chat_id]
+        if before is not None:
+            query += " AND seq < ?"
+            params.append(before)
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit + 1)  # One extra row tells us whether more exist
+        
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        messages = [_row_to_message(row, with_seq=True) for row in reversed(rows)]
+        return {
+            'messages': messages,
+            'next_cursor': messages[0]['seq'] if has_more and messages else None,
+            'has_more': has_more
+        }
+
+    def flush(self):
+        """Checkpoint the write-ahead log."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,166 @@
+"""
+Token-budget-aware construction of the messages sent to the model.
+"""
+
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.helpers import format_message
+
+# DeepSeek's published rule of thumb: about 0.3 tokens per English
+# character and 0.6 per Chinese character
+_CJK_PATTERN = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+_CJK_TOKENS_PER_CHAR = 0.6
+_OTHER_TOKENS_PER_CHAR = 0.3
+# Role markers and separators the chat template adds around each message
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a piece of text.
+    
+    Args:
+        text: Text to measure
+        
+    Returns:
+        Approximate DeepSeek token count
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return int(cjk * _CJK_TOKENS_PER_CHAR + (len(text) - cjk) * _OTHER_TOKENS_PER_CHAR) + 1
+
+
+@dataclass
+class ContextResult:
+    """Messages to send, plus what was left out to fit the budget."""
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    dropped: List[int] = field(default_factory=list)  # History indices left out
+    dropped_tokens: int = 0
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.dropped)
+
+
+class ContextBuilder:
+    """Build chat API messages from a history, trimmed to a token budget.
+    
+    Keeps the system message, pinned history messages (those with
+    'pinned': True) and the newest turns that fit. Token counts are cached
+    per message and tracked incrementally for an append-only history, so a
+    turn only counts the messages added since the previous one.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, cache_size: int = 4096):
+        """Initialize the builder.
+        
+        Args:
+            token_budget: Maximum prompt tokens. None sends the full history.
+            cache_size: Number of per-message token counts to remember.
+        """
+        self.token_budget = token_budget
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        # Incremental state for the last history seen: its message objects'
+        # token counts, in order
+        self._tracked: List[Tuple[int, int, int]] = []  # (id, content length, tokens)
+
+    def count(self, message: Dict[str, Any]) -> int:
+        """Return the token count of one message, using the cache."""
+        key = (message.get('role', ''), message.get('content', ''))
+        tokens = self._cache.get(key)
+        if tokens is None:
+            tokens = estimate_tokens(key[1]) + _MESSAGE_OVERHEAD_TOKENS
+            self._cache[key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return tokens
+
+    def _history_counts(self, history: List[Dict[str, Any]]) -> List[int]:
+        """Return token counts for every history message, counting only new ones.
+        
+        The tracked prefix is reused while its last message is the same object
+        with the same content length; otherwise (clear, pop, edit) it is rebuilt.
+        """
+        tracked = self._tracked
+        if len(tracked) > len(history):
+            tracked = []
+        elif tracked:
+            last = len(tracked) - 1
+            msg = history[last]
+            ident, length, _ = tracked[last]
+            if id(msg) != ident or len(msg.get('content', '')) != length:
+                tracked = []
+        for msg in history[len(tracked):]:
+            tracked.append((id(msg), len(msg.get('content', '')), self.count(msg)))
+        self._tracked = tracked
+        return [tokens for _, _, tokens in tracked]
+
+    def build(
+        self,
+        user_message: str,
+        system_message: Optional[str] = None,
+        chat_history: Optional[List[Dict[str, Any]]] = None,
+        token_budget: Optional[int] = None,
+        prefix: Optional[List[Dict[str, str]]] = None
+    ) -> ContextResult:
+        """Build the messages for one turn.
+        
+        Args:
+            user_message: The user's new message
+            system_message: Optional system message to set context
+            chat_history: Optional list of previous messages
+            token_budget: Overrides the builder's budget for this call
+            prefix: Messages always sent right after the system message, e.g. pinned files
+            
+        Returns:
+            ContextResult with the messages and what was dropped
+        """
+        budget = token_budget if token_budget is not None else self.token_budget
+        history = chat_history or []
+        counts = self._history_counts(history)
+        
+        head = [format_message("system", system_message)] if system_message else []
+        head += [format_message(msg["role"], msg["content"]) for msg in prefix or []]
+        tail = format_message("user", user_message)
+        used = sum(self.count(msg) for msg in head) + self.count(tail)
+        
+        if budget is None:
+            kept = list(range(len(history)))
+        else:
+            pinned = [i for i, msg in enumerate(history) if msg.get('pinned')]
+            used += sum(counts[i] for i in pinned)
+            kept_set = set(pinned)
+            # Newest first, contiguous: stop at the first turn that does not fit
+            for i in range(len(history) - 1, -1, -1):
+                if i in kept_set:
+                    continue
+                if used + counts[i] > budget:
+                    break
+                used += counts[i]
+                kept_set.add(i)
+            # Don't open the kept window on an orphaned assistant reply
+            unpinned = sorted(i for i in kept_set if not history[i].get('pinned'))
+            if unpinned and unpinned[0] > 0 and history[unpinned[0]].get('role') == 'assistant':
+                kept_set.discard(unpinned[0])
+                used -= counts[unpinned[0]]
+            kept = sorted(kept_set)
+        
+        if budget is None:
+            used += sum(counts)
+        
+        kept_lookup = set(kept)
+        dropped = [i for i in range(len(history)) if i not in kept_lookup]
+        messages = head + [format_message(history[i]["role"], history[i]["content"]) for i in kept] + [tail]
+        return ContextResult(
+            messages=messages,
+            prompt_tokens=used,
+            dropped=dropped,
+            dropped_tokens=sum(counts[i] for i in dropped)
+        )
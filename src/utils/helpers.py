@@ -24,6 +24,9 @@ def create_chat_messages(
 ) -> List[Dict[str, str]]:
     """Create a list of messages for the chat API.
     
+    Sends the whole history; use src.utils.context.ContextBuilder to trim
+    it to a token budget.
+    
     Args:
         user_message: The user's message
         system_message: Optional system message to set context
@@ -38,7 +41,9 @@ def create_chat_messages(
         messages.append(format_message("system", system_message))
         
     if chat_history:
-        messages.extend(chat_history)
+        # Only role and content go upstream; history entries may carry local
+        # bookkeeping such as the 'truncated' flag
+        messages.extend(format_message(msg["role"], msg["content"]) for msg in chat_history)
         
     messages.append(format_message("user", user_message))
     return messages
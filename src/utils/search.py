@@ -3,17 +3,188 @@ Web search and scraping utilities.
 """
 
 import sys
+import time
+import queue
+import socket
 import subprocess
-from typing import List, Dict
+import threading
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Optional
 import json
 import logging
 from ..config.settings import search_settings
+from .search_cache import SearchCache, create_search_cache
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def search_web(query: str) -> List[Dict[str, str]]:
-    """Search the web using the search engine tool.
+
+@dataclass
+class SearchResult:
+    """One web search hit."""
+    url: str
+    title: str
+    snippet: str
+
+    def to_dict(self) -> Dict[str, str]:
+        return asdict(self)
+
+
+class SearchService:
+    """Long-lived DuckDuckGo search with warm sessions.
+    
+    Keeps a small pool of DDGS sessions so a search costs only the network
+    round trip, instead of an interpreter start, imports and a new TLS
+    connection per query. A session that fails is discarded and replaced.
+    With a cache, repeated queries are answered without searching at all.
+    """
+
+    def __init__(
+        self,
+        max_results: int = 3,
+        max_retries: int = 3,
+        timeout: float = 10,
+        max_sessions: int = 4,
+        cache: Optional[SearchCache] = None
+    ):
+        """Initialize the service.
+        
+        Args:
+            max_results: Default number of results per query.
+            max_retries: Attempts per query before giving up.
+            timeout: Seconds each search request may take.
+            max_sessions: DDGS sessions kept for concurrent searches.
+            cache: Optional result cache consulted before searching.
+        """
+        self.max_results = max_results
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.cache = cache
+        self._idle: "queue.LifoQueue" = queue.LifoQueue(maxsize=max_sessions)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._searches = 0
+        self._failures = 0
+
+    def _new_session(self):
+        # Imported lazily: search is optional and duckduckgo_search is slow to import
+        from duckduckgo_search import DDGS
+        with self._lock:
+            self._created += 1
+        return DDGS(timeout=self.timeout)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_session()
+
+    def _checkin(self, session):
+        try:
+            self._idle.put_nowait(session)
+        except queue.Full:
+            self._close(session)
+
+    @staticmethod
+    def _close(session):
+        close = getattr(session, '__exit__', None)
+        if close is not None:
+            try:
+                close(None, None, None)
+            except Exception:
+                pass
+
+    def search(self, query: str, max_results: Optional[int] = None) -> List[SearchResult]:
+        """Search the web.
+        
+        Args:
+            query: Search query
+            max_results: Overrides the default number of results
+            
+        Returns:
+            Results in rank order; empty if the search failed.
+        """
+        max_results = max_results or self.max_results
+        if self.cache is None:
+            return self._search(query, max_results)
+        results = self.cache.get(
+            query, max_results, lambda: [result.to_dict() for result in self._search(query, max_results)]
+        )
+        return [SearchResult(**result) for result in results]
+
+    def _search(self, query: str, max_results: int) -> List[SearchResult]:
+        with self._lock:
+            self._searches += 1
+        for attempt in range(1, self.max_retries + 1):
+            session = None
+            try:
+                session = self._checkout()
+                hits = session.text(query, max_results=max_results) or []
+                self._checkin(session)
+                return [
+                    SearchResult(hit.get('href', ''), hit.get('title', ''), hit.get('body', ''))
+                    for hit in hits[:max_results]
+                ]
+            except ImportError as e:
+                logger.error(f"Web search is unavailable: {str(e)}")
+                break
+            except Exception as e:
+                logger.warning(f"Search attempt {attempt}/{self.max_retries} for {query!r} failed: {str(e)}")
+                if session is not None:
+                    self._close(session)
+                if type(e).__name__ == 'RatelimitException':
+                    # Retrying straight away only prolongs the throttling
+                    break
+                if attempt < self.max_retries:
+                    time.sleep(attempt)
+        with self._lock:
+            self._failures += 1
+        return []
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {
+                'searches': self._searches,
+                'failures': self._failures,
+                'sessions_created': self._created,
+                'sessions_idle': self._idle.qsize()
+            }
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
+
+    def close(self):
+        """Close every idle session and stop the cache's background refreshes."""
+        if self.cache is not None:
+            self.cache.close()
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+_service: Optional[SearchService] = None
+_service_lock = threading.Lock()
+
+
+def get_search_service() -> SearchService:
+    """Return the process-wide search service built from the search settings."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SearchService(
+                max_results=search_settings.max_results,
+                max_retries=search_settings.max_retries,
+                timeout=search_settings.search_timeout,
+                max_sessions=search_settings.max_sessions,
+                cache=create_search_cache(search_settings)
+            )
+        return _service
+
+
+def search_web(query: str) -> List[SearchResult]:
+    """Search the web with the shared search service.
     
     Args:
         query: Search query
@@ -21,51 +192,47 @@ def search_web(query: str) -> List[Dict[str, str]]:
     Returns:
         List of search results with URL, title, and snippet
     """
+    return get_search_service().search(query)
+
+def _scrape_with_daemon(urls: List[str]) -> Optional[List[Dict[str, str]]]:
+    """Scrape through a running scraper daemon; None if none is listening."""
     try:
-        # Run the search engine tool
-        result = subprocess.run(
-            ["venv/bin/python3", "tools/search_engine.py", query],
-            capture_output=True,
-            text=True,
-            check=True
+        conn = socket.create_connection(
+            (search_settings.scraper_host, search_settings.scraper_port),
+            timeout=search_settings.scraper_timeout
         )
-        
-        # Parse the results
-        results = []
-        lines = result.stdout.strip().split('\n')
-        current_result = {}
-        
-        for line in lines:
-            if line.startswith('URL: '):
-                if current_result:
-                    results.append(current_result.copy())
-                current_result = {'url': line[5:]}
-            elif line.startswith('Title: '):
-                current_result['title'] = line[7:]
-            elif line.startswith('Snippet: '):
-                current_result['snippet'] = line[9:]
-        
-        if current_result:
-            results.append(current_result)
-            
-        return results[:search_settings.max_results]
-        
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Search engine error: {e.stderr}")
-        return []
+    except OSError:
+        return None
+    with conn, conn.makefile('rwb') as stream:
+        stream.write(json.dumps({'urls': urls}).encode('utf-8') + b'\n')
+        stream.flush()
+        reply = json.loads(stream.readline() or b'{}')
+    if 'results' not in reply:
+        raise RuntimeError(reply.get('error', 'empty reply'))
+    return reply['results']
 
 def scrape_urls(urls: List[str]) -> List[Dict[str, str]]:
     """Scrape content from URLs using the web scraper tool.
     
+    Uses the scraper daemon's warm browser pool when one is running, and
+    otherwise runs the tool once for these URLs.
+    
     Args:
         urls: List of URLs to scrape
         
     Returns:
         List of dictionaries containing URL and content
     """
+    try:
+        results = _scrape_with_daemon(urls)
+        if results is not None:
+            return results
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.warning(f"Scraper daemon failed, running the scraper directly: {str(e)}")
+
     try:
         # Run the web scraper tool
-        cmd = ["venv/bin/python3", "tools/web_scraper.py", f"--max-concurrent={search_settings.max_concurrent}"]
+        cmd = ["venv/bin/python3", "tools/web_scraper.py", f"--max-concurrent={search_settings.max_concurrent}", "--json"]
         cmd.extend(urls)
         
         result = subprocess.run(
@@ -101,7 +268,7 @@ def search_and_scrape(query: str) -> str:
         return "No search results found."
     
     # Scrape content from URLs
-    urls = [result['url'] for result in search_results]
+    urls = [result.url for result in search_results]
     scraped_content = scrape_urls(urls)
     
     # Format results
@@ -109,12 +276,12 @@ def search_and_scrape(query: str) -> str:
     output.append(f"Search results for: {query}\n")
     
     for i, result in enumerate(search_results, 1):
-        output.append(f"{i}. {result['title']}")
-        output.append(f"   URL: {result['url']}")
-        output.append(f"   Summary: {result['snippet']}")
+        output.append(f"{i}. {result.title}")
+        output.append(f"   URL: {result.url}")
+        output.append(f"   Summary: {result.snippet}")
         
         # Add scraped content if available
-        matching_content = next((item['content'] for item in scraped_content if item['url'] == result['url']), None)
+        matching_content = next((item['content'] for item in scraped_content if item['url'] == result.url), None)
         if matching_content:
             content_preview = matching_content[:500] + "..." if len(matching_content) > 500 else matching_content
             output.append(f"   Content preview: {content_preview}\n")
@@ -0,0 +1,176 @@
+"""
+Cache of web search results.
+
+Queries are normalised (case, whitespace and optionally word order) so
+trivially different spellings share an entry. Results live in an
+in-memory LRU backed by an on-disk store. An entry is fresh for `ttl`
+seconds; after that it is still served for up to `stale_ttl` seconds
+while a background refresh fetches new results, and it is also the
+fallback when a search fails, e.g. because the engine is throttling us.
+"""
+
+import re
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .store import TieredStore
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query: str, ignore_word_order: bool = False) -> str:
+    """Canonical form of a query: casefolded, single-spaced, optionally with sorted words."""
+    words = _WHITESPACE.split(query.casefold().strip())
+    if ignore_word_order:
+        words.sort()
+    return ' '.join(word for word in words if word)
+
+
+class SearchCache:
+    """Two-tier (memory LRU + disk) search result cache that serves stale entries while refreshing."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_entries: int = 1024,
+        ttl: float = 3600.0,
+        stale_ttl: float = 7 * 24 * 3600.0,
+        ignore_word_order: bool = False
+    ):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory for the on-disk tier, or None for memory only.
+            max_entries: Queries kept in memory.
+            ttl: Seconds results are fresh.
+            stale_ttl: Seconds results may still be served (refreshing in the
+                background) or used when a search fails.
+            ignore_word_order: Treat queries with the same words in any order as equal.
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.ignore_word_order = ignore_word_order
+        self._store = TieredStore(cache_dir, max_entries)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-refresh")
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._fallbacks = 0
+        self._closed = False
+
+    def key(self, query: str, max_results: int) -> str:
+        normalized = normalize_query(query, self.ignore_word_order)
+        return hashlib.sha256(f"{max_results}\x00{normalized}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[Tuple[float, List[Dict[str, Any]]]]:
+        """Entry (created_at, results) from memory or disk, if not past stale_ttl."""
+        now = time.time()
+        entry = self._store.recall(key, self.stale_ttl, now)
+        if entry is not None:
+            return entry
+        record = self._store.read(key, self.stale_ttl, now)
+        if record is None:
+            return None
+        self._store.remember(key, record['created_at'], record['results'])
+        return record['created_at'], record['results']
+
+    def _save(self, key: str, results: List[Dict[str, Any]]):
+        created_at = time.time()
+        self._store.remember(key, created_at, results)
+        self._store.write(key, {'created_at': created_at, 'results': results})
+
+    def get(self, query: str, max_results: int, fetch: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Return results for a query, calling `fetch()` on a miss.
+
+        Args:
+            query: The query as typed.
+            max_results: Part of the key; different limits are cached separately.
+            fetch: Runs the search; an empty list means it failed or found nothing.
+        """
+        key = self.key(query, max_results)
+        entry = self._lookup(key)
+        if entry is not None:
+            created_at, results = entry
+            if time.time() - created_at <= self.ttl:
+                with self._lock:
+                    self._hits += 1
+                return results
+            with self._lock:
+                self._stale_hits += 1
+            self._refresh(key, fetch)
+            return results
+
+        with self._lock:
+            self._misses += 1
+        results = fetch()
+        if results:
+            self._save(key, results)
+        return results
+
+    def _refresh(self, key: str, fetch: Callable[[], List[Dict[str, Any]]]):
+        with self._lock:
+            if self._closed or key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                results = fetch()
+                if results:
+                    self._save(key, results)
+                else:
+                    # Keep serving the stale results rather than caching a failure
+                    with self._lock:
+                        self._fallbacks += 1
+            except Exception as e:
+                logger.warning(f"Background search refresh failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresher.submit(run)
+
+    def clear(self):
+        """Drop every cached query from memory. The disk tier is kept."""
+        self._store.clear()
+
+    def close(self):
+        """Stop the background refresh workers, letting running refreshes finish."""
+        with self._lock:
+            self._closed = True
+        self._refresher.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._store),
+                'hits': self._hits,
+                'stale_hits': self._stale_hits,
+                'misses': self._misses,
+                'failed_refreshes': self._fallbacks,
+                'refreshing': len(self._refreshing)
+            }
+
+
+def create_search_cache(settings) -> Optional[SearchCache]:
+    """Build a SearchCache from SearchSettings, or None if caching is disabled."""
+    if not settings.cache_enabled:
+        return None
+    return SearchCache(
+        cache_dir=settings.cache_dir,
+        max_entries=settings.cache_max_entries,
+        ttl=settings.cache_ttl,
+        stale_ttl=settings.cache_stale_ttl,
+        ignore_word_order=settings.cache_ignore_word_order
+    )
@@ -0,0 +1,135 @@
+"""
+Two-tier key-value store shared by the response and search caches.
+
+Values live in an in-memory LRU, optionally backed by a directory of
+JSON files that survives restarts. Keys are hex digests; files are
+sharded by the key's first two characters and written atomically, so a
+reader never sees a partial entry. Expiry is the caller's business: each
+entry carries the time it was created and lookups pass the maximum age
+they accept.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class TieredStore:
+    """Memory LRU in front of an optional on-disk JSON tier."""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 1024):
+        """Initialize the store.
+
+        Args:
+            cache_dir: Directory for the on-disk tier, or None for memory only.
+            max_entries: Entries kept in memory; the least recently used are dropped.
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._memory)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def recall(self, key: str, max_age: float, now: Optional[float] = None) -> Optional[Tuple[float, Any]]:
+        """(created_at, value) from memory, unless older than `max_age` seconds."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if now - entry[0] > max_age:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry
+
+    def remember(self, key: str, created_at: float, value: Any):
+        """Put a value in memory, evicting the least recently used beyond max_entries."""
+        with self._lock:
+            self._memory[key] = (created_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def read(self, key: str, max_age: float, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """The JSON record stored on disk, unless missing, unreadable or too old.
+
+        Unreadable and expired files are deleted.
+        """
+        if not self.cache_dir:
+            return None
+        now = time.time() if now is None else now
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+        if now - record.get('created_at', 0) > max_age:
+            self._remove(path)
+            return None
+        return record
+
+    def write(self, key: str, record: Dict[str, Any]):
+        """Write a JSON record (with a 'created_at' field) to disk."""
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+            # Readers never see a partially written entry
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {path}: {e}")
+            self._remove(tmp_path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def purge(self, max_age: float) -> int:
+        """Delete on-disk entries last written more than `max_age` seconds ago. Returns the number removed."""
+        if not self.cache_dir:
+            return 0
+        removed = 0
+        cutoff = time.time() - max_age
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def clear(self):
+        """Drop every entry from memory. The disk tier is kept."""
+        with self._lock:
+            self._memory.clear()
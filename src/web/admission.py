@@ -0,0 +1,145 @@
+"""
+Admission control for /api/chat.
+
+At most `max_active` generations call the upstream at once. Requests beyond
+that wait in a bounded FIFO queue, reporting their position as they move
+up, and give up after `queue_timeout`. A request that finds the queue full
+is rejected at once with a Retry-After estimate, so overload shows up as
+fast, explicit refusals instead of every request timing out.
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+class AdmissionTicket:
+    """A request's place in the admission queue, or its active slot."""
+
+    def __init__(self, chat_id: str):
+        self.chat_id = chat_id
+        self.created_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+
+class AdmissionController:
+    """Bound concurrent upstream streams, with a bounded wait queue."""
+
+    def __init__(self, max_active: int = 32, max_queue: int = 64, queue_timeout: float = 30.0):
+        """Initialize the controller.
+
+        Args:
+            max_active: Generations allowed to run at the same time.
+            max_queue: Requests allowed to wait for a slot; more are rejected.
+            queue_timeout: Seconds a request may wait before it is turned away.
+        """
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._queue: Deque[AdmissionTicket] = deque()
+        self._cond = threading.Condition()
+        # Smoothed seconds a generation holds its slot, for Retry-After estimates
+        self._mean_duration: Optional[float] = None
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def reserve(self, chat_id: str) -> Optional[AdmissionTicket]:
+        """Take a slot, or a place in the queue; None if the queue is full."""
+        ticket = AdmissionTicket(chat_id)
+        with self._cond:
+            if self._active < self.max_active and not self._queue:
+                self._admit(ticket)
+            elif len(self._queue) < self.max_queue:
+                self._queue.append(ticket)
+            else:
+                self._rejected += 1
+                return None
+        return ticket
+
+    def _admit(self, ticket: AdmissionTicket):
+        self._active += 1
+        self._admitted += 1
+        ticket.admitted_at = time.monotonic()
+
+    def wait(
+        self,
+        ticket: AdmissionTicket,
+        on_position: Optional[Callable[[int], Any]] = None,
+        cancelled: Optional[Callable[[], bool]] = None
+    ) -> bool:
+        """Wait for a queued ticket to be admitted.
+
+        Args:
+            ticket: Ticket returned by reserve().
+            on_position: Called with the queue position whenever it changes.
+            cancelled: Polled about once a second; returning True gives up.
+
+        Returns:
+            True once admitted; False on timeout or cancellation, in which
+            case the ticket has left the queue.
+        """
+        deadline = ticket.created_at + self.queue_timeout
+        last_position = None
+        with self._cond:
+            while not ticket.admitted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (cancelled is not None and cancelled()):
+                    self._queue.remove(ticket)
+                    if remaining <= 0:
+                        self._timed_out += 1
+                    self._cond.notify_all()
+                    return False
+                position = self._queue.index(ticket) + 1
+                if on_position is not None and position != last_position:
+                    last_position = position
+                    on_position(position)
+                self._cond.wait(min(remaining, 1.0))
+        return True
+
+    def release(self, ticket: AdmissionTicket):
+        """Free a ticket's slot (or its place in the queue) and admit the next request."""
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            if not ticket.admitted:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+                return
+            duration = time.monotonic() - ticket.admitted_at
+            if self._mean_duration is None:
+                self._mean_duration = duration
+            else:
+                self._mean_duration = 0.8 * self._mean_duration + 0.2 * duration
+            self._active -= 1
+            while self._queue and self._active < self.max_active:
+                self._admit(self._queue.popleft())
+            self._cond.notify_all()
+
+    def retry_after(self) -> float:
+        """Estimated seconds until a new request would be admitted."""
+        with self._cond:
+            mean = self._mean_duration or 10.0
+            return max(1.0, (len(self._queue) + 1) * mean / self.max_active)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'active': self._active,
+                'max_active': self.max_active,
+                'queued': len(self._queue),
+                'max_queue': self.max_queue,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'mean_duration': self._mean_duration
+            }
@@ -9,10 +9,24 @@ import os
 from werkzeug.utils import secure_filename
 from flask import Flask, render_template, request, jsonify, send_from_directory, Response, stream_with_context
 from src.chat.client import DeepSeekClient
-from src.config.settings import chat_settings, api_settings, web_settings
-from src.utils.helpers import create_chat_messages
-from src.utils.search import search_and_scrape
-from threading import Lock
+from src.chat.transport import pool_stats
+from src.chat.resilience import upstream_stats
+from src.chat.ratelimit import get_rate_limiter
+from src.chat.metrics import get_metrics_registry, PromptCacheTracker
+from src.chat.errors import DeepSeekError
+from src.web.streaming import StreamSession, SUPPORTED_PROTOCOLS
+from src.web.sessions import SessionManager
+from src.web.admission import AdmissionController
+from src.config.settings import chat_settings, api_settings, web_settings, transport_settings, storage_settings, session_settings, compaction_settings, response_cache_settings, similarity_cache_settings, resilience_settings, rate_limit_settings, coalesce_settings
+from src.chat.compaction import create_compactor
+from src.chat.cache import create_response_cache
+from src.chat.similarity import create_similarity_cache, MODE_SUGGEST
+from src.chat.singleflight import SingleFlight
+from src.chat.coalescer import create_coalescer
+from src.storage import open_store
+from src.utils.context import ContextBuilder
+from src.utils.search import search_and_scrape, get_search_service
+from threading import Thread
 import logging
 from logging.handlers import RotatingFileHandler
 import argparse
@@ -24,11 +38,14 @@ os.makedirs(log_dir, exist_ok=True)
 log_file = os.path.join(log_dir, 'bunnychat.log')
 
 # Create chat history directory
-chat_history_dir = 'chat_history'
+chat_history_dir = storage_settings.history_dir
 os.makedirs(chat_history_dir, exist_ok=True)
-temp_chat_file = os.path.join(chat_history_dir, 'temp.json')
+temp_chat_file = os.path.join(chat_history_dir, 'temp.json')  # Legacy snapshot file
 backup_counter = 0
 
+# Persistent store holding every chat's history (SQLite or journal)
+history_store = open_store(storage_settings)
+
 # Create formatters and handlers
 file_handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)  # 10MB per file, keep 5 backups
 file_handler.setLevel(logging.DEBUG)
@@ -72,47 +89,47 @@ def allowed_file(filename):
     """Check if file extension is allowed."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Store chat histories and client instances in memory
-chat_histories = {}
-chat_clients = {}  # Store separate client instances for each chat
-chat_locks = {}
+class AdmissionTimeout(Exception):
+    """A chat request waited too long for a generation slot."""
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
 
-# Add a new variable to store pending file content
-pending_file_uploads = {}
+class StreamCancelled(Exception):
+    """Raised inside a generation when its stream session was cancelled."""
 
-def load_chat_histories():
-    """Load chat histories from disk."""
-    global chat_histories
+def load_chat_history(chat_id):
+    """Load one chat's history from the store."""
     try:
-        if os.path.exists(temp_chat_file):
-            with open(temp_chat_file, 'r', encoding='utf-8') as f:
-                chat_histories = {'chat-1': json.load(f)}
-        else:
-            chat_histories = {'chat-1': []}
+        return history_store.load_chat(chat_id)
     except Exception as e:
-        logger.error(f"Error loading chat histories: {str(e)}")
-        chat_histories = {'chat-1': []}
-
-def save_chat_histories():
-    """Save chat histories to disk."""
+        logger.error(f"Error loading chat history for {chat_id}: {str(e)}")
+        return []
+
+# Per-chat history, client, lock, pending uploads and latest stream, kept
+# under a memory budget; evicted chats are reloaded on their next request
+sessions = SessionManager(
+    load_history=load_chat_history,
+    spill_dir=session_settings.spill_dir,
+    max_bytes=session_settings.max_bytes,
+    idle_timeout=session_settings.idle_timeout,
+    sweep_interval=session_settings.sweep_interval
+)
+
+def persist_messages(chat_id, messages):
+    """Append new messages of a chat to the store."""
     try:
-        with open(temp_chat_file, 'w', encoding='utf-8') as f:
-            json.dump(chat_histories['chat-1'], f, indent=2, ensure_ascii=False)
+        history_store.append(chat_id, messages)
     except Exception as e:
-        logger.error(f"Error saving chat histories: {str(e)}")
+        logger.error(f"Error saving chat history for {chat_id}: {str(e)}")
 
 def backup_chat_history():
     """Create a timestamped backup of the chat history."""
     try:
-        # First save current state to temp file
-        save_chat_histories()
-        
-        # Then create backup
         timestamp = time.strftime("%Y%m%d-%H%M%S")
         backup_file = os.path.join(chat_history_dir, f'chat_backup_{timestamp}.json')
-        with open(temp_chat_file, 'r', encoding='utf-8') as src:
-            with open(backup_file, 'w', encoding='utf-8') as dst:
-                dst.write(src.read())
+        with open(backup_file, 'w', encoding='utf-8') as dst:
+            json.dump(sessions.get('chat-1').history, dst, indent=2, ensure_ascii=False)
         logger.info(f"Created backup: {backup_file}")
         return {'status': 'success', 'backup_file': backup_file}
     except Exception as e:
@@ -126,29 +143,231 @@ def create_backup():
     return jsonify(result)
 
 def cleanup_temp_chat():
-    """Clean up the temporary chat file."""
+    """Start with an empty chat-1, removing the legacy temp file."""
     try:
         if os.path.exists(temp_chat_file):
             os.remove(temp_chat_file)
             logger.info("Cleaned up temp chat file")
-        chat_histories['chat-1'] = []
+        if storage_settings.clear_on_startup:
+            history_store.clear('chat-1')
     except Exception as e:
         logger.error(f"Error cleaning up temp chat: {str(e)}")
 
 # Call cleanup on startup
 cleanup_temp_chat()
 
-def get_or_create_client(chat_id):
-    """Get or create a client for the specific chat."""
-    if chat_id not in chat_clients:
-        logger.debug(f"Creating new client for chat {chat_id}")
-        chat_clients[chat_id] = DeepSeekClient()
-        chat_locks[chat_id] = Lock()
-    return chat_clients[chat_id], chat_locks[chat_id]
+# Response cache shared by every chat's client, created on first use when enabled
+response_cache = None
+
+def get_response_cache():
+    """Return the shared response cache, or None if caching is disabled."""
+    global response_cache
+    if response_cache is None and response_cache_settings.enabled:
+        response_cache = create_response_cache(response_cache_settings)
+    return response_cache
+
+# Near-duplicate prompt cache shared by every chat's client, created on first use when enabled
+similarity_cache = None
+
+def get_similarity_cache():
+    """Return the shared similarity cache, or None if it is disabled."""
+    global similarity_cache
+    if similarity_cache is None and similarity_cache_settings.enabled:
+        similarity_cache = create_similarity_cache(similarity_cache_settings)
+    return similarity_cache
+
+# Merges token chunks before they are streamed, created on first use when enabled
+chunk_coalescer = None
+
+def get_coalescer():
+    """Return the stream chunk coalescer, or None if chunks are sent as they arrive."""
+    global chunk_coalescer
+    if chunk_coalescer is None and coalesce_settings.enabled:
+        chunk_coalescer = create_coalescer(coalesce_settings)
+    return chunk_coalescer
+
+# Each chat's prompt cache hit ratio over its recent turns
+prompt_cache_tracker = PromptCacheTracker()
+
+# Coalesces identical concurrent requests across chats
+singleflight = SingleFlight()
+
+# Bounds concurrent generations; created on first use so command line settings apply
+admission = None
+
+def get_admission():
+    """Return the /api/chat admission controller."""
+    global admission
+    if admission is None:
+        admission = AdmissionController(
+            max_active=web_settings.max_active_streams,
+            max_queue=web_settings.max_queued_streams,
+            queue_timeout=web_settings.queue_timeout
+        )
+    return admission
+
+def overloaded(message: str, status: int, retry_after: float):
+    """A fast refusal telling the browser when to try again."""
+    retry_after = max(1, int(retry_after + 0.999))
+    response = jsonify({'error': message, 'retry_after': retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def get_or_create_client(chat_session):
+    """Get or create the client for a chat session.
+    
+    Clients are cheap: they all share the process-wide connection pool.
+    """
+    if chat_session.client is None:
+        logger.debug(f"Creating new client for chat {chat_session.chat_id}")
+        chat_session.client = DeepSeekClient(
+            cache=get_response_cache(),
+            similar=get_similarity_cache(),
+            singleflight=singleflight if chat_settings.coalesce_requests else None,
+            rate_key=chat_session.chat_id  # Chats share the upstream quota fairly
+        )
+    return chat_session.client
+
+# Rolling-summary compactor, created on first use when enabled
+compactor = None
+
+def get_compactor():
+    """Return the conversation compactor, or None if compaction is disabled."""
+    global compactor
+    if compactor is None and compaction_settings.enabled:
+        compactor = create_compactor(compaction_settings)
+    return compactor
+
+def get_context_builder(chat_session):
+    """Get or create the context builder for a chat session."""
+    if chat_session.context is None:
+        chat_session.context = ContextBuilder(token_budget=chat_settings.context_token_budget)
+    return chat_session.context
+
+def read_pending_uploads(chat_session):
+    """Read and clear the files uploaded since the chat's last message."""
+    file_context = ""
+    for file_info in chat_session.pending_uploads:
+        try:
+            with open(file_info['path'], 'r', encoding='utf-8') as f:
+                content = f.read()
+        except Exception as e:
+            logger.error(f"Error reading uploaded file {file_info['path']}: {str(e)}")
+            continue
+        file_context += f"\nContent of file {file_info['filename']}:\n\n{content}\n"
+    # Clear pending uploads after including them
+    chat_session.pending_uploads = []
+    return file_context
+
+def pinned_file_messages(chat_session):
+    """Messages presenting the chat's pinned files, in upload order.
+    
+    Each file is its own user/assistant pair, so pinning another file
+    leaves the messages of the earlier ones, and their cached prefix, intact.
+    """
+    messages = []
+    for file_info in chat_session.pinned_files:
+        try:
+            with open(file_info['path'], 'r', encoding='utf-8') as f:
+                content = f.read()
+        except Exception as e:
+            logger.error(f"Error reading pinned file {file_info['path']}: {str(e)}")
+            continue
+        messages.append({"role": "user", "content": f"Content of file {file_info['filename']}:\n\n{content}"})
+        messages.append({"role": "assistant", "content": f"I've read the file '{file_info['filename']}'."})
+    return messages
+
+@app.route('/api/stats/pool', methods=['GET'])
+def get_pool_stats():
+    """Return statistics for the shared upstream connection pool."""
+    return jsonify(pool_stats())
+
+@app.route('/api/stats/upstream', methods=['GET'])
+def get_upstream_stats():
+    """Return retry, hedging and circuit breaker statistics per upstream endpoint."""
+    return jsonify(upstream_stats())
+
+@app.route('/api/stats/ratelimit', methods=['GET'])
+def get_rate_limit_stats():
+    """Return upstream rate limiter queue depth and wait times."""
+    limiter = get_rate_limiter(rate_limit_settings)
+    if limiter is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **limiter.stats()})
+
+@app.route('/api/stats/admission', methods=['GET'])
+def get_admission_stats():
+    """Return active and queued generation counts."""
+    return jsonify(get_admission().stats())
+
+@app.route('/api/stats/sessions', methods=['GET'])
+def get_session_stats():
+    """Return in-memory session occupancy and eviction counters."""
+    return jsonify(sessions.stats())
+
+@app.route('/api/stats/cache', methods=['GET'])
+def get_cache_stats():
+    """Return response cache hit-rate statistics."""
+    cache = get_response_cache()
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **cache.stats()})
+
+@app.route('/api/stats/flights', methods=['GET'])
+def get_flight_stats():
+    """Return single-flight request coalescing counters."""
+    return jsonify({'enabled': chat_settings.coalesce_requests, **singleflight.stats()})
+
+@app.route('/api/stats/similar', methods=['GET'])
+def get_similarity_stats():
+    """Return near-duplicate prompt cache statistics."""
+    cache = get_similarity_cache()
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **cache.stats()})
+
+@app.route('/api/stats/latency', methods=['GET'])
+def get_latency_stats():
+    """Return per-model latency histograms and token usage of recent DeepSeek calls."""
+    return jsonify(get_metrics_registry().stats())
+
+@app.route('/api/stats/prompt_cache', methods=['GET'])
+def get_prompt_cache_stats():
+    """Return how much of each chat's prompts DeepSeek served from its prompt cache.
+    
+    Query parameters:
+        chatId: Return this chat's per-call history instead of every chat's summary.
+    """
+    chat_id = request.args.get('chatId')
+    if chat_id is None:
+        return jsonify({'layout': chat_settings.prompt_layout, 'chats': prompt_cache_tracker.stats()})
+    history = prompt_cache_tracker.history(chat_id)
+    if history is None:
+        return jsonify({'error': f'No prompt cache data for chat {chat_id}'}), 404
+    return jsonify({'layout': chat_settings.prompt_layout, 'chatId': chat_id, **history})
+
+@app.route('/api/stats/search', methods=['GET'])
+def get_search_stats():
+    """Return web search counters and warm session counts."""
+    return jsonify(get_search_service().stats())
+
+@app.route('/api/stats/coalescer', methods=['GET'])
+def get_coalescer_stats():
+    """Return how many stream chunks were merged before sending."""
+    coalescer = get_coalescer()
+    if coalescer is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, 'window': coalescer.window, **coalescer.stats()})
 
 def signal_handler(sig, frame):
     """Handle Ctrl+C gracefully"""
     logger.info("Shutting down the server...")
+    sessions.close()
+    if compactor is not None:
+        compactor.shutdown()
+    history_store.close()
+    get_search_service().close()
     sys.exit(0)
 
 @app.route('/')
@@ -180,143 +399,276 @@ def quit():
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
+    ticket = None
     try:
         data = request.get_json()
         message = data.get('message')
         chat_id = data.get('chatId', 'default')
+        protocol = data.get('protocol', web_settings.stream_protocol)
         
         if not message:
             logger.warning("Received chat request without message")
             return {'error': 'Message is required'}, 400
         
+        if protocol not in SUPPORTED_PROTOCOLS:
+            logger.warning(f"Received chat request with unsupported protocol {protocol}")
+            return {'error': f'Unsupported protocol: {protocol}'}, 400
+        
         logger.info(f"Processing chat request for chat {chat_id}")
         logger.debug(f"Message content: {message[:100]}...")
         
-        # Initialize chat history if it doesn't exist
-        if chat_id not in chat_histories:
-            chat_histories[chat_id] = []
-            logger.debug(f"Initialized new chat history for {chat_id}")
+        # Get (or rehydrate) the chat's session and history
+        chat_session = sessions.get(chat_id)
+        chat_history = chat_session.history
+        client = get_or_create_client(chat_session)
         
-        # Get chat history
-        chat_history = chat_histories[chat_id]
+        # Fail fast while the upstream keeps failing
+        breaker = client.resilience.breaker
+        if breaker is not None and breaker.state == breaker.OPEN:
+            logger.warning(f"Rejecting chat request for {chat_id}: upstream circuit open")
+            return overloaded('The model service is unavailable right now.', 503, breaker.retry_after())
         
-        # Check if there are pending file uploads
-        file_context = ""
-        if chat_id in pending_file_uploads and pending_file_uploads[chat_id]:
-            for file_info in pending_file_uploads[chat_id]:
-                file_context += f"\nContent of file {file_info['filename']}:\n\n{file_info['content']}\n"
-            # Clear pending uploads after including them
-            pending_file_uploads[chat_id] = []
+        # Take a generation slot or a place in the queue
+        admission_controller = get_admission()
+        ticket = admission_controller.reserve(chat_id)
+        if ticket is None:
+            logger.warning(f"Rejecting chat request for {chat_id}: admission queue full")
+            return overloaded('The server is busy, too many requests are waiting.', 429, admission_controller.retry_after())
         
-        # Combine file content with user message if there's file context
         full_message = message
-        if file_context:
-            full_message = f"{message}\n\nFor reference, here are the recently uploaded files:{file_context}"
+        prefix = None
+        system_message = chat_settings.system_message
+        if chat_settings.prompt_layout == 'stable':
+            # Keep the prompt prefix byte-identical between turns: the system
+            # message the chat started with, then its files, then the history
+            if chat_session.system_message is None:
+                chat_session.system_message = system_message
+            system_message = chat_session.system_message
+            chat_session.pinned_files.extend(chat_session.pending_uploads)
+            chat_session.pending_uploads = []
+            prefix = pinned_file_messages(chat_session)
+        else:
+            # Check if there are pending file uploads
+            file_context = read_pending_uploads(chat_session)
+            
+            # Combine file content with user message if there's file context
+            if file_context:
+                full_message = f"{message}\n\nFor reference, here are the recently uploaded files:{file_context}"
+        
+        # Older turns may have been replaced by a rolling summary
+        context_builder = get_context_builder(chat_session)
+        conversation_compactor = get_compactor()
+        context_history = conversation_compactor.apply(chat_id, chat_history) if conversation_compactor else chat_history
         
-        # Create messages with history and system message
-        messages = create_chat_messages(
+        # Create messages with history and system message, trimmed to the token budget
+        context = context_builder.build(
             user_message=full_message,
-            system_message=chat_settings.system_message,
-            chat_history=chat_history
+            system_message=system_message,
+            chat_history=context_history,
+            prefix=prefix
         )
-        logger.debug(f"Created messages with {len(messages)} entries")
+        messages = context.messages
+        logger.debug(f"Created messages with {len(messages)} entries (~{context.prompt_tokens} tokens)")
+        if context.truncated:
+            logger.info(f"Context for chat {chat_id} dropped {len(context.dropped)} messages (~{context.dropped_tokens} tokens) to fit the budget")
+        if conversation_compactor:
+            # Summarise in the background; later turns pick the summary up
+            conversation_compactor.maybe_schedule(chat_id, chat_history, count=context_builder.count)
         
-        client, lock = get_or_create_client(chat_id)
+        lock = chat_session.lock
+        
+        session = StreamSession(
+            chat_id,
+            protocol=protocol,
+            checkpoint_interval=web_settings.checkpoint_interval,
+            capacity=web_settings.replay_buffer_size
+        )
+        chat_session.stream = session
+        
+        # Offer an earlier answer to a reworded question while the model works
+        if client.similar is not None and client.similar.mode == MODE_SUGGEST:
+            match = client.find_similar(messages)
+            if match is not None:
+                session.suggestion(match.prompt, match.response.text, match.similarity)
+        
+        # Add the turn to history immediately; it is persisted when the stream ends
+        user_message = {"role": "user", "content": message}
+        assistant_message = {"role": "assistant", "content": ""}
+        chat_history.append(user_message)
+        chat_history.append(assistant_message)
+        session.pending_messages = [user_message, assistant_message]
         
         def generate():
-            logger.debug(f"Starting response stream for chat {chat_id}")
-
-            # Add user message to history immediately
-            chat_history.append({"role": "user", "content": message})
+            """Run the upstream call, publishing events into the stream session.
             
-            response_text = ""
-            thinking_text = ""
+            Runs in its own thread so the generation survives the browser
+            disconnecting; connections only read from the replay buffer.
+            """
+            logger.debug(f"Starting response stream for chat {chat_id} (protocol {protocol})")
             is_thinking = True
-            assistant_message = {"role": "assistant", "content": ""}
-            chat_history.append(assistant_message)
+            lock_held = False
             
             try:
-                with lock:
-                    for chunk_data in client.chat(messages=messages, stream=True):
-                        if not chunk_data:
-                            continue
-                        
-                        chunk_type = chunk_data['type']
-                        chunk_content = chunk_data['content']
-                        
-                        if chunk_type == 'thinking':
-                            thinking_text += chunk_content
-                            thinking = {
-                                'type': 'thinking',
-                                'content': chunk_content,
-                                'full_thinking': thinking_text,
-                                'chatId': chat_id
-                            }
-                            yield json.dumps(thinking, ensure_ascii=False) + '\n'
-                        else:
-                            if is_thinking:
-                                thinking_end = {
-                                    'type': 'thinking_end',
-                                    'chatId': chat_id
-                                }
-                                yield json.dumps(thinking_end) + '\n'
-                                is_thinking = False
-                            
-                            response_text += chunk_content
-                            assistant_message["content"] = response_text
-                            
-                            response_data = {
-                                'type': 'response',
-                                'chunk': chunk_content,
-                                'response': response_text,
-                                'chatId': chat_id,
-                                'format': 'markdown'
-                            }
-                            yield json.dumps(response_data, ensure_ascii=False) + '\n'
+                if not ticket.admitted:
+                    admitted = admission_controller.wait(
+                        ticket,
+                        on_position=session.queued,
+                        cancelled=lambda: session.cancelled or session.abandoned(web_settings.disconnect_grace)
+                    )
+                    if not admitted:
+                        if session.cancelled or session.abandoned(web_settings.disconnect_grace):
+                            raise StreamCancelled(session.cancel_reason or 'client disconnected')
+                        raise AdmissionTimeout('The server is busy, please try again shortly.', admission_controller.retry_after())
+                # An earlier message in this chat may still be generating
+                lock_held = lock.acquire(timeout=web_settings.queue_timeout)
+                if not lock_held:
+                    raise AdmissionTimeout('The previous message in this chat is still being answered.', web_settings.queue_timeout)
+                
+                if session.cancelled:
+                    raise StreamCancelled(session.cancel_reason)
+                upstream = client.chat(messages=messages, stream=True)
+                coalescer = get_coalescer()
+                stream = coalescer.coalesce(upstream) if coalescer is not None else upstream
+                for chunk_data in stream:
+                    # Stop paying for tokens nobody will read
+                    if not session.cancelled and session.abandoned(web_settings.disconnect_grace):
+                        session.cancel('client disconnected')
+                    if session.cancelled:
+                        stream.close()
+                        raise StreamCancelled(session.cancel_reason)
                     
-                    if is_thinking:
-                        thinking_end = {
-                            'type': 'thinking_end',
-                            'chatId': chat_id
-                        }
-                        yield json.dumps(thinking_end) + '\n'
+                    if not chunk_data:
+                        continue
                     
-                    # Save chat history to temp file after message exchange is complete
-                    save_chat_histories()
-                    logger.debug(f"Stream completed for chat {chat_id} and saved to temp file")
+                    chunk_type = chunk_data['type']
+                    chunk_content = chunk_data['content']
                     
+                    if chunk_type == 'thinking':
+                        session.thinking_delta(chunk_content)
+                    else:
+                        if is_thinking:
+                            session.thinking_end()
+                            is_thinking = False
+                        
+                        session.response_delta(chunk_content)
+                        assistant_message["content"] = session.encoder.response.text
+                
+                if is_thinking:
+                    session.thinking_end()
+                session.metrics(upstream.metrics.to_dict())
+                prompt_cache_tracker.record(chat_id, upstream.metrics)
+                
+                # Persist the exchange once it is complete
+                persist_messages(chat_id, [user_message, assistant_message])
+                session.pending_messages = []
+                logger.debug(f"Stream completed for chat {chat_id} and saved")
+                session.finish()
+                
+            except StreamCancelled as e:
+                logger.info(f"Stream for chat {chat_id} cancelled: {e}")
+                # Keep the partial answer, marked so it is not mistaken for a full one
+                assistant_message["truncated"] = True
+                persist_messages(chat_id, [user_message, assistant_message])
+                session.pending_messages = []
+                session.stopped(str(e))
+                session.finish()
+            except AdmissionTimeout as e:
+                logger.warning(f"Chat request for {chat_id} not admitted: {e}")
+                # Nothing was generated; drop the turn so a retry does not repeat it
+                for pending in (assistant_message, user_message):
+                    if chat_history and chat_history[-1] is pending:
+                        chat_history.pop()
+                session.pending_messages = []
+                session.error(str(e), retry_after=e.retry_after)
+                session.finish(success=False)
             except Exception as e:
                 logger.error(f"Error in stream for chat {chat_id}: {str(e)}", exc_info=True)
                 if chat_history and chat_history[-1]["role"] == "assistant":
                     chat_history.pop()
-                error_data = {
-                    'error': str(e),
-                    'chatId': chat_id
-                }
-                yield json.dumps(error_data) + '\n'
+                persist_messages(chat_id, [user_message])
+                session.pending_messages = []
+                session.error(str(e), retry_after=e.retry_after if isinstance(e, DeepSeekError) else None)
+                session.finish(success=False)
+            finally:
+                if lock_held:
+                    lock.release()
+                admission_controller.release(ticket)
+        
+        Thread(target=generate, name=f"stream-{chat_id}", daemon=True).start()
         
         return Response(
-            stream_with_context(generate()),
+            stream_with_context(session.subscribe(0)),
             mimetype='application/json'
         )
         
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}", exc_info=True)
+        if ticket is not None:
+            get_admission().release(ticket)
         return {'error': str(e)}, 500
 
+@app.route('/api/resume', methods=['GET'])
+def resume_stream():
+    """Replay a chat's latest stream from an offset, then follow it live.
+    
+    Query parameters:
+        chatId: Chat whose stream to resume.
+        offset: First event to replay (the protocol 2 sequence number).
+        active: If set, return 204 unless the stream is still generating.
+    """
+    chat_id = request.args.get('chatId', 'chat-1')
+    offset = request.args.get('offset', 0, type=int)
+    active_only = request.args.get('active', type=int)
+    
+    chat_session = sessions.peek(chat_id)
+    session = chat_session.stream if chat_session else None
+    if session is None:
+        return jsonify({'error': f'No stream for chat {chat_id}'}), 404
+    if active_only and not session.active:
+        return '', 204
+    
+    logger.info(f"Resuming stream for chat {chat_id} from offset {offset}")
+    return Response(
+        stream_with_context(session.subscribe(offset)),
+        mimetype='application/json'
+    )
+
+@app.route('/api/cancel', methods=['POST'])
+def cancel_stream():
+    """Stop a chat's running generation and release its lock.
+    
+    The partial answer is kept in the history, marked as truncated.
+    """
+    data = request.get_json(silent=True) or {}
+    chat_id = data.get('chatId', 'chat-1')
+    
+    chat_session = sessions.peek(chat_id)
+    session = chat_session.stream if chat_session else None
+    if session is None or not session.active:
+        return jsonify({'status': 'success', 'cancelled': False})
+    
+    session.cancel('cancelled by client')
+    logger.info(f"Cancellation requested for chat {chat_id}")
+    return jsonify({'status': 'success', 'cancelled': True})
+
 @app.route('/api/clear', methods=['POST'])
 def clear_history():
     """Clear chat history and remove client instance."""
     data = request.json
     chat_id = data.get('chatId', 'chat-1')
     
-    if chat_id in chat_histories:
-        chat_histories[chat_id] = []
+    chat_session = sessions.get(chat_id)
+    chat_session.history = []
+    chat_session.pinned_files = []
+    chat_session.system_message = None
+    history_store.clear(chat_id)
+    if compactor is not None:
+        compactor.forget(chat_id)
     
     # Clean up client instance
-    if chat_id in chat_clients:
+    if chat_session.client is not None:
         print(f"[DEBUG] Removing client for {chat_id} on clear", file=sys.stderr)
-        del chat_clients[chat_id]
+        chat_session.client = None
     
     return jsonify({'status': 'success'})
 
@@ -341,38 +693,35 @@ def upload_file():
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
             
-            # Read file content and store it for later use
+            # Check the file is readable text; its content is read again
+            # from disk when the next message includes it
             with open(filepath, 'r', encoding='utf-8') as f:
-                file_content = f.read()
+                for _ in f:
+                    pass
             
-            # Store file content in pending uploads
-            if chat_id not in pending_file_uploads:
-                pending_file_uploads[chat_id] = []
-            pending_file_uploads[chat_id].append({
+            chat_session = sessions.get(chat_id)
+            chat_session.pending_uploads.append({
                 'filename': original_filename,
-                'content': file_content
+                'path': filepath
             })
             
-            # Initialize chat history for this chat if it doesn't exist
-            if chat_id not in chat_histories:
-                chat_histories[chat_id] = []
-            
-            chat_history = chat_histories[chat_id]
+            chat_history = chat_session.history
             
             # Add only confirmation messages to chat history
-            chat_history.extend([
+            confirmation = [
                 {"role": "user", "content": f"I've uploaded a file named {original_filename}."},
                 {"role": "assistant", "content": f"I've received the file '{original_filename}'. You can now ask me questions about its contents."}
-            ])
+            ]
+            chat_history.extend(confirmation)
             
             # Save chat histories
-            save_chat_histories()
+            persist_messages(chat_id, confirmation)
             
             return jsonify({
                 'success': True,
                 'filename': filename,
                 'original_filename': original_filename,
-                'history': chat_history
+                'history': confirmation
             })
         except Exception as e:
             logger.error(f"Error processing file: {str(e)}")
@@ -387,26 +736,48 @@ def uploaded_file(filename):
 
 @app.route('/api/load_history', methods=['GET'])
 def load_history():
-    """Load chat histories from disk and return them."""
+    """Return a chat's history, a page at a time.
+    
+    Query parameters:
+        chatId: Chat to read (default chat-1).
+        limit: Page size. Without it the legacy {'chat-1': [...]} shape is returned.
+        before: Cursor from a previous page's 'next_cursor'.
+    """
     try:
-        if os.path.exists(temp_chat_file):
-            with open(temp_chat_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                # Ensure we return a dictionary with chat-1 key
-                if isinstance(history, list):
-                    history = {'chat-1': history}
-                return jsonify(history)
-        else:
-            return jsonify({'chat-1': []})
+        chat_id = request.args.get('chatId', 'chat-1')
+        limit = request.args.get('limit', type=int)
+        before = request.args.get('before', type=int)
+        
+        if limit is None:
+            # The in-memory history mirrors the store, plus any turn still streaming
+            return jsonify({chat_id: sessions.get(chat_id).history})
+        
+        page = history_store.page(chat_id, limit=max(1, limit), before=before)
+        
+        # A reply still being generated is not persisted yet; add it to the
+        # newest page so the browser can show the prompt and resume the stream
+        chat_session = sessions.peek(chat_id)
+        session = chat_session.stream if chat_session else None
+        if before is None and session is not None and session.active and session.pending_messages:
+            page['messages'].extend(session.pending_messages)
+        
+        page['chatId'] = chat_id
+        return jsonify(page)
     except Exception as e:
         logger.error(f"Error loading chat histories: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chats', methods=['GET'])
+def list_chats():
+    """List persisted chats, most recently updated first."""
+    try:
+        return jsonify({'chats': history_store.list_chats()})
+    except Exception as e:
+        logger.error(f"Error listing chats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 def main():
     """Run the web application."""
-    # Load existing chat histories
-    load_chat_histories()
-    
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='BunnyChat web interface')
     parser.add_argument('--port', type=int, default=web_settings.port,
@@ -417,6 +788,35 @@ def main():
                       help='Enable debug mode')
     parser.add_argument('--model', type=str, default=chat_settings.model,
                       help=f'Model to use (default: {chat_settings.model}). Options: deepseek-reasoner, deepseek-chat, deepseek-coder')
+    parser.add_argument('--max-connections', type=int, default=transport_settings.max_connections,
+                      help=f'Maximum upstream connections in the shared pool (default: {transport_settings.max_connections})')
+    parser.add_argument('--stream-protocol', type=int, choices=SUPPORTED_PROTOCOLS, default=web_settings.stream_protocol,
+                      help=f'Default /api/chat stream protocol, 1 = legacy full-text payloads (default: {web_settings.stream_protocol})')
+    parser.add_argument('--compact', action='store_true', default=compaction_settings.enabled,
+                      help=f'Summarise older turns of long chats with {compaction_settings.model} in the background')
+    parser.add_argument('--response-cache', action='store_true', default=response_cache_settings.enabled,
+                      help='Answer repeated identical requests from the response cache')
+    parser.add_argument('--similar-cache', choices=('return', 'suggest'),
+                      default=similarity_cache_settings.mode if similarity_cache_settings.enabled else None,
+                      help='Reuse answers to reworded standalone questions: return them, or suggest them alongside the live answer')
+    parser.add_argument('--coalesce', action='store_true', default=chat_settings.coalesce_requests,
+                      help='Share one upstream call between identical concurrent requests')
+    parser.add_argument('--hedge', action='store_true', default=resilience_settings.hedge,
+                      help='Race a second upstream request when the first token is unusually slow')
+    parser.add_argument('--rpm', type=int, default=None,
+                      help='Limit upstream requests per minute across all chats')
+    parser.add_argument('--tpm', type=int, default=None,
+                      help='Limit upstream tokens per minute across all chats')
+    parser.add_argument('--max-streams', type=int, default=web_settings.max_active_streams,
+                      help=f'Maximum generations running at once (default: {web_settings.max_active_streams})')
+    parser.add_argument('--max-queued', type=int, default=web_settings.max_queued_streams,
+                      help=f'Maximum chat requests waiting for a generation slot (default: {web_settings.max_queued_streams})')
+    parser.add_argument('--stable-prefix', action='store_true', default=chat_settings.prompt_layout == 'stable',
+                      help='Send uploaded files as pinned messages before the history, keeping the prompt prefix cacheable')
+    parser.add_argument('--chunk-window', type=float, default=coalesce_settings.window,
+                      help=f'Seconds to merge streamed tokens before sending them, 0 sends each token (default: {coalesce_settings.window})')
+    parser.add_argument('--http2', action='store_true', default=transport_settings.http2,
+                      help='Use HTTP/2 for upstream connections (requires the h2 package)')
     
     args = parser.parse_args()
     
@@ -424,7 +824,26 @@ def main():
     web_settings.port = args.port
     web_settings.host = args.host
     web_settings.debug = args.debug
+    web_settings.stream_protocol = args.stream_protocol
+    web_settings.max_active_streams = args.max_streams
+    web_settings.max_queued_streams = args.max_queued
     chat_settings.model = args.model  # Update model setting
+    transport_settings.max_connections = args.max_connections
+    transport_settings.http2 = args.http2
+    compaction_settings.enabled = args.compact
+    response_cache_settings.enabled = args.response_cache
+    chat_settings.coalesce_requests = args.coalesce
+    if args.stable_prefix:
+        chat_settings.prompt_layout = 'stable'
+    resilience_settings.hedge = args.hedge
+    coalesce_settings.window = args.chunk_window
+    if args.rpm or args.tpm:
+        rate_limit_settings.enabled = True
+        rate_limit_settings.requests_per_minute = args.rpm
+        rate_limit_settings.tokens_per_minute = args.tpm
+    if args.similar_cache:
+        similarity_cache_settings.enabled = True
+        similarity_cache_settings.mode = args.similar_cache
     
     # Set up signal handler for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
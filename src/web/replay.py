@@ -0,0 +1,92 @@
+"""
+Bounded replay buffer for in-flight response streams.
+"""
+
+import threading
+from collections import deque
+from typing import Any, Iterator, List, Optional, Tuple
+
+
+class ReplayBuffer:
+    """Ring buffer of stream events addressed by a monotonically increasing offset.
+    
+    A producer appends events while any number of readers replay from an
+    offset and then follow the live tail. Only the newest `capacity`
+    events are kept; readers asking for an evicted offset resume at the
+    oldest retained one.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        """Initialize the buffer.
+        
+        Args:
+            capacity: Maximum number of events retained.
+        """
+        self._entries = deque(maxlen=capacity)
+        self._next_offset = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def base_offset(self) -> int:
+        """Offset of the oldest retained event."""
+        return self._next_offset - len(self._entries)
+
+    @property
+    def next_offset(self) -> int:
+        """Offset the next appended event will get."""
+        return self._next_offset
+
+    @property
+    def closed(self) -> bool:
+        """Whether the producer has finished."""
+        return self._closed
+
+    @property
+    def lock(self) -> threading.Condition:
+        """Condition guarding the buffer, for callers that need atomic snapshots."""
+        return self._cond
+
+    def extend(self, items: List[Any]):
+        """Append events and wake up waiting readers."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Cannot append to a closed replay buffer")
+            self._entries.extend(items)
+            self._next_offset += len(items)
+            self._cond.notify_all()
+
+    def close(self):
+        """Mark the stream finished; readers drain what is left and stop."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def read(self, offset: int, timeout: Optional[float] = None) -> Tuple[List[Any], int]:
+        """Return events from `offset`, waiting for new ones if none are available.
+        
+        Args:
+            offset: First offset wanted. Offsets older than the buffer are clamped.
+            timeout: Maximum seconds to wait for new events.
+            
+        Returns:
+            Tuple of (events, offset to read next). Events is empty on timeout
+            or when the buffer is closed and drained.
+        """
+        with self._cond:
+            if offset >= self._next_offset and not self._closed:
+                self._cond.wait_for(lambda: offset < self._next_offset or self._closed, timeout)
+            start = max(offset, self.base_offset)
+            if start >= self._next_offset:
+                return [], start
+            skip = start - self.base_offset
+            items = [self._entries[i] for i in range(skip, len(self._entries))]
+            return items, self._next_offset
+
+    def follow(self, offset: int = 0, poll_interval: float = 1.0) -> Iterator[Any]:
+        """Replay from `offset` and keep yielding live events until the buffer closes."""
+        while True:
+            items, offset = self.read(offset, timeout=poll_interval)
+            yield from items
+            if not items and self._closed and offset >= self._next_offset:
+                return
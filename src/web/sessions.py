@@ -0,0 +1,216 @@
+"""
+Bounded in-memory state for web chats.
+
+Each chat's history, client, lock, pending uploads and latest stream live in
+a ChatSession. The SessionManager keeps sessions in LRU order under a memory
+budget and an idle timeout. Evicted sessions spill their non-persisted state
+to disk and are rehydrated lazily the next time the chat is used, so memory
+stays flat however many chats the server has seen.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import quote
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rough per-message overhead of a dict with two short keys
+_MESSAGE_OVERHEAD = 240
+
+
+@dataclass
+class ChatSession:
+    """In-memory state of one chat."""
+    chat_id: str
+    history: List[Dict[str, Any]] = field(default_factory=list)
+    # Uploaded files not yet sent to the model: {'filename', 'path'}; the
+    # contents stay on disk until the next message needs them
+    pending_uploads: List[Dict[str, str]] = field(default_factory=list)
+    # Uploaded files sent before the history on every turn (stable prompt layout)
+    pinned_files: List[Dict[str, str]] = field(default_factory=list)
+    # System message frozen at the chat's first turn (stable prompt layout)
+    system_message: Optional[str] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    stream: Optional[Any] = None  # Latest StreamSession, kept for resuming
+    client: Optional[Any] = None
+    context: Optional[Any] = None  # ContextBuilder with this chat's cached token counts
+    last_access: float = field(default_factory=time.time)
+    size: int = 0
+
+    @property
+    def busy(self) -> bool:
+        """Whether a generation is running or queued for this chat."""
+        return self.lock.locked() or (self.stream is not None and self.stream.active)
+
+    def estimate_size(self) -> int:
+        """Estimate the memory held by this session, in bytes."""
+        size = sum(len(msg.get('content', '')) + _MESSAGE_OVERHEAD for msg in self.history)
+        if self.stream is not None:
+            size += len(self.stream.encoder.thinking.text) + len(self.stream.encoder.response.text)
+        self.size = size
+        return size
+
+
+class SessionManager:
+    """LRU cache of chat sessions with a memory budget and idle expiry."""
+
+    def __init__(
+        self,
+        load_history: Callable[[str], List[Dict[str, Any]]],
+        spill_dir: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        idle_timeout: float = 3600.0,
+        sweep_interval: float = 60.0
+    ):
+        """Initialize the manager.
+        
+        Args:
+            load_history: Returns a chat's persisted history, used to rehydrate.
+            spill_dir: Directory for the state of evicted sessions.
+            max_bytes: Memory budget for all sessions combined.
+            idle_timeout: Evict sessions unused for this many seconds.
+            sweep_interval: Seconds between background idle sweeps.
+        """
+        self.load_history = load_history
+        self.spill_dir = spill_dir
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._evictions = 0
+        self._rehydrations = 0
+        os.makedirs(spill_dir, exist_ok=True)
+        
+        self._stop = threading.Event()
+        if sweep_interval > 0:
+            threading.Thread(
+                target=self._sweep_loop, args=(sweep_interval,), name="session-sweeper", daemon=True
+            ).start()
+
+    def _spill_path(self, chat_id: str) -> str:
+        return os.path.join(self.spill_dir, quote(chat_id, safe='') + '.json')
+
+    def get(self, chat_id: str) -> ChatSession:
+        """Return a chat's session, rehydrating it from disk if it was evicted."""
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is None:
+                session = self._rehydrate(chat_id)
+                self._sessions[chat_id] = session
+            else:
+                self._sessions.move_to_end(chat_id)
+            session.last_access = time.time()
+            session.estimate_size()
+            self._enforce_budget(keep=chat_id)
+            return session
+
+    def peek(self, chat_id: str) -> Optional[ChatSession]:
+        """Return a chat's session only if it is in memory, without touching it."""
+        with self._lock:
+            return self._sessions.get(chat_id)
+
+    def _rehydrate(self, chat_id: str) -> ChatSession:
+        session = ChatSession(chat_id=chat_id, history=self.load_history(chat_id))
+        path = self._spill_path(chat_id)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    spilled = json.load(f)
+                session.pending_uploads = spilled.get('pending_uploads', [])
+                session.pinned_files = spilled.get('pinned_files', [])
+                session.system_message = spilled.get('system_message')
+                os.remove(path)
+                self._rehydrations += 1
+                logger.debug(f"Rehydrated session {chat_id} from {path}")
+            except Exception as e:
+                logger.error(f"Error rehydrating session {chat_id}: {str(e)}")
+        return session
+
+    def _spill(self, session: ChatSession):
+        """Write the state that is not in the history store."""
+        if not session.pending_uploads and not session.pinned_files and session.system_message is None:
+            return
+        path = self._spill_path(session.chat_id)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'chat_id': session.chat_id,
+                'pending_uploads': session.pending_uploads,
+                'pinned_files': session.pinned_files,
+                'system_message': session.system_message
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _evict(self, chat_id: str, reason: str) -> bool:
+        session = self._sessions.get(chat_id)
+        if session is None or session.busy:
+            return False
+        try:
+            self._spill(session)
+        except Exception as e:
+            logger.error(f"Error spilling session {chat_id}, keeping it in memory: {str(e)}")
+            return False
+        del self._sessions[chat_id]
+        self._evictions += 1
+        logger.debug(f"Evicted session {chat_id} ({reason}, {session.size} bytes)")
+        return True
+
+    def _enforce_budget(self, keep: Optional[str] = None):
+        total = sum(session.size for session in self._sessions.values())
+        if total <= self.max_bytes:
+            return
+        for chat_id in list(self._sessions.keys()):  # Least recently used first
+            if total <= self.max_bytes:
+                break
+            if chat_id == keep:
+                continue
+            size = self._sessions[chat_id].size
+            if self._evict(chat_id, 'memory budget'):
+                total -= size
+
+    def sweep(self):
+        """Evict idle sessions and re-check the memory budget."""
+        now = time.time()
+        with self._lock:
+            for chat_id, session in list(self._sessions.items()):
+                if now - session.last_access >= self.idle_timeout:
+                    self._evict(chat_id, 'idle')
+            for session in self._sessions.values():
+                session.estimate_size()
+            self._enforce_budget()
+
+    def _sweep_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Session sweep failed: {str(e)}", exc_info=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return occupancy and eviction counters."""
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'bytes': sum(session.size for session in self._sessions.values()),
+                'max_bytes': self.max_bytes,
+                'idle_timeout': self.idle_timeout,
+                'evictions': self._evictions,
+                'rehydrations': self._rehydrations
+            }
+
+    def close(self):
+        """Stop the sweeper and spill every session's state."""
+        self._stop.set()
+        with self._lock:
+            for session in self._sessions.values():
+                try:
+                    self._spill(session)
+                except Exception as e:
+                    logger.error(f"Error spilling session {session.chat_id}: {str(e)}")
@@ -0,0 +1,316 @@
+"""
+Wire protocol for /api/chat response streams.
+
+Protocol 1 is the original shape: every event repeats the whole accumulated
+thinking or response text, which makes a reply O(n^2) in its length.
+Protocol 2 sends only deltas, each tagged with a sequence number, plus
+periodic checkpoints carrying the byte length and CRC32 of the text so far
+so the browser can detect a lost or reordered event.
+
+A StreamSession decouples a generation from the HTTP response that started
+it: events go into a bounded replay buffer and any number of connections can
+replay from an offset and follow the live tail.
+"""
+
+import json
+import time
+import threading
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.web.replay import ReplayBuffer
+
+PROTOCOL_LEGACY = 1
+PROTOCOL_DELTA = 2
+SUPPORTED_PROTOCOLS = (PROTOCOL_LEGACY, PROTOCOL_DELTA)
+
+
+class _TextState:
+    """Accumulated text plus the running length and checksum of its UTF-8 bytes."""
+
+    def __init__(self):
+        self.text = ""
+        self.length = 0
+        self.crc32 = 0
+
+    def append(self, delta: str):
+        data = delta.encode('utf-8')
+        self.text += delta
+        self.length += len(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+
+
+class StreamEncoder:
+    """Encode one chat response stream as newline-delimited JSON lines.
+    
+    Every method returns the list of lines to send, each terminated by a
+    newline. In protocol 2 each line carries its own sequence number.
+    """
+
+    def __init__(self, chat_id: str, protocol: int = PROTOCOL_DELTA, checkpoint_interval: int = 64):
+        """Initialize the encoder.
+        
+        Args:
+            chat_id: Chat the stream belongs to, echoed in every event.
+            protocol: Wire protocol version (1 = legacy full text, 2 = deltas).
+            checkpoint_interval: Emit a checkpoint after this many delta events (protocol 2).
+        """
+        if protocol not in SUPPORTED_PROTOCOLS:
+            raise ValueError(f"Unsupported stream protocol: {protocol}")
+        self.chat_id = chat_id
+        self.protocol = protocol
+        self.checkpoint_interval = max(1, checkpoint_interval)
+        self.seq = 0
+        self.thinking = _TextState()
+        self.response = _TextState()
+        self.thinking_ended = False
+        self._since_checkpoint = 0
+
+    def _line(self, payload: Dict[str, Any]) -> str:
+        if self.protocol == PROTOCOL_DELTA:
+            payload = {'v': PROTOCOL_DELTA, 'seq': self.seq, **payload}
+        self.seq += 1
+        return json.dumps(payload, ensure_ascii=False) + '\n'
+
+    def _delta_lines(self, payload: Dict[str, Any]) -> List[str]:
+        lines = [self._line(payload)]
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_interval:
+            lines.append(self._checkpoint())
+        return lines
+
+    def _checkpoint(self) -> str:
+        self._since_checkpoint = 0
+        return self._line({
+            'type': 'checkpoint',
+            'thinking_length': self.thinking.length,
+            'thinking_crc32': self.thinking.crc32,
+            'response_length': self.response.length,
+            'response_crc32': self.response.crc32,
+            'chatId': self.chat_id
+        })
+
+    def thinking_delta(self, delta: str) -> List[str]:
+        """Encode a chunk of the model's reasoning."""
+        self.thinking.append(delta)
+        if self.protocol == PROTOCOL_LEGACY:
+            return [self._line({
+                'type': 'thinking',
+                'content': delta,
+                'full_thinking': self.thinking.text,
+                'chatId': self.chat_id
+            })]
+        return self._delta_lines({'type': 'thinking', 'delta': delta, 'chatId': self.chat_id})
+
+    def thinking_end(self) -> List[str]:
+        """Encode the end of the reasoning phase."""
+        self.thinking_ended = True
+        return [self._line({'type': 'thinking_end', 'chatId': self.chat_id})]
+
+    def response_delta(self, delta: str) -> List[str]:
+        """Encode a chunk of the final answer."""
+        self.response.append(delta)
+        if self.protocol == PROTOCOL_LEGACY:
+            return [self._line({
+                'type': 'response',
+                'chunk': delta,
+                'response': self.response.text,
+                'chatId': self.chat_id,
+                'format': 'markdown'
+            })]
+        return self._delta_lines({
+            'type': 'response',
+            'delta': delta,
+            'chatId': self.chat_id,
+            'format': 'markdown'
+        })
+
+    def suggestion(self, prompt: str, content: str, similarity: float) -> List[str]:
+        """Encode an earlier answer to a similar question (protocol 2; ignored by protocol 1)."""
+        if self.protocol == PROTOCOL_LEGACY:
+            return []
+        return [self._line({
+            'type': 'suggestion',
+            'prompt': prompt,
+            'content': content,
+            'similarity': round(similarity, 3),
+            'chatId': self.chat_id
+        })]
+
+    def cancelled(self, reason: str) -> List[str]:
+        """Encode the stream being stopped before the model finished."""
+        payload = {'cancelled': True, 'reason': reason, 'chatId': self.chat_id}
+        if self.protocol == PROTOCOL_DELTA:
+            payload = {'type': 'cancelled', **payload}
+        return [self._line(payload)]
+
+    def queued(self, position: int) -> List[str]:
+        """Encode the request's place in the admission queue (protocol 2; ignored by protocol 1)."""
+        if self.protocol == PROTOCOL_LEGACY:
+            return []
+        return [self._line({'type': 'queued', 'position': position, 'chatId': self.chat_id})]
+
+    def metrics(self, metrics: Dict[str, Any]) -> List[str]:
+        """Encode the upstream call's latency and token usage (protocol 2; ignored by protocol 1)."""
+        if self.protocol == PROTOCOL_LEGACY:
+            return []
+        return [self._line({'type': 'metrics', 'metrics': metrics, 'chatId': self.chat_id})]
+
+    def error(self, message: str, retry_after: Optional[float] = None) -> List[str]:
+        """Encode a stream error, with the seconds to wait before retrying if known."""
+        payload = {'error': message, 'chatId': self.chat_id}
+        if retry_after is not None:
+            payload['retry_after'] = round(retry_after, 1)
+        if self.protocol == PROTOCOL_DELTA:
+            payload = {'type': 'error', **payload}
+        return [self._line(payload)]
+
+    def done(self) -> List[str]:
+        """Encode the end of the stream: a final checkpoint and a done marker (protocol 2)."""
+        if self.protocol == PROTOCOL_LEGACY:
+            return []
+        return [self._checkpoint(), self._line({'type': 'done', 'chatId': self.chat_id})]
+
+    def snapshot(self, finished: bool = False) -> str:
+        """Encode the full state so far, for readers whose offset was evicted (protocol 2).
+        
+        The snapshot has no sequence number of its own; `next_seq` tells the
+        reader which event follows it, and `finished` that none will.
+        """
+        return json.dumps({
+            'v': PROTOCOL_DELTA,
+            'type': 'snapshot',
+            'next_seq': self.seq,
+            'thinking': self.thinking.text,
+            'thinking_ended': self.thinking_ended,
+            'response': self.response.text,
+            'finished': finished,
+            'chatId': self.chat_id
+        }, ensure_ascii=False) + '\n'
+
+
+class StreamSession:
+    """One generation for a chat, replayable by any number of connections."""
+
+    def __init__(
+        self,
+        chat_id: str,
+        protocol: int = PROTOCOL_DELTA,
+        checkpoint_interval: int = 64,
+        capacity: int = 4096
+    ):
+        """Initialize the session.
+        
+        Args:
+            chat_id: Chat the stream belongs to.
+            protocol: Wire protocol version.
+            checkpoint_interval: Delta events between checkpoints (protocol 2).
+            capacity: Number of encoded lines kept for replay.
+        """
+        self.chat_id = chat_id
+        self.encoder = StreamEncoder(chat_id, protocol, checkpoint_interval)
+        self.buffer = ReplayBuffer(capacity)
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancel_reason: Optional[str] = None
+        # Messages of this turn that are not persisted until the stream ends
+        self.pending_messages: List[Dict[str, Any]] = []
+        self._cancel_event = threading.Event()
+        self._subscribers = 0
+        self._last_detached_at: Optional[float] = None
+        self._subscribers_lock = threading.Lock()
+
+    @property
+    def protocol(self) -> int:
+        return self.encoder.protocol
+
+    @property
+    def active(self) -> bool:
+        """Whether the generation is still producing events."""
+        return not self.buffer.closed
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the generation has been asked to stop."""
+        return self._cancel_event.is_set()
+
+    def cancel(self, reason: str):
+        """Ask the producer to stop the upstream call at the next chunk."""
+        if not self._cancel_event.is_set():
+            self.cancel_reason = reason
+            self._cancel_event.set()
+
+    def abandoned(self, grace: float) -> bool:
+        """Whether every reader detached at least `grace` seconds ago."""
+        with self._subscribers_lock:
+            if self._subscribers or self._last_detached_at is None:
+                return False
+            return time.time() - self._last_detached_at >= grace
+
+    def _publish(self, lines: List[str]):
+        self.buffer.extend(lines)
+
+    def thinking_delta(self, delta: str):
+        with self.buffer.lock:
+            self._publish(self.encoder.thinking_delta(delta))
+
+    def thinking_end(self):
+        with self.buffer.lock:
+            self._publish(self.encoder.thinking_end())
+
+    def response_delta(self, delta: str):
+        with self.buffer.lock:
+            self._publish(self.encoder.response_delta(delta))
+
+    def suggestion(self, prompt: str, content: str, similarity: float):
+        with self.buffer.lock:
+            self._publish(self.encoder.suggestion(prompt, content, similarity))
+
+    def queued(self, position: int):
+        with self.buffer.lock:
+            self._publish(self.encoder.queued(position))
+
+    def metrics(self, metrics: Dict[str, Any]):
+        with self.buffer.lock:
+            self._publish(self.encoder.metrics(metrics))
+
+    def error(self, message: str, retry_after: Optional[float] = None):
+        with self.buffer.lock:
+            self._publish(self.encoder.error(message, retry_after))
+
+    def stopped(self, reason: str):
+        with self.buffer.lock:
+            self._publish(self.encoder.cancelled(reason))
+
+    def finish(self, success: bool = True):
+        """Publish the closing events (on success) and close the buffer."""
+        with self.buffer.lock:
+            if success:
+                self._publish(self.encoder.done())
+            self.finished_at = time.time()
+            self.buffer.close()
+
+    def subscribe(self, offset: int = 0) -> Iterator[str]:
+        """Yield encoded lines from `offset`, then follow the live tail.
+        
+        A reader whose offset has been evicted from the ring gets a snapshot
+        of the full text (protocol 2) and continues from the oldest retained
+        event, so reconnecting never needs a new upstream call.
+        """
+        with self.buffer.lock:
+            if offset < self.buffer.base_offset and self.protocol == PROTOCOL_DELTA:
+                snapshot = self.encoder.snapshot(finished=self.buffer.closed)
+                offset = self.buffer.next_offset
+            else:
+                snapshot = None
+        with self._subscribers_lock:
+            self._subscribers += 1
+        try:
+            if snapshot:
+                yield snapshot
+            yield from self.buffer.follow(offset)
+        finally:
+            # Runs when the response is closed, including a client disconnect
+            with self._subscribers_lock:
+                self._subscribers -= 1
+                self._last_detached_at = time.time()
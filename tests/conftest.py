@@ -0,0 +1,4 @@
+import os
+
+# src.config.settings validates the DeepSeek key when imported; tests never call the API
+os.environ.setdefault('DEEPSEEK_API_KEY', 'test')
@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.chat.client import DeepSeekClient
+from src.chat.errors import DeepSeekConnectionError
+from src.chat.metrics import MetricsRegistry
+from src.chat.resilience import Resilience, RetryPolicy
+
+
+class FakeTicket:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.waited = 0.5
+        self.settled = []
+
+    def settle(self, actual_tokens):
+        self.settled.append(actual_tokens)
+
+
+class FakeLimiter:
+    def __init__(self):
+        self.tickets = []
+
+    def acquire(self, key="default", tokens=0, timeout=None):
+        ticket = FakeTicket(tokens)
+        self.tickets.append(ticket)
+        return ticket
+
+    async def acquire_async(self, key="default", tokens=0, timeout=None):
+        return self.acquire(key, tokens, timeout)
+
+
+def _usage(total):
+    return SimpleNamespace(prompt_tokens=total - 2, completion_tokens=2, total_tokens=total)
+
+
+def _completion(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=_usage(42))
+
+
+def _chunks(text):
+    delta = SimpleNamespace(content=text, reasoning_content=None)
+    yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+    yield SimpleNamespace(choices=[], usage=_usage(17))
+
+
+def _client(limiter):
+    return DeepSeekClient(
+        api_key="test",
+        resilience=Resilience(RetryPolicy(max_attempts=3, base_delay=0)),
+        rate_limiter=limiter,
+        metrics=MetricsRegistry()
+    )
+
+
+def _flaky(result):
+    """A _create replacement failing once before returning `result()`."""
+    attempts = []
+
+    def create(messages, stream, temperature, max_tokens, kwargs):
+        attempts.append(stream)
+        if len(attempts) == 1:
+            raise DeepSeekConnectionError("connection reset")
+        return result()
+    return create, attempts
+
+
+def test_retries_share_one_ticket():
+    limiter = FakeLimiter()
+    client = _client(limiter)
+    client._create, attempts = _flaky(lambda: _completion("hello"))
+
+    assert client.chat([{'role': 'user', 'content': 'hi'}]) == "hello"
+    assert len(attempts) == 2
+    assert len(limiter.tickets) == 1
+    assert limiter.tickets[0].settled == [42]
+    assert client.last_metrics.queue_time == 0.5
+
+
+def test_stream_ticket_settled_from_usage():
+    limiter = FakeLimiter()
+    client = _client(limiter)
+    client._create, attempts = _flaky(lambda: _chunks("streamed"))
+
+    stream = client.chat([{'role': 'user', 'content': 'hi'}], stream=True)
+    assert ''.join(chunk['content'] for chunk in stream) == "streamed"
+    assert len(attempts) == 2
+    assert len(limiter.tickets) == 1
+    assert limiter.tickets[0].settled == [17]
+
+
+def test_async_retries_share_one_ticket():
+    limiter = FakeLimiter()
+    client = _client(limiter)
+    create, attempts = _flaky(lambda: _completion("hello"))
+
+    async def acreate(*args):
+        return create(*args)
+
+    client._acreate = acreate
+    assert asyncio.run(client.achat([{'role': 'user', 'content': 'hi'}])) == "hello"
+    assert len(attempts) == 2
+    assert len(limiter.tickets) == 1
+    assert limiter.tickets[0].settled == [42]
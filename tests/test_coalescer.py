@@ -0,0 +1,40 @@
+import asyncio
+
+from src.chat.coalescer import ChunkCoalescer
+
+
+def _chunk(text):
+    return {'type': 'response', 'content': text}
+
+
+def test_merges_within_window():
+    coalescer = ChunkCoalescer(window=10.0, flush_first=False)
+    chunks = list(coalescer.coalesce(iter([_chunk("a"), _chunk("b"), _chunk("c\n"), _chunk("d")])))
+    assert chunks == [_chunk("abc\n"), _chunk("d")]
+
+
+def test_async_close_while_read_pending():
+    closed = []
+
+    async def source():
+        try:
+            yield _chunk("first")
+            yield _chunk("second")
+            await asyncio.sleep(10)
+            yield _chunk("never")
+        finally:
+            closed.append(True)
+
+    async def consume():
+        coalescer = ChunkCoalescer(window=0.01, flush_first=False)
+        stream = coalescer.acoalesce(source())
+        received = []
+        async for chunk in stream:
+            # The window flush leaves a read of the sleeping source pending
+            received.append(chunk)
+            break
+        await stream.aclose()
+        return received
+
+    assert asyncio.run(consume()) == [_chunk("firstsecond")]
+    assert closed == [True]
@@ -0,0 +1,64 @@
+import os
+import re
+import sys
+
+import pytest
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools')
+sys.path.insert(0, TOOLS_DIR)
+from html_extractor import extract_text  # noqa: E402
+
+CORPUS_DIR = os.path.join(TOOLS_DIR, 'bench_corpus')
+CORPUS = sorted(name for name in os.listdir(CORPUS_DIR) if name.endswith('.html'))
+
+
+def _backends():
+    names = ['html.parser']
+    try:
+        extract_text('<p>probe</p>', 'lxml')
+        names.append('lxml')
+    except ImportError:
+        pass
+    return names
+
+
+@pytest.fixture(params=_backends())
+def backend(request):
+    return request.param
+
+
+def _read(name):
+    with open(os.path.join(CORPUS_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def test_cookie_in_a_content_class_is_kept(backend):
+    html = '<html><body><main class="page has-cookie-banner"><p>Main article text</p></main></body></html>'
+    assert extract_text(html, backend) == '    Main article text'
+    assert 'Chocolate chip' in extract_text(
+        '<div class="cookie-recipe"><p>Chocolate chip</p></div><div id="consent-form-help"><p>Help</p></div>', backend)
+
+
+@pytest.mark.parametrize('attrs', [
+    'id="cookie-banner"', 'class="consent-popup"', 'class="gdpr-notice"', 'class="cc-window cc-floating"',
+    'id="onetrust-banner-sdk"', 'id="CybotCookiebotDialog"', 'class="Cookie-Banner"',
+])
+def test_banners_are_pruned(backend, attrs):
+    html = f'<body><div {attrs}><p>We use cookies</p><a href="/accept">Accept</a></div><p>Body text</p></body>'
+    assert extract_text(html, backend).split() == ['Body', 'text']
+    assert 'We use cookies' in extract_text(html, backend, prune_boilerplate=False)
+
+
+@pytest.mark.parametrize('page', CORPUS)
+def test_pruning_keeps_corpus_content(backend, page):
+    html = _read(page)
+    kept = extract_text(html, backend, prune_boilerplate=False).splitlines()
+    pruned = extract_text(html, backend).splitlines()
+    # Pruning only removes furniture: most of the page survives
+    assert len(pruned) >= 0.8 * len(kept)
+
+    # A content wrapper whose class merely mentions a banner prunes nothing more
+    wrapped = re.sub(r'(<body[^>]*>)', r'\1<div class="page has-cookie-banner">', html, count=1)
+    wrapped = wrapped.replace('</body>', '</div></body>')
+    assert [line.strip() for line in extract_text(wrapped, backend).splitlines()] == [
+        line.strip() for line in pruned]
@@ -0,0 +1,20 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_imports_without_a_deepseek_key():
+    for module in ('google.generativeai', 'openai', 'anthropic', 'dotenv'):
+        pytest.importorskip(module)
+    env = {k: v for k, v in os.environ.items() if k != 'DEEPSEEK_API_KEY'}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+    # A fresh interpreter, so the settings module is imported without the key
+    completed = subprocess.run(
+        [sys.executable, '-c', 'import llm_api; print(llm_api.get_http_client)'],
+        cwd=os.path.join(ROOT, 'tools'), env=env, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip() == 'None'
@@ -0,0 +1,33 @@
+from src.chat.cache import CachedResponse
+from src.chat.similarity import SimilarityCache
+
+
+def _messages(prompt):
+    return [{'role': 'user', 'content': prompt}]
+
+
+def _response(text):
+    return CachedResponse([{'type': 'response', 'content': text}])
+
+
+def test_rewording_matches():
+    cache = SimilarityCache(threshold=0.6)
+    cache.add('model', _messages("How do I reverse a list in Python?"), _response("Use reversed()."))
+    match = cache.lookup('model', _messages("how do I reverse a list in python"))
+    assert match is not None
+    assert match.response.text == "Use reversed()."
+
+
+def test_long_prompt_is_not_hashed():
+    cache = SimilarityCache(max_prompt_chars=1000)
+
+    def fail(values):
+        raise AssertionError("long prompts must not be MinHashed")
+
+    cache.hasher.signature = fail
+    prompt = "file contents " * 20000
+    cache.add('model', _messages(prompt), _response("summary"))
+    assert cache.lookup('model', _messages(prompt)) is None
+    stats = cache.stats()
+    assert stats['entries'] == 0
+    assert stats['skipped'] == 2
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from src.chat.cache import CachedResponse, ResponseCache
+from src.utils.search_cache import SearchCache
+from src.utils.store import TieredStore
+
+
+def test_store_evicts_and_expires(tmp_path):
+    store = TieredStore(str(tmp_path), max_entries=2)
+    now = time.time()
+    for key in ('aa01', 'bb02', 'cc03'):
+        store.remember(key, now, key)
+        store.write(key, {'created_at': now, 'value': key})
+    assert store.recall('aa01', 60) is None  # Evicted from memory
+    assert store.read('aa01', 60)['value'] == 'aa01'  # Still on disk
+    assert store.recall('cc03', 60, now + 120) is None
+    assert store.read('cc03', 60, now + 120) is None
+    assert not (tmp_path / 'cc' / 'cc03.json').exists()
+
+
+def test_store_discards_corrupt_file(tmp_path):
+    store = TieredStore(str(tmp_path))
+    (tmp_path / 'dd').mkdir()
+    (tmp_path / 'dd' / 'dd04.json').write_text('{"created_at": 1')
+    assert store.read('dd04', 60) is None
+    assert not (tmp_path / 'dd' / 'dd04.json').exists()
+
+
+def test_response_cache_survives_restart(tmp_path):
+    key = 'ab' * 32
+    ResponseCache(str(tmp_path)).put(key, CachedResponse([{'type': 'response', 'content': 'hi'}], [0.1]))
+    cache = ResponseCache(str(tmp_path))
+    entry = cache.get(key)
+    assert entry.text == 'hi' and entry.offsets == [0.1]
+    assert cache.get(key) is entry
+    assert cache.stats()['disk_hits'] == 1 and cache.stats()['memory_hits'] == 1
+
+
+def test_search_cache_refreshes_stale_entries_and_closes(tmp_path):
+    cache = SearchCache(str(tmp_path), ttl=0.0)
+    refreshed = threading.Event()
+    results = [{'url': 'https://example.org', 'title': 't', 'snippet': 's'}]
+    assert cache.get('Python  Async', 3, lambda: results) == results
+
+    def refresh():
+        refreshed.set()
+        return results
+
+    # Normalised to the same entry, which is stale at once with ttl=0
+    restarted = SearchCache(str(tmp_path), ttl=0.0)
+    assert restarted.get('python async', 3, refresh) == results
+    restarted.close()
+    assert cache.get('python async', 3, refresh) == results
+    assert refreshed.wait(5)
+    cache.close()
+    assert cache.get('python async', 3, lambda: []) == results  # No refresh after close
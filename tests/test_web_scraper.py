@@ -0,0 +1,236 @@
+import os
+import sys
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools'))
+import web_scraper  # noqa: E402
+
+ARTICLE = (
+    '<html><head><title>Article</title></head><body><h1>Static article</h1><p>'
+    + 'Plain server-rendered text that needs no scripts. ' * 20
+    + '</p><script>track()</script></body></html>'
+)
+PAGES = {
+    '/article': (200, 'text/html; charset=utf-8', ARTICLE.encode('utf-8')),
+    '/spa': (200, 'text/html', b'<html><body><div id="root"></div><script src="/app.js"></script></body></html>'),
+    '/paper.pdf': (200, 'application/pdf', b'%PDF-1.4\n%%EOF\n'),
+    '/blocked': (403, 'text/html', b'<html><body>Just a moment...</body></html>'),
+    '/missing': (404, 'text/html', b'<html><body>Not found</body></html>'),
+    '/gbk': (200, 'text/html', (
+        '<html><head><meta charset="gbk"></head><body><p>'
+        + '中文网页的正文内容。' * 30 + '</p></body></html>'
+    ).encode('gbk')),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, content_type, body = PAGES[self.path]
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubBrowser:
+    """Stands in for BrowserPool; renders every page as a fixed document."""
+
+    def __init__(self):
+        self.stats = {'fetches': 0}
+        self.started = False
+        self.closed = False
+
+    async def start(self):
+        self.started = True
+
+    async def fetch(self, url):
+        self.stats['fetches'] += 1
+        return f'<html><body><p>Rendered {url}</p></body></html>'
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _scrape(urls, browser):
+    async def run():
+        async with web_scraper.TieredFetcher(browser, parse_workers=1) as fetcher:
+            return await fetcher.scrape(urls), fetcher.stats
+    return asyncio.run(run())
+
+
+def test_tiers(server):
+    browser = StubBrowser()
+    paths = ['/article', '/spa', '/paper.pdf', '/blocked', '/missing']
+    results, stats = _scrape([server + path for path in paths], browser)
+    by_path = dict(zip(paths, results))
+
+    article = by_path['/article']
+    assert (article['tier'], article['escalated'], article['content_type']) == ('http', None, 'text/html')
+    assert set(article['timings']) == {'http', 'parse'}
+    assert 'Static article' in article['content']
+
+    spa = by_path['/spa']
+    assert (spa['tier'], spa['escalated'], spa['content_type']) == ('browser', 'little text', 'text/html')
+    assert set(spa['timings']) == {'http', 'browser', 'parse'}
+    assert 'Rendered' in spa['content']
+
+    pdf = by_path['/paper.pdf']
+    assert (pdf['tier'], pdf['escalated'], pdf['content_type']) == ('http', None, 'application/pdf')
+    # Extracted in the process pool like HTML, so it is timed as parsing
+    assert set(pdf['timings']) == {'http', 'parse'}
+
+    blocked = by_path['/blocked']
+    assert (blocked['tier'], blocked['escalated'], blocked['content_type']) == ('browser', 'status 403', None)
+    assert set(blocked['timings']) == {'http', 'browser', 'parse'}
+
+    missing = by_path['/missing']
+    assert (missing['tier'], missing['escalated'], missing['content_type']) == (None, None, None)
+    assert set(missing['timings']) == {'http'}
+    assert missing['content'] == ''
+
+    assert browser.started and browser.closed
+    assert browser.stats['fetches'] == 2
+    assert stats['escalations'] == {'little text': 1, 'status 403': 1}
+    assert stats['failures'] == 1
+
+
+def test_browser_not_started_for_static_pages(server):
+    browser = StubBrowser()
+    results, _ = _scrape([server + '/article'], browser)
+    assert results[0]['tier'] == 'http'
+    assert not browser.started
+
+
+def test_meta_charset(server):
+    results, _ = _scrape([server + '/gbk'], StubBrowser())
+    assert results[0]['tier'] == 'http'
+    assert '中文网页的正文内容。' in results[0]['content']
+
+
+def test_needs_javascript():
+    assert web_scraper.needs_javascript(ARTICLE) is None
+    shell = '<body><div id="__next"></div><script src="a.js"></script>' + '<p>x</p>' * 300 + '</body>'
+    assert web_scraper.needs_javascript(shell) == 'empty app root'
+
+
+class FailingBrowser(StubBrowser):
+    """A browser tier that raises for one URL, as a crashed BrowserPool could."""
+
+    async def fetch(self, url):
+        if url.endswith('/blocked'):
+            raise RuntimeError('Target closed')
+        return await super().fetch(url)
+
+
+def test_browser_failure_fails_only_its_url(server):
+    results, stats = _scrape([server + '/spa', server + '/blocked', server + '/article'], FailingBrowser())
+    assert [result['tier'] for result in results] == ['browser', None, 'http']
+    assert results[1]['content'] == ''
+    assert set(results[1]['timings']) == {'http', 'browser'}
+    assert stats['failures'] == 1
+
+
+class FakePage:
+    def __init__(self, browser):
+        self.browser = browser
+
+    async def goto(self, url, timeout=None):
+        if self.browser.crashed:
+            raise RuntimeError('Target page, context or browser has been closed')
+
+    async def wait_for_load_state(self, state, timeout=None):
+        pass
+
+    async def content(self):
+        return f'<html><body>{self.browser.name}</body></html>'
+
+    async def evaluate(self, script):
+        return 0
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.page = FakePage(browser)
+
+    async def new_page(self):
+        return self.page
+
+    async def close(self):
+        pass
+
+
+class FakeBrowser:
+    def __init__(self, name):
+        self.name = name
+        self.crashed = False
+
+    async def new_context(self):
+        if self.crashed:
+            raise RuntimeError('Browser has been closed')
+        return FakeContext(self)
+
+    async def close(self):
+        if self.crashed:
+            raise RuntimeError('Browser has been closed')
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.browsers = []
+        self.launch_fails = False
+        self.chromium = self
+
+    async def start(self):
+        return self
+
+    async def launch(self):
+        if self.launch_fails:
+            raise RuntimeError('Failed to launch the browser')
+        self.browsers.append(FakeBrowser(f'browser {len(self.browsers)}'))
+        return self.browsers[-1]
+
+    async def stop(self):
+        pass
+
+
+def test_pool_recovers_from_a_crashed_browser(monkeypatch):
+    playwright = FakePlaywright()
+    monkeypatch.setattr(web_scraper, 'async_playwright', lambda: playwright)
+
+    async def run():
+        pool = web_scraper.BrowserPool(max_contexts=2)
+        await pool.start()
+        fetch = lambda: asyncio.wait_for(pool.fetch('http://example.test/'), timeout=5)
+        assert 'browser 0' in await fetch()
+
+        playwright.browsers[0].crashed = True
+        playwright.launch_fails = True
+        # Neither the crash nor a failed relaunch may drain the pool
+        assert [await fetch() for _ in range(4)] == [None] * 4
+
+        playwright.launch_fails = False
+        assert [await fetch() for _ in range(3)] == ['<html><body>browser 1</body></html>'] * 3
+        assert pool._idle.qsize() == 2
+        await pool.close()
+        return pool.stats
+
+    stats = asyncio.run(run())
+    assert stats['browser_starts'] == 2
+    assert stats['failures'] == 4
@@ -0,0 +1,204 @@
+#!/usr/bin/env /workspace/tmp_windsurf/venv/bin/python3
+"""
+Benchmark html_extractor against the html5lib tree walker it replaced.
+
+Runs every page of a corpus of saved pages (tools/bench_corpus by default:
+real documentation pages plus synthetic-*.html pages, see its README) and
+a generated, deeply nested page through each implementation and
+reports throughput and how closely each output matches the reference
+(difflib line similarity, 1.0 = identical). The "+prune" rows drop nav,
+footer and cookie banners, so they differ from the reference by design.
+"""
+
+import os
+import sys
+import json
+import time
+import difflib
+import argparse
+from typing import Callable, Dict, List, Optional
+
+import html5lib
+
+from html_extractor import BACKENDS, extract_text
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_corpus')
+
+
+def html5lib_parse_html(html_content: Optional[str]) -> str:
+    """The former web_scraper.parse_html: a full html5lib tree, walked recursively."""
+    if not html_content:
+        return ""
+
+    try:
+        document = html5lib.parse(html_content)
+        result = []
+        seen_texts = set()  # To avoid duplicates
+
+        def should_skip_element(elem) -> bool:
+            """Check if the element should be skipped."""
+            # Skip script and style tags
+            if elem.tag in ['{http://www.w3.org/1999/xhtml}script',
+                          '{http://www.w3.org/1999/xhtml}style']:
+                return True
+            # Skip empty elements or elements with only whitespace
+            if not any(text.strip() for text in elem.itertext()):
+                return True
+            return False
+
+        def process_element(elem, depth=0):
+            """Process an element and its children recursively."""
+            if should_skip_element(elem):
+                return
+
+            # Handle text content
+            if hasattr(elem, 'text') and elem.text:
+                text = elem.text.strip()
+                if text and text not in seen_texts:
+                    # Check if this is an anchor tag
+                    if elem.tag == '{http://www.w3.org/1999/xhtml}a':
+                        href = None
+                        for attr, value in elem.items():
+                            if attr.endswith('href'):
+                                href = value
+                                break
+                        if href and not href.startswith(('#', 'javascript:')):
+                            # Format as markdown link
+                            link_text = f"[{text}]({href})"
+                            result.append("  " * depth + link_text)
+                            seen_texts.add(text)
+                    else:
+                        result.append("  " * depth + text)
+                        seen_texts.add(text)
+
+            # Process children
+            for child in elem:
+                process_element(child, depth + 1)
+
+            # Handle tail text
+            if hasattr(elem, 'tail') and elem.tail:
+                tail = elem.tail.strip()
+                if tail and tail not in seen_texts:
+                    result.append("  " * depth + tail)
+                    seen_texts.add(tail)
+
+        # Start processing from the body tag
+        body = document.find('.//{http://www.w3.org/1999/xhtml}body')
+        if body is not None:
+            process_element(body)
+        else:
+            # Fallback to processing the entire document
+            process_element(document)
+
+        # Filter out common unwanted patterns
+        filtered_result = []
+        for line in result:
+            # Skip lines that are likely to be noise
+            if any(pattern in line.lower() for pattern in [
+                'var ',
+                'function()',
+                '.js',
+                '.css',
+                'google-analytics',
+                'disqus',
+                '{',
+                '}'
+            ]):
+                continue
+            filtered_result.append(line)
+
+        return '\n'.join(filtered_result)
+    except Exception as e:
+        print(f"Reference parser failed: {type(e).__name__}: {str(e)}", file=sys.stderr)
+        return ""
+
+
+def deep_page(depth: int) -> str:
+    """A page of `depth` nested divs with text at every level, the tree walker's worst case."""
+    opening = ''.join(f'<div>level {i}' for i in range(depth))
+    return f"<html><body>{opening}{'</div>' * depth}</body></html>"
+
+
+def implementations() -> Dict[str, Callable[[str], str]]:
+    impls = {'html5lib (reference)': html5lib_parse_html}
+    for name in BACKENDS:
+        try:
+            extract_text('<p>probe</p>', name)
+        except ImportError:
+            print(f"Skipping the {name} backend: not installed", file=sys.stderr)
+            continue
+        impls[name] = lambda html, name=name: extract_text(html, name, prune_boilerplate=False)
+        impls[f"{name}+prune"] = lambda html, name=name: extract_text(html, name)
+    return impls
+
+
+def similarity(reference: str, output: str) -> float:
+    return difflib.SequenceMatcher(None, reference.splitlines(), output.splitlines(), autojunk=False).ratio()
+
+
+def run(pages: Dict[str, str], repeat: int) -> List[Dict]:
+    rows = []
+    impls = implementations()
+    for page, html in pages.items():
+        size = len(html.encode('utf-8'))
+        reference = None
+        for impl, extract in impls.items():
+            started = time.perf_counter()
+            for _ in range(repeat):
+                output = extract(html)
+            seconds = (time.perf_counter() - started) / repeat
+            if reference is None:
+                reference = output
+            rows.append({
+                'page': page,
+                'kb': size / 1024,
+                'impl': impl,
+                'ms': seconds * 1000,
+                'mb_per_s': size / seconds / (1024 * 1024),
+                'lines': len(output.splitlines()),
+                'match': similarity(reference, output)
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HTML text extraction.')
+    parser.add_argument('--corpus', default=CORPUS_DIR,
+                       help=f'Directory of .html pages (default: {CORPUS_DIR})')
+    parser.add_argument('--repeat', type=int, default=5,
+                       help='Runs per page and implementation (default: 5)')
+    parser.add_argument('--deep', type=int, default=400,
+                       help='Nesting depth of the generated page; 0 leaves it out (default: 400)')
+    parser.add_argument('--json', action='store_true',
+                       help='Print the rows as JSON')
+    args = parser.parse_args()
+
+    pages = {}
+    for name in sorted(os.listdir(args.corpus)):
+        if name.endswith('.html'):
+            with open(os.path.join(args.corpus, name), 'r', encoding='utf-8') as f:
+                pages[name] = f.read()
+    if args.deep:
+        pages[f'deep-{args.deep}'] = deep_page(args.deep)
+
+    rows = run(pages, args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    width = max(len(page) for page in pages)
+    print(f"{'page':<{width}} {'KB':>6}  {'implementation':<22} {'ms':>8} {'MB/s':>7} {'lines':>6} {'match':>6}")
+    for row in rows:
+        print(f"{row['page']:<{width}} {row['kb']:>6.1f}  {row['impl']:<22} {row['ms']:>8.2f} "
+              f"{row['mb_per_s']:>7.2f} {row['lines']:>6} {row['match']:>6.3f}")
+
+    print("\nTotals over the corpus:")
+    total_kb = sum(row['kb'] for row in rows if row['impl'] == 'html5lib (reference)')
+    for impl in dict.fromkeys(row['impl'] for row in rows):
+        impl_rows = [row for row in rows if row['impl'] == impl]
+        ms = sum(row['ms'] for row in impl_rows)
+        match = sum(row['match'] for row in impl_rows) / len(impl_rows)
+        print(f"  {impl:<22} {ms:>9.2f} ms  {total_kb / 1024 / (ms / 1000):>7.2f} MB/s  mean match {match:.3f}")
+
+if __name__ == '__main__':
+    main()
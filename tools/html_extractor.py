@@ -0,0 +1,263 @@
+#!/usr/bin/env /workspace/tmp_windsurf/venv/bin/python3
+"""
+Single-pass HTML to text extraction.
+
+A parser backend turns the document into start/end/data events and
+TextExtractor turns those into indented lines in one pass, without
+building a tree: an element's own text is emitted at its depth, anchors
+become markdown links, and script/style content plus page furniture (nav,
+footer, cookie banners) is pruned as a whole subtree when it opens. The
+output follows the former html5lib-based parse_html line for line, except
+that text after empty elements (e.g. <br>) is kept and no lines are
+dropped by substring filters; tools/bench_extract.py measures both.
+
+Backends: "html.parser" (standard library) and "lxml" (faster, optional).
+Any callable taking (html, handler) can be used instead.
+"""
+
+import sys
+import argparse
+import importlib.util
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Set, Union
+
+# Subtrees never shown to a reader
+SKIP_TAGS = {'head', 'title', 'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'object'}
+# Page furniture dropped when pruning boilerplate
+BOILERPLATE_TAGS = {'nav', 'footer'}
+BOILERPLATE_ROLES = {'navigation', 'contentinfo'}
+# Whole class/id tokens of cookie and consent banners, lower case; a
+# substring match would also prune e.g. <main class="has-cookie-banner">
+BOILERPLATE_NAMES = {
+    'cookie-banner', 'cookie-bar', 'cookie-consent', 'cookie-notice', 'cookie-popup',
+    'cookies-banner', 'cookie-law-info-bar', 'cc-banner', 'cc-window', 'consent-banner',
+    'consent-popup', 'gdpr-banner', 'gdpr-notice', 'onetrust-banner-sdk',
+    'onetrust-consent-sdk', 'cybotcookiebotdialog', 'truste-consent-track',
+}
+# Elements that never have content or an end tag
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr'
+}
+# Elements whose own text is at depth 0, like the body in the tree version
+_ROOT_TAGS = {'html', 'body'}
+# Open elements a start tag closes implicitly, as an HTML5 tree builder would
+_CLOSES_P = {
+    'address', 'article', 'aside', 'blockquote', 'details', 'div', 'dl', 'fieldset', 'figure',
+    'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'main', 'menu',
+    'nav', 'ol', 'p', 'pre', 'section', 'table', 'ul'
+}
+_IMPLIED_END = {
+    'li': {'li'},
+    'dt': {'dt', 'dd'},
+    'dd': {'dt', 'dd'},
+    'tr': {'tr', 'td', 'th'},
+    'td': {'td', 'th'},
+    'th': {'td', 'th'},
+    'option': {'option'},
+}
+
+
+class TextExtractor:
+    """Event handler collecting the text lines of one document."""
+
+    def __init__(self, prune_boilerplate: bool = True):
+        self.prune_boilerplate = prune_boilerplate
+        self.lines: List[str] = []
+        self._seen: Set[str] = set()
+        self._stack: List[str] = []
+        self._skip_from: Optional[int] = None  # Stack size at which the pruned subtree opened
+        self._text: List[str] = []
+        self._depth = 0
+        self._link: Optional[str] = None  # href the pending text links to
+        self._in_anchor = False
+
+    def _prunes(self, tag: str, attrs: Dict[str, Optional[str]]) -> bool:
+        if tag in SKIP_TAGS:
+            return True
+        if not self.prune_boilerplate:
+            return False
+        if tag in BOILERPLATE_TAGS or attrs.get('role') in BOILERPLATE_ROLES:
+            return True
+        if (attrs.get('id') or '').lower() in BOILERPLATE_NAMES:
+            return True
+        return any(name in BOILERPLATE_NAMES for name in (attrs.get('class') or '').lower().split())
+
+    def _flush(self):
+        if not self._text:
+            return
+        text = ''.join(self._text).strip()
+        self._text = []
+        if not text or text in self._seen:
+            return
+        if self._in_anchor:
+            # An anchor's own text only counts as a link
+            if self._link is None:
+                return
+            line = f"[{text}]({self._link})"
+        else:
+            line = text
+        self._seen.add(text)
+        self.lines.append("  " * self._depth + line)
+
+    def start(self, tag: str, attrs: Dict[str, Optional[str]]):
+        self._flush()
+        if tag in _ROOT_TAGS:
+            return
+        self._close_implied(tag)
+        if tag in VOID_TAGS:
+            # What follows is the void element's tail, at its depth
+            self._depth = len(self._stack) + 1
+            self._in_anchor = False
+            return
+        if tag == 'tr' and self._stack and self._stack[-1] == 'table':
+            self._stack.append('tbody')
+        self._stack.append(tag)
+        if self._skip_from is None and self._prunes(tag, attrs):
+            self._skip_from = len(self._stack)
+        self._depth = len(self._stack)
+        self._in_anchor = tag == 'a'
+        self._link = None
+        if self._in_anchor:
+            href = next((value for name, value in attrs.items() if name.endswith('href')), None)
+            if href and not href.startswith(('#', 'javascript:')):
+                self._link = href
+
+    def _close_implied(self, tag: str):
+        """Close the open element a new `tag` ends without an end tag, e.g. <li> after <li>."""
+        if not self._stack:
+            return
+        top = self._stack[-1]
+        if (top == 'p' and tag in _CLOSES_P) or top in _IMPLIED_END.get(tag, ()):
+            self._pop(top)
+            if tag == 'tr' and self._stack and self._stack[-1] == 'tr':
+                self._pop('tr')
+
+    def end(self, tag: str):
+        self._flush()
+        if tag in _ROOT_TAGS or tag in VOID_TAGS:
+            return
+        self._pop(tag)
+
+    def _pop(self, tag: str):
+        stack = self._stack
+        if stack and stack[-1] == tag:
+            stack.pop()
+        elif tag in stack:
+            # Close elements left open inside this one
+            while stack.pop() != tag:
+                pass
+        else:
+            return
+        if self._skip_from is not None and len(stack) < self._skip_from:
+            self._skip_from = None
+        # What follows is the closed element's tail, at its depth
+        self._depth = len(stack) + 1
+        self._in_anchor = False
+
+    def data(self, text: str):
+        if self._skip_from is None:
+            self._text.append(text)
+
+    def close(self) -> str:
+        self._flush()
+        return '\n'.join(self.lines)
+
+
+class _StdlibParser(HTMLParser):
+    def __init__(self, handler: TextExtractor):
+        super().__init__(convert_charrefs=True)
+        self.handler = handler
+
+    def handle_starttag(self, tag, attrs):
+        self.handler.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handler.start(tag, dict(attrs))
+        if tag not in VOID_TAGS:
+            self.handler.end(tag)
+
+    def handle_endtag(self, tag):
+        self.handler.end(tag)
+
+    def handle_data(self, data):
+        self.handler.data(data)
+
+
+def html_parser_backend(html: str, handler: TextExtractor):
+    """Feed a document through the standard library's html.parser."""
+    parser = _StdlibParser(handler)
+    parser.feed(html)
+    parser.close()
+
+
+class _LxmlTarget:
+    def __init__(self, handler: TextExtractor):
+        self.handler = handler
+
+    def start(self, tag, attrib):
+        self.handler.start(tag, dict(attrib))
+
+    def end(self, tag):
+        self.handler.end(tag)
+
+    def data(self, data):
+        self.handler.data(data)
+
+    def close(self):
+        pass
+
+
+def lxml_backend(html: str, handler: TextExtractor):
+    """Feed a document through lxml's libxml2 HTML parser."""
+    from lxml import etree
+    parser = etree.HTMLParser(target=_LxmlTarget(handler), recover=True)
+    parser.feed(html)
+    parser.close()
+
+
+Backend = Callable[[str, TextExtractor], None]
+
+BACKENDS: Dict[str, Backend] = {
+    'html.parser': html_parser_backend,
+    'lxml': lxml_backend,
+}
+
+DEFAULT_BACKEND = 'lxml' if importlib.util.find_spec('lxml') is not None else 'html.parser'
+
+
+def extract_text(html: Optional[str], backend: Union[str, Backend, None] = None,
+                 prune_boilerplate: bool = True) -> str:
+    """Text of an HTML document as indented lines, with links in markdown format.
+
+    Args:
+        html: The document; None or empty gives "".
+        backend: Name in BACKENDS or a callable; defaults to lxml when installed.
+        prune_boilerplate: Drop nav, footer and cookie/consent banners.
+    """
+    if not html:
+        return ""
+    feed = BACKENDS[backend or DEFAULT_BACKEND] if not callable(backend) else backend
+    handler = TextExtractor(prune_boilerplate)
+    feed(html, handler)
+    return handler.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract the text of an HTML file.')
+    parser.add_argument('file', nargs='?', help='HTML file (default: stdin)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                       help=f'Parser backend (default: {DEFAULT_BACKEND})')
+    parser.add_argument('--keep-boilerplate', action='store_true',
+                       help='Keep nav, footer and cookie banners')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8', errors='replace') as f:
+            html = f.read()
+    else:
+        html = sys.stdin.read()
+    print(extract_text(html, args.backend, not args.keep_boilerplate))
+
+if __name__ == '__main__':
+    main()
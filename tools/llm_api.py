@@ -12,6 +12,13 @@ import base64
 from typing import Optional, Union, List
 import mimetypes
 
+try:
+    # Reuse BunnyChat's process-wide connection pool when it is installed
+    from src.chat.transport import get_http_client
+except (ImportError, ValueError):
+    # ValueError: BunnyChat's settings need DEEPSEEK_API_KEY, which other providers don't
+    get_http_client = None
+
 def load_environment():
     """Load environment variables from .env files in order of precedence"""
     # Order of precedence:
@@ -89,6 +96,7 @@ def create_llm_client(provider="openai"):
         return OpenAI(
             api_key=api_key,
             base_url="https://api.deepseek.com/v1",
+            http_client=get_http_client() if get_http_client else None,
         )
     elif provider == "siliconflow":
         api_key = os.getenv('SILICONFLOW_API_KEY')
@@ -4,14 +4,20 @@ import asyncio
 import argparse
 import sys
 import os
-from typing import List, Optional
+import re
+import codecs
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
 from playwright.async_api import async_playwright
-import html5lib
-from multiprocessing import Pool
+import httpx
+from concurrent.futures import ProcessPoolExecutor
+import json
 import time
 from urllib.parse import urlparse
 import logging
 
+from html_extractor import extract_text
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -19,140 +25,560 @@ logging.basicConfig(
     stream=sys.stderr
 )
 logger = logging.getLogger(__name__)
-
-async def fetch_page(url: str, context) -> Optional[str]:
-    """Asynchronously fetch a webpage's content."""
-    page = await context.new_page()
-    try:
-        logger.info(f"Fetching {url}")
-        await page.goto(url)
-        await page.wait_for_load_state('networkidle')
-        content = await page.content()
-        logger.info(f"Successfully fetched {url}")
-        return content
-    except Exception as e:
-        logger.error(f"Error fetching {url}: {str(e)}")
-        return None
-    finally:
-        await page.close()
+# httpx logs every request at INFO
+logging.getLogger('httpx').setLevel(logging.WARNING)
 
 def parse_html(html_content: Optional[str]) -> str:
     """Parse HTML content and extract text with hyperlinks in markdown format."""
-    if not html_content:
+    try:
+        return extract_text(html_content)
+    except Exception as e:
+        logger.error(f"Error parsing HTML: {str(e)}")
         return ""
+
+class _PooledContext:
+    """A browser context with one warm page, and how often it has been used."""
+
+    def __init__(self, browser, context, page):
+        self.browser = browser
+        self.context = context
+        self.page = page
+        self.uses = 0
+
+
+class BrowserPool:
+    """A long-lived Chromium with a pool of warm contexts and pages.
     
-    try:
-        document = html5lib.parse(html_content)
-        result = []
-        seen_texts = set()  # To avoid duplicates
-        
-        def should_skip_element(elem) -> bool:
-            """Check if the element should be skipped."""
-            # Skip script and style tags
-            if elem.tag in ['{http://www.w3.org/1999/xhtml}script', 
-                          '{http://www.w3.org/1999/xhtml}style']:
-                return True
-            # Skip empty elements or elements with only whitespace
-            if not any(text.strip() for text in elem.itertext()):
-                return True
-            return False
+    Each fetch borrows a context and navigates its page, so only the first
+    fetch pays for starting the browser. A context is replaced after
+    `max_uses` fetches, when its page's JS heap exceeds `max_heap_mb`, or
+    when a fetch fails; the whole browser is replaced every
+    `max_browser_uses` fetches to bound slow leaks, the old one closing
+    once its last running fetch returns. A browser that can no longer open
+    contexts (e.g. Chromium crashed) is relaunched the same way; until that
+    succeeds, fetches return None instead of waiting on an empty pool.
+    
+    Used by TieredFetcher for pages that need rendering.
+    """
+
+    def __init__(self, max_contexts: int = 5, max_uses: int = 50, max_heap_mb: float = 256,
+                 max_browser_uses: int = 1000, timeout: float = 30.0):
+        self.max_contexts = max_contexts
+        self.max_uses = max_uses
+        self.max_heap_mb = max_heap_mb
+        self.max_browser_uses = max_browser_uses
+        self.timeout = timeout
+        self._playwright = None
+        self._browser = None
+        self._browser_uses = 0
+        self._idle: Optional[asyncio.Queue] = None
+        self._in_use = {}  # Browser -> contexts currently borrowed from it
+        self._restart_lock: Optional[asyncio.Lock] = None
+        self.stats = {'fetches': 0, 'failures': 0, 'contexts_created': 0, 'contexts_recycled': 0, 'browser_starts': 0}
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        """Launch the browser and open the warm contexts."""
+        self._idle = asyncio.Queue()
+        self._restart_lock = asyncio.Lock()
+        self._playwright = await async_playwright().start()
+        await self._launch()
+
+    async def _launch(self):
+        browser = await self._playwright.chromium.launch()
+        self._in_use[browser] = 0
+        self._browser = browser
+        self._browser_uses = 0
+        self.stats['browser_starts'] += 1
+        for _ in range(self.max_contexts):
+            try:
+                self._idle.put_nowait(await self._new_context(browser))
+            except Exception as e:
+                logger.error(f"Error opening a browser context: {str(e)}")
+                # An empty slot; the fetch that borrows it tries again
+                self._idle.put_nowait(None)
+
+    async def _new_context(self, browser) -> _PooledContext:
+        context = await browser.new_context()
+        page = await context.new_page()
+        self.stats['contexts_created'] += 1
+        return _PooledContext(browser, context, page)
+
+    async def _fill_slot(self, browser) -> Optional[_PooledContext]:
+        """A new context on `browser`; None if it cannot open one, in which case it is replaced."""
+        try:
+            if browser is None:
+                raise RuntimeError("the browser failed to launch")
+            pooled = await self._new_context(browser)
+        except Exception as e:
+            # Most likely the browser has crashed; its slots come back with the new one
+            logger.error(f"Error opening a browser context: {str(e)}")
+            await self._restart(browser, 'it cannot open contexts')
+            return None
+        if browser is not self._browser:
+            # Replaced meanwhile; the new browser brought its own slots
+            await self._discard(pooled)
+            return None
+        return pooled
+
+    async def _discard(self, pooled: _PooledContext):
+        self.stats['contexts_recycled'] += 1
+        try:
+            await pooled.context.close()
+        except Exception as e:
+            logger.debug(f"Error closing browser context: {str(e)}")
+
+    async def _close_if_retired(self, browser):
+        """Close a replaced browser once nothing is borrowed from it."""
+        if browser is not self._browser and self._in_use.get(browser) == 0:
+            del self._in_use[browser]
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.debug(f"Error closing browser: {str(e)}")
+
+    async def _heap_mb(self, page) -> float:
+        """Used JS heap of a page in MB (Chromium only; 0 if unavailable)."""
+        try:
+            used = await page.evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : 0")
+            return used / (1024 * 1024)
+        except Exception:
+            return 0.0
+
+    async def _borrow(self) -> Optional[_PooledContext]:
+        """Take a context from the pool, opening one for an empty slot; None if that fails."""
+        for _ in range(2):
+            pooled = await self._idle.get()
+            if pooled is None:
+                # If this fails the browser is replaced; try once more on the new one
+                pooled = await self._fill_slot(self._browser)
+            if pooled is not None:
+                return pooled
+        return None
+
+    async def fetch(self, url: str) -> Optional[str]:
+        """Fetch a page's HTML with a pooled context; None on failure."""
+        pooled = await self._borrow()
+        if pooled is None:
+            logger.error(f"Error fetching {url}: no browser context available")
+            self.stats['failures'] += 1
+            return None
+        browser = pooled.browser
+        self._in_use[browser] += 1
+        healthy = True
+        try:
+            logger.info(f"Fetching {url}")
+            timeout_ms = self.timeout * 1000
+            await pooled.page.goto(url, timeout=timeout_ms)
+            await pooled.page.wait_for_load_state('networkidle', timeout=timeout_ms)
+            content = await pooled.page.content()
+            self.stats['fetches'] += 1
+            return content
+        except Exception as e:
+            logger.error(f"Error fetching {url}: {str(e)}")
+            self.stats['failures'] += 1
+            healthy = False
+            return None
+        finally:
+            pooled.uses += 1
+            keep = healthy and pooled.uses < self.max_uses and await self._heap_mb(pooled.page) < self.max_heap_mb
+            self._in_use[browser] -= 1
+            await self._release(pooled, keep)
+
+    async def _release(self, pooled: _PooledContext, keep: bool):
+        """Return a borrowed context to the pool, or a new one in its place unless `keep`.
         
-        def process_element(elem, depth=0):
-            """Process an element and its children recursively."""
-            if should_skip_element(elem):
+        Never raises: the pool keeps max_contexts slots whatever happened to
+        the browser.
+        """
+        browser = pooled.browser
+        if browser is not self._browser:
+            await self._discard(pooled)
+            await self._close_if_retired(browser)
+            return
+        if not keep:
+            await self._discard(pooled)
+            if browser is not self._browser:
+                # Replaced while discarding; the new browser brought its own slots
                 return
-            
-            # Handle text content
-            if hasattr(elem, 'text') and elem.text:
-                text = elem.text.strip()
-                if text and text not in seen_texts:
-                    # Check if this is an anchor tag
-                    if elem.tag == '{http://www.w3.org/1999/xhtml}a':
-                        href = None
-                        for attr, value in elem.items():
-                            if attr.endswith('href'):
-                                href = value
-                                break
-                        if href and not href.startswith(('#', 'javascript:')):
-                            # Format as markdown link
-                            link_text = f"[{text}]({href})"
-                            result.append("  " * depth + link_text)
-                            seen_texts.add(text)
-                    else:
-                        result.append("  " * depth + text)
-                        seen_texts.add(text)
-            
-            # Process children
-            for child in elem:
-                process_element(child, depth + 1)
-            
-            # Handle tail text
-            if hasattr(elem, 'tail') and elem.tail:
-                tail = elem.tail.strip()
-                if tail and tail not in seen_texts:
-                    result.append("  " * depth + tail)
-                    seen_texts.add(tail)
-        
-        # Start processing from the body tag
-        body = document.find('.//{http://www.w3.org/1999/xhtml}body')
-        if body is not None:
-            process_element(body)
-        else:
-            # Fallback to processing the entire document
-            process_element(document)
-        
-        # Filter out common unwanted patterns
-        filtered_result = []
-        for line in result:
-            # Skip lines that are likely to be noise
-            if any(pattern in line.lower() for pattern in [
-                'var ', 
-                'function()', 
-                '.js',
-                '.css',
-                'google-analytics',
-                'disqus',
-                '{',
-                '}'
-            ]):
-                continue
-            filtered_result.append(line)
-        
-        return '\n'.join(filtered_result)
+            pooled = await self._fill_slot(browser)
+            if pooled is None:
+                return
+        self._idle.put_nowait(pooled)
+        self._browser_uses += 1
+        if self._browser_uses >= self.max_browser_uses:
+            await self._restart(browser, f'after {self._browser_uses} fetches')
+
+    async def _restart(self, browser, reason: str):
+        """Replace `browser`; fetches still running on it finish first."""
+        async with self._restart_lock:
+            if browser is not self._browser:
+                # Already replaced by another fetch
+                return
+            logger.info(f"Restarting browser {reason}")
+            # Contexts returned from now on belong to a retired browser
+            self._browser = None
+            while not self._idle.empty():
+                pooled = self._idle.get_nowait()
+                if pooled is not None:
+                    await self._discard(pooled)
+            try:
+                await self._launch()
+            except Exception as e:
+                logger.error(f"Error launching browser: {str(e)}")
+                # Empty slots; the fetches that borrow them try again
+                for _ in range(self.max_contexts):
+                    self._idle.put_nowait(None)
+            if browser is not None:
+                await self._close_if_retired(browser)
+
+    async def close(self):
+        for browser in list(self._in_use):
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.debug(f"Error closing browser: {str(e)}")
+        self._in_use.clear()
+        if self._playwright is not None:
+            await self._playwright.stop()
+
+
+# Markers of pages whose content is rendered by scripts
+_HIDDEN_BLOCK = re.compile(r'<(script|style|noscript|template)\b.*?</\1\s*>', re.S | re.I)
+_NOSCRIPT_BLOCK = re.compile(r'<noscript\b[^>]*>(.*?)</noscript\s*>', re.S | re.I)
+_EMPTY_APP_ROOT = re.compile(r'<div\b[^>]*\bid=["\']?(?:root|app|__next|__nuxt|svelte)["\']?[^>]*>\s*</div>', re.I)
+_TAG = re.compile(r'<[^>]+>')
+_SPACE = re.compile(r'\s+')
+
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+# <meta charset="x"> or <meta http-equiv="Content-Type" content="text/html; charset=x">
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([A-Za-z0-9._:-]+)', re.I)
+_BOMS = ((b'\xef\xbb\xbf', 'utf-8'), (b'\xff\xfe', 'utf-16-le'), (b'\xfe\xff', 'utf-16-be'))
+TEXT_TYPES = ('application/json', 'application/xml', 'application/javascript')
+
+def visible_text_length(html: str) -> int:
+    """Rough length of the text a reader would see, without parsing the document."""
+    text = _TAG.sub(' ', _HIDDEN_BLOCK.sub(' ', html))
+    return len(_SPACE.sub(' ', text).strip())
+
+def needs_javascript(html: str, min_text: int = 200, max_shell_text: int = 1000) -> Optional[str]:
+    """Why a statically fetched page looks script-rendered, or None if it looks complete.
+    
+    A page needs the browser when it has almost no text but does have
+    scripts, when it is a single-page-app shell (an empty #root/#app/#__next
+    div), or when a <noscript> asks for JavaScript and there is little else.
+    """
+    text_length = visible_text_length(html)
+    lowered = html.lower()
+    if text_length < min_text and '<script' in lowered:
+        return 'little text'
+    if text_length < max_shell_text:
+        if _EMPTY_APP_ROOT.search(html):
+            return 'empty app root'
+        if any('javascript' in block.lower() for block in _NOSCRIPT_BLOCK.findall(html)):
+            return 'noscript'
+    return None
+
+def sniff_content_type(header: str, body: bytes) -> str:
+    """Media type from the Content-Type header, or guessed from the body when missing or generic."""
+    content_type = header.split(';')[0].strip().lower()
+    if content_type and content_type != 'application/octet-stream':
+        return content_type
+    head = body[:512].lstrip().lower()
+    if head.startswith(b'%pdf'):
+        return 'application/pdf'
+    if head.startswith((b'<!doctype html', b'<html')) or b'<body' in head:
+        return 'text/html'
+    if head.startswith((b'{', b'[')):
+        return 'application/json'
+    return content_type or 'application/octet-stream'
+
+def sniff_charset(header_charset: Optional[str], body: bytes, content_type: str) -> str:
+    """Encoding of a body: the header's charset, a BOM, an HTML <meta> charset, or UTF-8."""
+    candidates = [header_charset]
+    for bom, encoding in _BOMS:
+        if body.startswith(bom):
+            candidates.insert(0, encoding)
+    if content_type in HTML_TYPES:
+        match = _META_CHARSET.search(body[:4096])
+        if match:
+            candidates.append(match.group(1).decode('ascii'))
+    for encoding in candidates:
+        if not encoding:
+            continue
+        try:
+            return codecs.lookup(encoding).name
+        except LookupError:
+            logger.debug(f"Unknown charset {encoding}")
+    return 'utf-8'
+
+def extract_pdf_text(data: bytes) -> str:
+    """Text of a PDF, if pypdf is installed."""
+    try:
+        from io import BytesIO
+        from pypdf import PdfReader
+    except ImportError:
+        logger.warning("pypdf is not installed; skipping PDF content")
+        return ""
+    try:
+        reader = PdfReader(BytesIO(data))
+        return '\n'.join(page.extract_text() or '' for page in reader.pages)
     except Exception as e:
-        logger.error(f"Error parsing HTML: {str(e)}")
+        logger.error(f"Error reading PDF: {str(e)}")
         return ""
 
-async def process_urls(urls: List[str], max_concurrent: int = 5) -> List[str]:
-    """Process multiple URLs concurrently."""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch()
+
+@dataclass
+class FetchResult:
+    """A fetched URL: HTML still to be parsed, or text ready to use."""
+    url: str
+    body: Optional[str] = None
+    is_html: bool = True
+    tier: Optional[str] = None  # 'http' or 'browser'; None if every tier failed
+    content_type: Optional[str] = None
+    escalated: Optional[str] = None  # Why the HTTP tier handed the URL to the browser
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class TieredFetcher:
+    """Fetch pages with a pooled HTTP client, rendering in a browser only when needed.
+    
+    Each URL is first fetched with a plain GET. Non-HTML responses are
+    handled there (text as-is, PDFs through pypdf), as is HTML that already
+    carries its content. Pages that look script-rendered (see
+    needs_javascript), and responses blocked with 401/403/429/503 or failing
+    at the transport level, escalate to the BrowserPool, which is only
+    started the first time one does.
+    
+    Any object with the BrowserPool interface (start, fetch, close, stats)
+    can be passed as `browser`, e.g. to test against a local fixture server.
+    """
+
+    ESCALATE_STATUSES = (401, 403, 429, 503)
+    
+    def __init__(self, browser=None, fast_path: bool = True, http_timeout: float = 10.0,
+                 max_connections: int = 20, max_bytes: int = 5 * 1024 * 1024, parse_workers: int = 4):
+        self.browser = browser if browser is not None else BrowserPool()
+        self.fast_path = fast_path
+        self.http_timeout = http_timeout
+        self.max_connections = max_connections
+        self.max_bytes = max_bytes
+        self.parse_workers = parse_workers
+        self._http: Optional[httpx.AsyncClient] = None
+        self._parser = None
+        self._browser_started = False
+        self._browser_lock: Optional[asyncio.Lock] = None
+        self.stats: Dict[str, Any] = {
+            'http': {'fetches': 0, 'seconds': 0.0},
+            'browser': {'fetches': 0, 'seconds': 0.0},
+            'parse': {'documents': 0, 'seconds': 0.0},
+            'escalations': {},
+            'failures': 0
+        }
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        self._browser_lock = asyncio.Lock()
+        self._http = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=self.http_timeout,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            headers={
+                'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+            }
+        )
+        self._parser = ProcessPoolExecutor(max_workers=self.parse_workers)
+
+    def _record(self, tier: str, result: FetchResult, seconds: float):
+        result.timings[tier] = seconds
+        self.stats[tier]['fetches'] += 1
+        self.stats[tier]['seconds'] += seconds
+
+    async def _get(self, url: str):
+        """GET a URL, reading at most max_bytes of the body; returns (response, body)."""
+        async with self._http.stream('GET', url) as response:
+            chunks, size = [], 0
+            async for chunk in response.aiter_bytes():
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= self.max_bytes:
+                    logger.warning(f"Truncating {url} at {self.max_bytes} bytes")
+                    break
+            return response, b''.join(chunks)[:self.max_bytes]
+
+    async def _fetch_http(self, url: str, result: FetchResult) -> Optional[str]:
+        """Try the HTTP tier; returns the reason to escalate, or None if it settled the URL."""
+        started = time.perf_counter()
         try:
-            # Create browser contexts
-            n_contexts = min(len(urls), max_concurrent)
-            contexts = [await browser.new_context() for _ in range(n_contexts)]
-            
-            # Create tasks for each URL
-            tasks = []
-            for i, url in enumerate(urls):
-                context = contexts[i % len(contexts)]
-                task = fetch_page(url, context)
-                tasks.append(task)
-            
-            # Gather results
-            html_contents = await asyncio.gather(*tasks)
-            
-            # Parse HTML contents in parallel
-            with Pool() as pool:
-                results = pool.map(parse_html, html_contents)
-                
-            return results
-            
+            response, body = await self._get(url)
+        except httpx.HTTPError as e:
+            logger.info(f"HTTP fetch of {url} failed: {str(e)}")
+            return 'http error'
         finally:
-            # Cleanup
-            for context in contexts:
-                await context.close()
-            await browser.close()
+            self._record('http', result, time.perf_counter() - started)
+        if response.status_code in self.ESCALATE_STATUSES:
+            return f'status {response.status_code}'
+        if response.status_code >= 400:
+            logger.error(f"Error fetching {url}: HTTP {response.status_code}")
+            return None
+        content_type = sniff_content_type(response.headers.get('content-type', ''), body)
+        result.content_type = content_type
+        text = body.decode(sniff_charset(response.charset_encoding, body, content_type), errors='replace')
+        if content_type in HTML_TYPES:
+            html = text
+            reason = needs_javascript(html)
+            if reason is None:
+                result.body, result.tier = html, 'http'
+            return reason
+        result.is_html = False
+        result.tier = 'http'
+        if content_type == 'application/pdf':
+            # pypdf is CPU-bound, like HTML parsing
+            result.body = await self._run_parser(result, extract_pdf_text, body)
+        elif content_type.startswith('text/') or content_type in TEXT_TYPES or content_type.endswith(('+json', '+xml')):
+            result.body = text
+        else:
+            logger.info(f"Skipping {url}: unsupported content type {content_type}")
+            result.body = ""
+        return None
+
+    async def _ensure_browser(self):
+        async with self._browser_lock:
+            if not self._browser_started:
+                await self.browser.start()
+                self._browser_started = True
+                self.stats['browser_pool'] = self.browser.stats
+
+    async def fetch(self, url: str) -> FetchResult:
+        """Fetch one URL through the cheapest tier that can handle it."""
+        result = FetchResult(url)
+        if self.fast_path:
+            reason = await self._fetch_http(url, result)
+            if reason is None:
+                if result.tier is None:
+                    self.stats['failures'] += 1
+                return result
+            logger.info(f"Escalating {url} to the browser: {reason}")
+            result.escalated = reason
+            self.stats['escalations'][reason] = self.stats['escalations'].get(reason, 0) + 1
+        started = time.perf_counter()
+        try:
+            await self._ensure_browser()
+            html = await self.browser.fetch(url)
+        except Exception as e:
+            # One URL failing in the browser must not fail the rest of a scrape
+            logger.error(f"Browser fetch of {url} failed: {str(e)}")
+            html = None
+        self._record('browser', result, time.perf_counter() - started)
+        if html is None:
+            self.stats['failures'] += 1
+        else:
+            result.body, result.tier, result.is_html = html, 'browser', True
+        return result
+
+    async def _run_parser(self, result: FetchResult, fn, *args):
+        """Run a CPU-bound extraction in the process pool, timing it as the parse tier."""
+        started = time.perf_counter()
+        output = await asyncio.get_running_loop().run_in_executor(self._parser, fn, *args)
+        seconds = time.perf_counter() - started
+        result.timings['parse'] = seconds
+        self.stats['parse']['documents'] += 1
+        self.stats['parse']['seconds'] += seconds
+        return output
+
+    async def _extract(self, result: FetchResult) -> str:
+        if result.body is None or not result.is_html:
+            return result.body or ""
+        return await self._run_parser(result, parse_html, result.body)
+
+    async def scrape(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """Fetch URLs concurrently and extract their text, in order, with the tier, content type and timings of each."""
+        async def one(url: str) -> Dict[str, Any]:
+            result = await self.fetch(url)
+            content = await self._extract(result)
+            return {
+                'url': url,
+                'content': content,
+                'tier': result.tier,
+                'content_type': result.content_type,
+                'escalated': result.escalated,
+                'timings': result.timings
+            }
+        return list(await asyncio.gather(*(one(url) for url in urls)))
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+        if self._browser_started:
+            await self.browser.close()
+        if self._parser is not None:
+            self._parser.shutdown()
+
+
+class ScraperDaemon:
+    """Serve TieredFetcher scrapes over a local TCP socket.
+    
+    Protocol: one JSON object per line. A request is {"urls": [...]};
+    the response is {"results": [{"url": ..., "content": ..., "tier": ...,
+    "content_type": ..., "timings": {...}}, ...]} or {"error": ...}.
+    {"stats": true} returns the per-tier counters.
+    """
+
+    def __init__(self, fetcher: TieredFetcher, host: str = "127.0.0.1", port: int = 8765):
+        self.fetcher = fetcher
+        self.host = host
+        self.port = port
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if request.get('stats'):
+                        response = {'stats': self.fetcher.stats}
+                    else:
+                        urls = [url for url in request['urls'] if validate_url(url)]
+                        response = {'results': await self.fetcher.scrape(urls)}
+                except Exception as e:
+                    logger.error(f"Bad scrape request: {str(e)}")
+                    response = {'error': str(e)}
+                writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        async with self.fetcher:
+            server = await asyncio.start_server(self._handle, self.host, self.port, limit=16 * 1024 * 1024)
+            logger.info(f"Scraper daemon listening on {self.host}:{self.port}")
+            async with server:
+                await server.serve_forever()
+
+
+async def process_urls(urls: List[str], max_concurrent: int = 5, fast_path: bool = True,
+                       http_timeout: float = 10.0) -> List[Dict[str, Any]]:
+    """Process multiple URLs concurrently with a short-lived fetcher."""
+    browser = BrowserPool(max_contexts=min(len(urls), max_concurrent))
+    async with TieredFetcher(browser, fast_path=fast_path, http_timeout=http_timeout) as fetcher:
+        results = await fetcher.scrape(urls)
+        logger.info(f"Fetch tiers: {json.dumps(fetcher.stats)}")
+        return results
 
 def validate_url(url: str) -> bool:
     """Validate if the given string is a valid URL."""
@@ -164,17 +590,42 @@ def validate_url(url: str) -> bool:
 
 def main():
     parser = argparse.ArgumentParser(description='Fetch and extract text content from webpages.')
-    parser.add_argument('urls', nargs='+', help='URLs to process')
+    parser.add_argument('urls', nargs='*', help='URLs to process')
     parser.add_argument('--max-concurrent', type=int, default=5,
                        help='Maximum number of concurrent browser instances (default: 5)')
     parser.add_argument('--debug', action='store_true',
                        help='Enable debug logging')
+    parser.add_argument('--json', action='store_true',
+                       help='Print the results as a JSON list of {"url", "content", "tier", "timings"}')
+    parser.add_argument('--serve', action='store_true',
+                       help='Run as a daemon keeping a warm browser pool, serving fetches on a local socket')
+    parser.add_argument('--host', default='127.0.0.1',
+                       help='Daemon address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765,
+                       help='Daemon port (default: 8765)')
+    parser.add_argument('--max-uses', type=int, default=50,
+                       help='Fetches before a browser context is recycled (default: 50)')
+    parser.add_argument('--max-heap-mb', type=float, default=256,
+                       help='Page JS heap size in MB that recycles its context (default: 256)')
+    parser.add_argument('--no-fast-path', action='store_true',
+                       help='Render every URL in the browser instead of trying a plain HTTP GET first')
+    parser.add_argument('--http-timeout', type=float, default=10.0,
+                       help='Seconds allowed for the plain HTTP fetch (default: 10)')
     
     args = parser.parse_args()
     
     if args.debug:
         logger.setLevel(logging.DEBUG)
     
+    if args.serve:
+        pool = BrowserPool(max_contexts=args.max_concurrent, max_uses=args.max_uses, max_heap_mb=args.max_heap_mb)
+        fetcher = TieredFetcher(pool, fast_path=not args.no_fast_path, http_timeout=args.http_timeout)
+        try:
+            asyncio.run(ScraperDaemon(fetcher, args.host, args.port).serve_forever())
+        except KeyboardInterrupt:
+            logger.info("Scraper daemon stopped")
+        return
+    
     # Validate URLs
     valid_urls = []
     for url in args.urls:
@@ -189,12 +640,16 @@ def main():
     
     start_time = time.time()
     try:
-        results = asyncio.run(process_urls(valid_urls, args.max_concurrent))
+        results = asyncio.run(process_urls(valid_urls, args.max_concurrent, not args.no_fast_path, args.http_timeout))
+        
+        if args.json:
+            print(json.dumps(results, ensure_ascii=False))
+            return
         
         # Print results to stdout
-        for url, text in zip(valid_urls, results):
-            print(f"\n=== Content from {url} ===")
-            print(text)
+        for result in results:
+            print(f"\n=== Content from {result['url']} ({result['tier'] or 'failed'}) ===")
+            print(result['content'])
             print("=" * 80)
         
         logger.info(f"Total processing time: {time.time() - start_time:.2f}s")